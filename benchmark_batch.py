@@ -0,0 +1,74 @@
+# !/usr/bin/env python
+# coding: utf-8
+import time
+import numpy as np
+import tensorflow as tf
+from utils.iterator import end_token
+from utils.funcs import BatchCollator, flatten_batch, prepare_pair_batch
+
+tf.app.flags.DEFINE_integer('batch_size', 256, 'Batch size')
+tf.app.flags.DEFINE_integer('encoder_max_time_steps', 80, 'Maximum source length')
+tf.app.flags.DEFINE_integer('decoder_max_time_steps', 25, 'Maximum target length')
+tf.app.flags.DEFINE_integer('vocab_size', 34653, 'Vocab size')
+tf.app.flags.DEFINE_integer('steps', 200, 'Number of batches to prepare')
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def loop_prepare_pair_batch(seqs_x, seqs_y, x_max_length, y_max_length):
+    """
+    previous row by row implementation, kept as baseline
+    """
+    seqs_x = [s[:x_max_length] for s in seqs_x]
+    seqs_y = [s[:y_max_length] for s in seqs_y]
+    lengths_x = [len(s) for s in seqs_x]
+    lengths_y = [len(s) for s in seqs_y]
+    x = np.ones((len(seqs_x), x_max_length)).astype('int32') * end_token
+    y = np.ones((len(seqs_y), y_max_length)).astype('int32') * end_token
+    for idx, [s_x, s_y] in enumerate(zip(seqs_x, seqs_y)):
+        x[idx, :lengths_x[idx]] = s_x
+        y[idx, :lengths_y[idx]] = s_y
+    return x, np.array(lengths_x), y, np.array(lengths_y)
+
+
+def random_batch():
+    """
+    random batch shaped like lcsts
+    :return: sources, targets
+    """
+    sources = [list(np.random.randint(0, FLAGS.vocab_size, np.random.randint(20, 120)))
+               for _ in range(FLAGS.batch_size)]
+    targets = [list(np.random.randint(0, FLAGS.vocab_size, np.random.randint(8, 30)))
+               for _ in range(FLAGS.batch_size)]
+    return sources, targets
+
+
+def benchmark(name, prepare, batches):
+    start_time = time.time()
+    for sources, targets in batches:
+        prepare(sources, targets)
+    elapsed = time.time() - start_time
+    print('%-24s %.3f ms/batch' % (name, elapsed / len(batches) * 1000))
+    return elapsed
+
+
+def main(_):
+    batches = [random_batch() for _ in range(FLAGS.steps)]
+    flat_batches = [(flatten_batch(sources), flatten_batch(targets)) for sources, targets in batches]
+    
+    source_collator = BatchCollator(FLAGS.encoder_max_time_steps, num_buffers=2)
+    target_collator = BatchCollator(FLAGS.decoder_max_time_steps, num_buffers=2)
+    
+    def collate(sources, targets):
+        return source_collator.collate(*sources) + target_collator.collate(*targets)
+    
+    baseline = benchmark('loop', lambda x, y: loop_prepare_pair_batch(
+        x, y, FLAGS.encoder_max_time_steps, FLAGS.decoder_max_time_steps), batches)
+    vectorized = benchmark('prepare_pair_batch', lambda x, y: prepare_pair_batch(
+        x, y, FLAGS.encoder_max_time_steps, FLAGS.decoder_max_time_steps), batches)
+    collated = benchmark('collate (flat, reused)', collate, flat_batches)
+    print('Speedup prepare_pair_batch %.2fx, collate %.2fx' % (baseline / vectorized, baseline / collated))
+
+
+if __name__ == '__main__':
+    tf.app.run()
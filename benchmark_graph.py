@@ -0,0 +1,39 @@
+# !/usr/bin/env python
+# coding: utf-8
+import time
+import tensorflow as tf
+
+# defined before importing train, which parses flags on import
+tf.app.flags.DEFINE_string('modes', 'train,inference', 'Model modes to build, separated by comma')
+
+from train import FLAGS, logger
+from cls import get_model_class
+
+
+def build(model_class, config, mode):
+    """
+    build model in a new graph and measure it
+    :param model_class: model class
+    :param config: config dict
+    :param mode: train or inference
+    :return: build seconds, number of graph nodes, number of trainable parameters
+    """
+    with tf.Graph().as_default() as graph:
+        start_time = time.time()
+        model_class(config, mode, logger)
+        build_time = time.time() - start_time
+        nodes = len(graph.as_graph_def().node)
+        params = sum(variable.shape.num_elements() for variable in tf.trainable_variables())
+    return build_time, nodes, params
+
+
+def main(_):
+    config = FLAGS.flag_values_dict()
+    model_class = get_model_class(FLAGS.model_class)
+    for mode in FLAGS.modes.split(','):
+        build_time, nodes, params = build(model_class, config, mode)
+        print('%-10s %-10s %8.2f s %10d nodes %12d params' % (FLAGS.model_class, mode, build_time, nodes, params))
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -0,0 +1,89 @@
+# !/usr/bin/env python
+# coding: utf-8
+import time
+import tensorflow as tf
+
+# defined before importing train, which parses flags on import
+tf.app.flags.DEFINE_integer('steps', 200, 'Number of training steps of each pipeline')
+tf.app.flags.DEFINE_integer('warmup_steps', 10, 'Number of steps excluded from timing')
+
+from train import FLAGS, logger, build_batch_preparer, build_dataset, feed_steps, dataset_steps
+from utils.iterator import BiTextIterator
+from utils.binary import BinaryBiTextIterator
+from utils.prefetch import BatchPrefetcher
+from utils.dataset import DatasetInputs
+from cls import get_model_class
+
+
+def build_train_set():
+    """
+    build training iterator from flags
+    :return: iterator
+    """
+    if FLAGS.train_binary:
+        return BinaryBiTextIterator(prefix=FLAGS.train_binary,
+                                    batch_size=FLAGS.batch_size,
+                                    n_words_source=FLAGS.encoder_vocab_size,
+                                    n_words_target=FLAGS.decoder_vocab_size)
+    return BiTextIterator(source=FLAGS.source_train_data,
+                          target=FLAGS.target_train_data,
+                          source_dict=FLAGS.source_vocabulary,
+                          target_dict=FLAGS.target_vocabulary,
+                          batch_size=FLAGS.batch_size,
+                          n_words_source=FLAGS.encoder_vocab_size,
+                          n_words_target=FLAGS.decoder_vocab_size,
+                          split_sign=FLAGS.split_sign)
+
+
+def benchmark(name, make_steps):
+    """
+    run training steps across epochs and time them
+    :param name: pipeline name
+    :param make_steps: function returns steps generator of one epoch
+    :return: steps per second
+    """
+    done, start_time = 0, None
+    while done < FLAGS.steps:
+        for _ in make_steps():
+            done += 1
+            if done == FLAGS.warmup_steps:
+                start_time = time.time()
+            if done >= FLAGS.steps:
+                break
+    steps_per_sec = (FLAGS.steps - FLAGS.warmup_steps) / (time.time() - start_time)
+    print('%-10s %.2f steps/s' % (name, steps_per_sec))
+    return steps_per_sec
+
+
+def main(_):
+    assert FLAGS.steps > FLAGS.warmup_steps > 0
+    config = FLAGS.flag_values_dict()
+    model_class = get_model_class(FLAGS.model_class)
+    train_set = build_train_set()
+    
+    # feed_dict pipeline
+    with tf.Graph().as_default(), tf.Session() as sess:
+        model = model_class(config, 'train', logger)
+        sess.run(tf.global_variables_initializer())
+        prepare = build_batch_preparer(FLAGS.prefetch_batches + 2)
+        
+        def make_feed_steps():
+            train_set.reset()
+            batches = BatchPrefetcher(train_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs),
+                                      prepare, queue_size=FLAGS.prefetch_batches)
+            return feed_steps(sess, model.train, batches, 'Training')
+        
+        feed = benchmark('feed_dict', make_feed_steps)
+    
+    # tf.data pipeline
+    with tf.Graph().as_default(), tf.Session() as sess:
+        dataset_inputs = DatasetInputs({'train': build_dataset(train_set, FLAGS.train_tfrecord)})
+        model = model_class(config, 'train', logger, inputs=dataset_inputs.inputs)
+        sess.run(tf.global_variables_initializer())
+        dataset = benchmark('dataset', lambda: dataset_steps(sess, model, dataset_inputs, 'train'))
+    
+    print('Speedup dataset %.2fx' % (dataset / feed))
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -0,0 +1,101 @@
+# !/usr/bin/env python
+# coding: utf-8
+import sys
+import json
+import resource
+import subprocess
+import tensorflow as tf
+
+# defined before importing train, which parses flags on import
+tf.app.flags.DEFINE_boolean('precision_worker', False, 'Run one precision and print its result, set by main process')
+
+# defines steps and warmup_steps flags
+from benchmark_input import build_train_set, benchmark
+from train import FLAGS, logger, build_batch_preparer, feed_steps
+from utils.prefetch import BatchPrefetcher
+from cls import get_model_class
+
+# prefix of result line printed by worker
+RESULT_PREFIX = 'PRECISION_RESULT '
+# flags set by main process for each worker
+WORKER_FLAGS = ('--use_fp16', '--nouse_fp16', '--precision_worker', '--noprecision_worker')
+
+
+def run_precision():
+    """
+    train steps at precision of flags in this process, peak memory covers this precision only
+    :return: result dict
+    """
+    config = FLAGS.flag_values_dict()
+    model_class = get_model_class(FLAGS.model_class)
+    train_set = build_train_set()
+    prepare = build_batch_preparer(FLAGS.prefetch_batches + 2)
+    losses = []
+    
+    with tf.Graph().as_default(), tf.Session() as sess:
+        tf.set_random_seed(0)
+        model = model_class(config, 'train', logger)
+        # peak bytes allocated on gpu, None on cpu
+        max_bytes = tf.contrib.memory_stats.MaxBytesInUse() if tf.test.is_gpu_available() else None
+        sess.run(tf.global_variables_initializer())
+        
+        def make_steps():
+            train_set.reset()
+            batches = BatchPrefetcher(train_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs),
+                                      prepare, queue_size=FLAGS.prefetch_batches)
+            for (step_loss, _), source_len, target_len in feed_steps(sess, model.train, batches, 'Training'):
+                losses.append(float(step_loss))
+                yield step_loss, source_len, target_len
+        
+        name = 'float16' if FLAGS.use_fp16 else 'float32'
+        steps_per_sec = benchmark(name, make_steps)
+        gpu_memory = sess.run(max_bytes) / 1024 ** 2 if max_bytes is not None else None
+    
+    last_losses = losses[-FLAGS.warmup_steps:]
+    return {
+        'name': name,
+        'steps_per_sec': steps_per_sec,
+        'step_ms': 1000 / steps_per_sec,
+        # ru_maxrss is in kilobytes on linux
+        'host_memory': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'gpu_memory': gpu_memory,
+        'last_loss': sum(last_losses) / len(last_losses),
+    }
+
+
+def run_worker(use_fp16):
+    """
+    run one precision in subprocess, so peak memory of one does not hide the other
+    :param use_fp16: run float16
+    :return: result dict
+    """
+    argv = [arg for arg in sys.argv[1:] if arg.split('=')[0] not in WORKER_FLAGS]
+    argv += ['--use_fp16=%s' % str(use_fp16).lower(), '--precision_worker']
+    output = subprocess.check_output([sys.executable, sys.argv[0]] + argv, universal_newlines=True)
+    for line in output.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError('No result from %s worker' % ('float16' if use_fp16 else 'float32'))
+
+
+def main(_):
+    assert FLAGS.steps > FLAGS.warmup_steps > 0
+    if FLAGS.precision_worker:
+        print(RESULT_PREFIX + json.dumps(run_precision()))
+        return
+    
+    results = [run_worker(False), run_worker(True)]
+    print('%-10s %10s %10s %12s %12s %10s' % ('precision', 'steps/s', 'step ms', 'host MB', 'gpu MB', 'last loss'))
+    for result in results:
+        gpu_memory = '%12.1f' % result['gpu_memory'] if result['gpu_memory'] is not None else '%12s' % '-'
+        print('%-10s %10.2f %10.2f %12.1f %s %10.4f' % (result['name'], result['steps_per_sec'], result['step_ms'],
+                                                        result['host_memory'], gpu_memory, result['last_loss']))
+    fp32, fp16 = results
+    print('float16 speedup %.2fx, host memory %.2fx' % (fp16['steps_per_sec'] / fp32['steps_per_sec'],
+                                                        fp16['host_memory'] / fp32['host_memory']))
+    if fp32['gpu_memory'] and fp16['gpu_memory']:
+        print('float16 gpu memory %.2fx' % (fp16['gpu_memory'] / fp32['gpu_memory']))
+
+
+if __name__ == '__main__':
+    tf.app.run()
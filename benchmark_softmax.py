@@ -0,0 +1,83 @@
+# !/usr/bin/env python
+# coding: utf-8
+import math
+import tensorflow as tf
+
+# defined before importing train, which parses flags on import
+tf.app.flags.DEFINE_string('num_sampled_list', '0,1024', 'Sampled softmax sizes to compare separated by comma, 0 for full')
+
+from benchmark_input import FLAGS, build_train_set, benchmark
+from train import logger, build_batch_preparer, feed_steps
+from utils.iterator import BiTextIterator
+from utils.prefetch import BatchPrefetcher
+from cls import get_model_class
+
+
+def build_valid_set():
+    """
+    build validation iterator from flags, train data is used if no valid data given
+    :return: iterator
+    """
+    if not (FLAGS.source_valid_data and FLAGS.target_valid_data):
+        return build_train_set()
+    return BiTextIterator(source=FLAGS.source_valid_data,
+                          target=FLAGS.target_valid_data,
+                          source_dict=FLAGS.source_vocabulary,
+                          target_dict=FLAGS.target_vocabulary,
+                          batch_size=FLAGS.batch_size,
+                          n_words_source=FLAGS.encoder_vocab_size,
+                          n_words_target=FLAGS.decoder_vocab_size,
+                          split_sign=FLAGS.split_sign)
+
+
+def perplexity(sess, model, valid_set, prepare):
+    """
+    perplexity of full softmax loss over validation set
+    :param sess: session object
+    :param model: model object
+    :param valid_set: validation iterator
+    :param prepare: batch prepare function
+    :return: perplexity
+    """
+    valid_set.reset()
+    batches = BatchPrefetcher(valid_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs),
+                              prepare, queue_size=FLAGS.prefetch_batches)
+    valid_loss, valid_sents_seen = 0.0, 0
+    for step_loss, source_len, _ in feed_steps(sess, model.eval, batches, 'Validating'):
+        valid_loss += step_loss * len(source_len)
+        valid_sents_seen += len(source_len)
+    return math.exp(valid_loss / valid_sents_seen)
+
+
+def main(_):
+    assert FLAGS.steps > FLAGS.warmup_steps > 0
+    model_class = get_model_class(FLAGS.model_class)
+    train_set = build_train_set()
+    valid_set = build_valid_set()
+    prepare = build_batch_preparer(FLAGS.prefetch_batches + 2)
+    
+    results = []
+    for num_sampled in map(int, FLAGS.num_sampled_list.split(',')):
+        config = FLAGS.flag_values_dict()
+        config['num_sampled'] = num_sampled
+        with tf.Graph().as_default(), tf.Session() as sess:
+            tf.set_random_seed(0)
+            model = model_class(config, 'train', logger)
+            sess.run(tf.global_variables_initializer())
+            
+            def make_steps():
+                train_set.reset()
+                batches = BatchPrefetcher(train_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs),
+                                          prepare, queue_size=FLAGS.prefetch_batches)
+                return feed_steps(sess, model.train, batches, 'Training')
+            
+            name = 'sampled %d' % num_sampled if num_sampled else 'full'
+            steps_per_sec = benchmark(name, make_steps)
+            results.append((name, steps_per_sec, perplexity(sess, model, valid_set, prepare)))
+    
+    for name, steps_per_sec, valid_perplexity in results:
+        print('%-15s %8.2f steps/s %10.2f valid perplexity' % (name, steps_per_sec, valid_perplexity))
+
+
+if __name__ == '__main__':
+    tf.app.run()
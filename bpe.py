@@ -1,48 +1,49 @@
-import re
-import sys
-import collections
+# !/usr/bin/env python
+# coding: utf-8
+from itertools import chain
+from multiprocessing import cpu_count
+import tensorflow as tf
+from preprocess.bpe import BPE, learn_bpe, save_merges, load_merges
+from preprocess.vocab import VocabTransformer
+from preprocess.reader import read_lines
+from utils.shards import open_data, ShardedWriter
 
+tf.app.flags.DEFINE_string('mode', 'learn', 'learn merges from input, encode or decode input to output')
+tf.app.flags.DEFINE_string('input', 'dataset/lcsts/word/sources.train.txt,dataset/lcsts/word/summaries.train.txt',
+                           'Input files joined with comma, only the first one is used to encode or decode')
+tf.app.flags.DEFINE_string('output', 'dataset/lcsts/bpe/sources.train.txt', 'Output file of encode or decode')
+tf.app.flags.DEFINE_string('merges', 'dataset/lcsts/bpe/merges.txt', 'Path to merges table')
+tf.app.flags.DEFINE_integer('num_merges', 30000, 'Max number of merges')
+tf.app.flags.DEFINE_integer('min_frequency', 2, 'Stop merging when most frequent pair is counted less')
+tf.app.flags.DEFINE_integer('processes', 0, 'Number of worker processes, 0 for cpu count')
+tf.app.flags.DEFINE_integer('shard_lines', 0, 'Max lines of each output shard, 0 to write one file')
 
-def get_stats(vocab):
-    pairs = collections.defaultdict(int)
-    for word, freq in vocab.items():
-        symbols = word.split()
-        for i in range(len(symbols) - 1):
-            pairs[symbols[i], symbols[i + 1]] += freq
-    return pairs
+FLAGS = tf.app.flags.FLAGS
 
 
-def merge_vocab(pair, v_in):
-    v_out = {}
-    bigram_pattern = re.escape(' '.join(pair))
-    p = re.compile(r'(?<!\S)' + bigram_pattern + r'(?!\S)')
-    for word in v_in:
-        w_out = p.sub(''.join(pair), word)
-        v_out[w_out] = v_in[word]
-    return v_out
+def main(_):
+    processes = FLAGS.processes or cpu_count()
+    inputs = FLAGS.input.split(',')
+    
+    if FLAGS.mode == 'learn':
+        # words are counted in worker processes, merges are learned on word counts
+        counter = VocabTransformer(processes=processes).count_words(chain(*[read_lines(f) for f in inputs]))
+        print('Words', len(counter))
+        merges = learn_bpe(counter, FLAGS.num_merges, FLAGS.min_frequency, verbose=True)
+        save_merges(merges, FLAGS.merges)
+        return
+    
+    # decoding only needs separator
+    bpe = BPE(load_merges(FLAGS.merges) if FLAGS.mode == 'encode' else [])
+    with open_data(inputs[0]) as lines, ShardedWriter(FLAGS.output, shard_lines=FLAGS.shard_lines) as writer:
+        if FLAGS.mode == 'encode':
+            writer.write_lines(bpe.encode_lines(lines, processes=processes))
+        elif FLAGS.mode == 'decode':
+            writer.write_lines(bpe.decode_line(line.strip()) for line in lines)
+        else:
+            raise ValueError('Unknown mode %s' % FLAGS.mode)
+    print('Write %d lines to %s' % (writer.count, FLAGS.output))
 
 
-vocab = {
-    '苹 果': 5,
-    '苹 果 肌': 2,
-    '人 民': 6,
-    '人 民 银 行': 3,
-    '中 国 银 行': 5,
-    '阿 里 巴 巴': 1,
-    '哈 利 波 特': 1,
-}
-num_merges = 4
-for i in range(num_merges):
-    pairs = get_stats(vocab)
-    print('pairs', pairs)
-    try:
-        best = max(pairs, key=pairs.get)
-    except ValueError:
-        break
-    if pairs[best] < 2:
-        sys.stderr.write('no pair has frequency > 1. Stopping\n')
-        break
-    vocab = merge_vocab(best, vocab)
-    print(best)
-
-print(vocab)
+if __name__ == '__main__':
+    tf.app.run()
@@ -0,0 +1,45 @@
+# !/usr/bin/env python
+# coding: utf-8
+import tensorflow as tf
+from utils.binary import compile_dataset, BinaryBiTextIterator
+from utils.dataset import write_tfrecords
+
+tf.app.flags.DEFINE_string('source_vocabulary', 'dataset/lcsts/split/vocabs.json', 'Path to source vocabulary')
+tf.app.flags.DEFINE_string('target_vocabulary', 'dataset/lcsts/split/vocabs.json', 'Path to target vocabulary')
+tf.app.flags.DEFINE_string('source_data', 'dataset/lcsts/split/sources.train.txt', 'Path to source data')
+tf.app.flags.DEFINE_string('target_data', 'dataset/lcsts/split/summaries.train.txt', 'Path to target data')
+tf.app.flags.DEFINE_string('output_prefix', 'dataset/lcsts/split/train', 'Prefix of compiled binary dataset')
+tf.app.flags.DEFINE_string('split_sign', ' ', 'Separator of dataset')
+tf.app.flags.DEFINE_integer('encoder_vocab_size', -1, 'Source vocabulary size used by extended ids')
+tf.app.flags.DEFINE_integer('decoder_vocab_size', -1, 'Target vocabulary size used by extended ids')
+tf.app.flags.DEFINE_boolean('extend_vocabs', False, 'Whether to cache extended ids of oov vocabs')
+tf.app.flags.DEFINE_boolean('split_vocabs', False, 'Whether to split oov vocabs')
+tf.app.flags.DEFINE_integer('tfrecord_shards', 0, 'Also write this number of tfrecord shards, 0 to disable')
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def main(_):
+    meta = compile_dataset(source=FLAGS.source_data,
+                           target=FLAGS.target_data,
+                           source_dict=FLAGS.source_vocabulary,
+                           target_dict=FLAGS.target_vocabulary,
+                           output_prefix=FLAGS.output_prefix,
+                           n_words_source=FLAGS.encoder_vocab_size,
+                           n_words_target=FLAGS.decoder_vocab_size,
+                           extend=FLAGS.extend_vocabs,
+                           split=FLAGS.split_vocabs,
+                           split_sign=FLAGS.split_sign)
+    print('Compiled', FLAGS.output_prefix, meta)
+    
+    if FLAGS.tfrecord_shards > 0:
+        data_set = BinaryBiTextIterator(prefix=FLAGS.output_prefix,
+                                        n_words_source=FLAGS.encoder_vocab_size,
+                                        n_words_target=FLAGS.decoder_vocab_size)
+        paths = write_tfrecords(data_set, FLAGS.output_prefix, num_shards=FLAGS.tfrecord_shards,
+                                extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs)
+        print('Written', paths)
+
+
+if __name__ == '__main__':
+    tf.app.run()
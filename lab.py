@@ -3,9 +3,9 @@
 import os
 import logging
 
-from preprocess.config import UNK
 from utils.iterator import UniTextIterator, end_token
-from utils.funcs import prepare_batch, load_inverse_dict, inverse_dict
+from utils.vocab import Vocabulary
+from utils.funcs import prepare_batch, inverse_dict, seq2words
 import json
 import tensorflow as tf
 from cls import get_model_class
@@ -60,24 +60,6 @@ def load_model(session, config):
     return model
 
 
-def seq2words(seq, inverse_target_dictionary, oovs_vocab=None):
-    words = []
-    if oovs_vocab:
-        inverse_target_dictionary.update(oovs_vocab)
-    for w in seq:
-        if w == end_token:
-            break
-        if w in inverse_target_dictionary:
-            result = inverse_target_dictionary[w]
-            if result == '<UNK>':
-                words.append(result)
-            else:
-                words.append(result)
-        else:
-            words.append(UNK)
-    return ' '.join(words)
-
-
 
 
 
@@ -96,8 +78,8 @@ def decode():
     
     test_set.reset()
     
-    # Load inverse dictionary used in decoding
-    target_inverse_dict = load_inverse_dict(config['target_vocabulary'])
+    # Load target vocabulary used in decoding
+    target_vocab = Vocabulary.load(config['target_vocabulary'])
     
     # Initiate TF session
     with tf.Session(config=tf.ConfigProto(allow_soft_placement=FLAGS.allow_soft_placement,
@@ -124,13 +106,14 @@ def decode():
                                                                                            encoder_inputs=source,
                                                                                            encoder_inputs_extend=source_extend,
                                                                                            encoder_inputs_length=source_len,
-                                                                                           oovs_max_size=oovs_max_size)
+                                                                                           oovs_max_size=oovs_max_size,
+                                                                                           max_inference_steps=FLAGS.max_inference_step)
                 print('Shape', predicts.shape, scores.shape, probabilities.shape, p_gens.shape)
                 for predict_seq, score_seq, prob_seq, p_gen_seq, oovs_vocab, attn in zip(predicts, scores, probabilities,
                                                                                    p_gens, oovs_vocabs, attns):
                     print('Score', score_seq, 'predict_seq', predict_seq, 'p_gen_seq', p_gen_seq,)
                     print('Attns', attns)
-                    result = seq2words(predict_seq, inverse_target_dictionary=target_inverse_dict,
+                    result = seq2words(predict_seq, target_vocab=target_vocab,
                                        oovs_vocab=inverse_dict(oovs_vocab))
                     logger.info('result %s', result)
                     print(result)
@@ -149,7 +132,7 @@ def decode():
                                                    )
                 
                 for predict_seq, score_seq in zip(predicts, scores):
-                    result = seq2words(predict_seq, inverse_target_dictionary=target_inverse_dict)
+                    result = seq2words(predict_seq, target_vocab=target_vocab)
                     logger.info('result %s', result)
                     fout.write(result + '\n')
                 logger.info('%s lines processed', line_number)
@@ -1,23 +1,36 @@
 import tensorflow as tf
 import math
 from utils.config import GO, EOS, UNK
+from utils.dataset import input_placeholder
+from utils.attention import attention_keys, attention_mask, additive_attention
+from utils.decoder import input_array, dynamic_decode
+from utils.losses import vocab_log_probs, sampled_vocab_log_probs, pointer_log_probs, sequence_mean
+from utils.projection import output_projection, sampled_projection
+from utils.precision import float32_variable_getter, loss_scale_optimizer
 
 
 class PointerGeneratorCoverageModel():
-    def __init__(self, config, mode, logger):
+    # coverage_dense runs over encoder time axis, inputs are padded to encoder max time steps
+    pad_to_longest = False
+    
+    def __init__(self, config, mode, logger, inputs=None):
         """
         init model
         :param config: config dict
         :param mode: train or inference
         :param logger: logger object
+        :param inputs: input tensors by placeholder name, eg: from utils.dataset, None to feed
         """
         assert mode.lower() in ['train', 'inference']
         self.mode = mode.lower()
         self.logger = logger
+        self.inputs = inputs
         self.init_config(config)
-        self.build_placeholders()
-        self.build_encoder()
-        self.build_decoder()
+        # float16 variables are stored in float32, names are unchanged
+        with tf.variable_scope(tf.get_variable_scope(), custom_getter=float32_variable_getter):
+            self.build_placeholders()
+            self.build_encoder()
+            self.build_decoder()
         self.build_optimizer()
     
     def init_config(self, config):
@@ -44,6 +57,10 @@ class PointerGeneratorCoverageModel():
         self.use_bidirectional = config['use_bidirectional']
         self.use_dropout = config['use_dropout']
         self.attention_units = config['attention_units']
+        self.mask_attention = config.get('mask_attention', False)
+        self.num_sampled = config.get('num_sampled', 0)
+        self.share_embeddings = config.get('share_embeddings', False)
+        self.tie_output_projection = config.get('tie_output_projection', False)
         self.coverage_loss_weight = config['coverage_loss_weight']
         self.global_step = tf.Variable(0, trainable=False, name='global_step')
         self.global_epoch_step = tf.Variable(0, trainable=False, name='global_epoch_step')
@@ -56,22 +73,22 @@ class PointerGeneratorCoverageModel():
         """
         self.keep_prob = tf.placeholder(self.dtype, shape=[], name='keep_prob')
         
-        self.oovs_max_size = tf.placeholder(tf.int32, shape=[], name='oovs_max_size')
+        self.oovs_max_size = input_placeholder(self.inputs, tf.int32, shape=[], name='oovs_max_size')
         
         # encoder_inputs: [batch_size, encoder_time_steps]
-        self.encoder_inputs = tf.placeholder(dtype=tf.int32, shape=[None, self.encoder_max_time_steps],
-                                             name='encoder_inputs')
+        self.encoder_inputs = input_placeholder(self.inputs, dtype=tf.int32, shape=[None, self.encoder_max_time_steps],
+                                                name='encoder_inputs')
         self.logger.debug('encoder_inputs %s', self.encoder_inputs)
         
         # encoder_inputs_length: [batch_size]
-        self.encoder_inputs_length = tf.placeholder(dtype=tf.int32, shape=[None],
-                                                    name='encoder_inputs_length')
+        self.encoder_inputs_length = input_placeholder(self.inputs, dtype=tf.int32, shape=[None],
+                                                       name='encoder_inputs_length')
         self.logger.debug('encoder_inputs_length %s', self.encoder_inputs_length)
         
         # encoder_inputs_extend: [batch_size, encoder_time_steps]
-        self.encoder_inputs_extend = tf.placeholder(dtype=tf.int32,
-                                                    shape=[None, self.encoder_max_time_steps],
-                                                    name='encoder_inputs_extend')
+        self.encoder_inputs_extend = input_placeholder(self.inputs, dtype=tf.int32,
+                                                       shape=[None, self.encoder_max_time_steps],
+                                                       name='encoder_inputs_extend')
         self.logger.debug('encoder_inputs_extend %s', self.encoder_inputs_extend)
         
         # batch_size
@@ -80,19 +97,20 @@ class PointerGeneratorCoverageModel():
         
         if self.mode == 'train':
             # decoder_inputs: [batch_size, decoder_time_steps]
-            self.decoder_inputs = tf.placeholder(dtype=tf.int32, shape=[None, self.decoder_max_time_steps],
-                                                 name='decoder_inputs')
+            self.decoder_inputs = input_placeholder(self.inputs, dtype=tf.int32,
+                                                    shape=[None, None],
+                                                    name='decoder_inputs')
             self.logger.debug('decoder_inputs %s', self.decoder_inputs)
             
             # decoder_inputs_extend: [batch_size, decoder_time_steps]
-            self.decoder_inputs_extend = tf.placeholder(dtype=tf.int32,
-                                                        shape=[None, self.decoder_max_time_steps],
-                                                        name='decoder_inputs_extend')
+            self.decoder_inputs_extend = input_placeholder(self.inputs, dtype=tf.int32,
+                                                           shape=[None, None],
+                                                           name='decoder_inputs_extend')
             self.logger.debug('decoder_inputs_extend %s', self.decoder_inputs_extend)
             
             # decoder_inputs_length: [batch_size]
-            self.decoder_inputs_length = tf.placeholder(dtype=tf.int32, shape=[None],
-                                                        name='decoder_inputs_length')
+            self.decoder_inputs_length = input_placeholder(self.inputs, dtype=tf.int32, shape=[None],
+                                                           name='decoder_inputs_length')
             self.logger.debug('decoder_inputs_length %s', self.decoder_inputs_length)
             
             # decoder_start_token: [batch_size, 1]
@@ -129,27 +147,32 @@ class PointerGeneratorCoverageModel():
             self.decoder_inputs_inference_length = tf.ones(shape=[self.batch_size], dtype=tf.int32,
                                                            name='decoder_inputs_inference_length')
             self.logger.debug('decoder_inputs_inference_length %s', self.decoder_inputs_inference_length)
+            
+            # max_inference_steps: [], runtime limit of decoding steps
+            self.max_inference_steps = tf.placeholder_with_default(self.decoder_max_time_steps, shape=[],
+                                                                   name='max_inference_steps')
+            self.logger.debug('max_inference_steps %s', self.max_inference_steps)
         
         with tf.variable_scope('attention'):
             
             # attention_u: [hidden_units, attention_units]
             self.attention_u = tf.get_variable(name='u', shape=[self.hidden_units, self.attention_units],
-                                               initializer=tf.truncated_normal_initializer)
+                                               dtype=self.dtype, initializer=tf.truncated_normal_initializer)
             self.logger.debug('attention_u %s', self.attention_u)
             
             # attention_w: [hidden_units, attention_units]
             self.attention_w = tf.get_variable(name='w', shape=[self.hidden_units, self.attention_units],
-                                               initializer=tf.truncated_normal_initializer)
+                                               dtype=self.dtype, initializer=tf.truncated_normal_initializer)
             self.logger.debug('attention_w %s', self.attention_w)
             
             # attention_c: [hidden_units, attention_units]
             self.attention_c = tf.get_variable(name='c', shape=[self.hidden_units, self.attention_units],
-                                               initializer=tf.truncated_normal_initializer)
+                                               dtype=self.dtype, initializer=tf.truncated_normal_initializer)
             self.logger.debug('attention_c %s', self.attention_c)
             
             # attention_v: [attention_units, 1]
             self.attention_v = tf.get_variable(name='v', shape=[self.attention_units, 1],
-                                               initializer=tf.truncated_normal_initializer)
+                                               dtype=self.dtype, initializer=tf.truncated_normal_initializer)
             self.logger.debug('attention_v %s', self.attention_v)
     
     def build_single_cell(self):
@@ -286,52 +309,19 @@ class PointerGeneratorCoverageModel():
         :param encoder_outputs: encoder outputs
         :return: attention result
         """
-        e_i = []
-        c_i = []
-        # encoder_outputs: encoder_time_steps * [batch_size, hidden_units]
-        # output: [batch_size, hidden_units]
-        for output in encoder_outputs:
-            # e_i_j: [batch_size, 1]
-            e_i_j = tf.matmul(
-                # tanh: [batch_size, attention_units]
-                tf.tanh(
-                    # prev_state: [batch_size, hidden_units]
-                    # attention_w: [hidden_units, attention_units]
-                    tf.matmul(prev_state, self.attention_w) +
-                    # output: [batch_size, hidden_units]
-                    # attention_u: [hidden_units, attention_units]
-                    tf.matmul(output, self.attention_u) +
-                    # coverage: [batch_size, hidden_units]
-                    # attention_c: [hidden_units, attention_units]
-                    tf.matmul(coverage, self.attention_c)
-                ),
-                # attention_v: [attention_units, 1]
-                self.attention_v)
-            # e_i: encoder_time_steps * [batch_size, 1]
-            e_i.append(e_i_j)
+        # coverage: [batch_size, hidden_units]
+        # attention_c: [hidden_units, attention_units]
+        features = tf.matmul(coverage, self.attention_c)
+        # c_i: [batch_size, hidden_units]
+        # alpha_i: [batch_size, encoder_time_steps]
         # e_i: [batch_size, encoder_time_steps]
-        e_i = tf.concat(e_i, axis=1)
+        c_i, alpha_i, e_i = additive_attention(prev_state, encoder_outputs, self.encoder_keys,
+                                               self.attention_w, self.attention_v, mask=self.encoder_masks,
+                                               features=features)
         
         # coverage
         coverage += tf.layers.dense(e_i, self.hidden_units, use_bias=False, name='coverage_dense')
         
-        # alpha_i: [batch_size, encoder_time_steps]
-        alpha_i = tf.nn.softmax(e_i, axis=-1)
-        # alpha_i_split: encoder_time_steps * [batch_size, 1]
-        alpha_i_split = tf.split(alpha_i, alpha_i.shape[-1], axis=-1)
-        # alpha_i_split: encoder_time_steps * [batch_size, 1]
-        # encoder_outputs: encoder_time_steps * [batch_size, hidden_units]
-        for alpha_i_j, output in zip(alpha_i_split, encoder_outputs):
-            # alpha_i_j: [batch_size, 1]
-            # output: [batch_size, hidden_units]
-            # c_i_j: [batch_size, hidden_units]
-            c_i_j = tf.multiply(alpha_i_j, output)
-            # c_i: encoder_time_steps * [batch_size, hidden_units]
-            c_i.append(c_i_j)
-        # c_i: [batch_size, hidden_units]
-        c_i = tf.reduce_sum(c_i, axis=0)
-        # c_i: [batch_size, hidden_units]
-        # alpha_i: [batch_size, encoder_time_steps]
         return c_i, alpha_i, coverage
     
     def build_decoder(self):
@@ -347,17 +337,31 @@ class PointerGeneratorCoverageModel():
             self.decoder_cell = self.build_decoder_cell()
             self.logger.debug('decoder_cell %s', self.decoder_cell)
             with tf.device('/cpu:0'):
-                # decoder_embeddings: [decoder_vocab_size, embedding_size]
-                self.decoder_embeddings = tf.get_variable(name='embedding',
-                                                          shape=[self.decoder_vocab_size, self.embedding_size],
-                                                          dtype=self.dtype,
-                                                          initializer=tf.random_uniform_initializer(-math.sqrt(3),
-                                                                                                    math.sqrt(3),
-                                                                                                    dtype=self.dtype))
+                # decoder_embeddings: [decoder_vocab_size, embedding_size], shared with encoder if same vocab
+                if self.share_embeddings:
+                    assert self.encoder_vocab_size == self.decoder_vocab_size, 'Shared embeddings need same vocab size'
+                    self.decoder_embeddings = self.encoder_embeddings
+                else:
+                    self.decoder_embeddings = tf.get_variable(name='embedding',
+                                                              shape=[self.decoder_vocab_size, self.embedding_size],
+                                                              dtype=self.dtype,
+                                                              initializer=tf.random_uniform_initializer(
+                                                                  -math.sqrt(3), math.sqrt(3), dtype=self.dtype))
             self.logger.debug('decoder_embeddings %s', self.decoder_embeddings)
             
-            # encoder_outputs_unstack: encoder_time_steps * [batch_size, hidden_units]
-            self.encoder_outputs_unstack = tf.unstack(self.encoder_outputs, axis=1)
+            # encoder_keys: [batch_size, encoder_time_steps, attention_units]
+            self.encoder_keys = attention_keys(self.encoder_outputs, self.attention_u)
+            self.logger.debug('encoder_keys %s', self.encoder_keys)
+            
+            # encoder_masks: [batch_size, encoder_time_steps]
+            self.encoder_masks = attention_mask(self.encoder_inputs_length,
+                                                tf.shape(self.encoder_inputs)[1]) if self.mask_attention else None
+            self.logger.debug('encoder_masks %s', self.encoder_masks)
+            
+            # outputs_dense: decoder outputs to vocab logits, built in loop scope on first call,
+            # tied to decoder embeddings through adapter if tie_output_projection
+            self.outputs_dense = output_projection(self.decoder_vocab_size, 'outputs_dense',
+                                                   self.decoder_embeddings if self.tie_output_projection else None)
             
             # state: encoder_depth * [batch_size, hidden_units]
             state = self.decoder_initial_state
@@ -368,241 +372,159 @@ class PointerGeneratorCoverageModel():
                                                                       ids=self.decoder_inputs_train)
                 self.logger.debug('decoder_inputs_embedded %s', self.decoder_inputs_embedded)
                 
-                # decoder_inputs_embedded_unstack: decoder_time_steps * [batch_size, embedding_size]
-                self.decoder_inputs_embedded_unstack = tf.unstack(self.decoder_inputs_embedded, axis=1)
-                self.logger.debug('decoder_inputs_embedded_unstack %s sample %s',
-                                  len(self.decoder_inputs_embedded_unstack),
-                                  self.decoder_inputs_embedded_unstack[0])
+                # decoder_train_steps: [], steps of longest target in batch
+                self.decoder_train_steps = tf.reduce_max(self.decoder_inputs_train_length)
+                self.logger.debug('decoder_train_steps %s', self.decoder_train_steps)
                 
-                self.logger.debug('encoder_outputs_unstack length %s sample %s',
-                                  len(self.encoder_outputs_unstack), self.encoder_outputs_unstack[0])
+                # inputs_array: decoder_time_steps * [batch_size, embedding_size]
+                inputs_array = input_array(self.decoder_inputs_embedded)
                 
-                decoder_logits = []
-                attention_distributions = []
-                with tf.variable_scope('loop', reuse=tf.AUTO_REUSE):
-                    coverage = tf.zeros(shape=[self.batch_size, self.hidden_units])
-                    for i, inputs in enumerate(self.decoder_inputs_embedded_unstack):
-                        # c_i: [batch_size, hidden_units]
-                        # state: [batch_size, hidden_units]
-                        # inputs: [batch_size, embedding_size]
-                        c_i, alpha_i, coverage = self.attention(state[-1], encoder_outputs=self.encoder_outputs_unstack,
-                                                                coverage=coverage)
-                        
-                        # p_gen_dense: [batch_size, 1]
-                        p_gen_dense = tf.layers.dense(tf.concat([c_i, state[-1], inputs], axis=-1),
-                                                      units=1,
-                                                      name='p_gen_dense')
-                        self.logger.debug('p_gen_dense %s', p_gen_dense)
-                        # p_gen: [batch_size, 1]
-                        p_gen = tf.nn.sigmoid(p_gen_dense, name='p_gen_sigmoid')
-                        self.logger.debug('p_gen %s', p_gen)
-                        
-                        inputs = tf.concat([inputs, c_i], axis=1)
-                        outputs, state = self.decoder_cell(inputs=inputs, state=state)
-                        
-                        # outputs_logits: [batch_size, decoder_vocab_size]
-                        outputs_logits = tf.layers.dense(inputs=outputs,
-                                                         units=self.decoder_vocab_size,
-                                                         name='outputs_dense')
-                        self.logger.debug('outputs_logits %s', outputs_logits)
-                        
-                        # vocab_distribution: [batch_size, decoder_vocab_size]
-                        vocab_distribution = tf.nn.softmax(outputs_logits, axis=-1)
-                        
-                        # attention_distribution: [batch_size, encoder_inputs_length]
-                        attention_distribution = alpha_i
-                        
-                        # final_distribution: [batch_size, decoder_vocab_size + oovs_max_size]
-                        final_distribution = self.merge_distribution(p_gen, attention_distribution, vocab_distribution,
-                                                                     self.oovs_max_size)
-                        
-                        decoder_logits.append(final_distribution)
-                        attention_distributions.append(attention_distribution)
+                def step(time, loop_state):
+                    state, coverage = loop_state
+                    outputs, p_gen_dense, alpha_i, state, coverage = self.decode_step(
+                        inputs_array.read(time), state, coverage)
+                    return (outputs, p_gen_dense, alpha_i), (state, coverage), None
                 
-                # decoder_outputs: [batch_size, decoder_time_steps, hidden_units]
-                self.decoder_logits = tf.stack(decoder_logits, axis=1)
+                # coverage: [batch_size, hidden_units]
+                coverage = tf.zeros(shape=[self.batch_size, self.hidden_units], dtype=self.dtype)
+                
+                with tf.variable_scope('loop', reuse=tf.AUTO_REUSE):
+                    # decoder_outputs: [batch_size, decoder_train_steps, hidden_units]
+                    # p_gen_logits: [batch_size, decoder_train_steps, 1]
+                    # attention_distributions: [batch_size, decoder_train_steps, encoder_time_steps]
+                    (self.decoder_outputs, p_gen_logits, attention_distributions), (state, _) = dynamic_decode(
+                        step, (state, coverage), self.decoder_train_steps, [self.dtype, self.dtype, self.dtype])
+                    
+                    # decoder_logits: [batch_size, decoder_train_steps, decoder_vocab_size]
+                    self.decoder_logits = self.outputs_dense(self.decoder_outputs)
+                self.logger.debug('decoder_outputs %s', self.decoder_outputs)
                 self.logger.debug('decoder_logits %s', self.decoder_logits)
                 
                 # decoder_depth * [batch_size, hidden_units]
                 self.decoder_last_state = state
                 self.logger.debug('decoder_last_state %s', self.decoder_last_state)
                 
-                # decoder_masks: [batch_size, reduce_max(decoder_inputs_length)]
+                # decoder_masks: [batch_size, decoder_train_steps]
                 self.decoder_masks = tf.sequence_mask(lengths=self.decoder_inputs_train_length,
-                                                      maxlen=self.decoder_max_time_steps + 1,
+                                                      maxlen=self.decoder_train_steps,
                                                       dtype=self.dtype,
                                                       name='masks')
                 self.logger.debug('decoder_masks %s', self.decoder_masks)
                 
-                # # loss
-                # self.loss = tf.contrib.seq2seq.sequence_loss(logits=self.decoder_logits,
-                #                                              targets=self.decoder_targets_train,
-                #                                              weights=self.decoder_masks)
-                # self.logger.debug('loss %s', self.loss)
-                #
-                #
-                # self.predicts = tf.argmax(self.config)
-                
-                losses_group = []
-                
-                for decoder_step in range(self.decoder_max_time_steps + 1):
-                    # step_final_distribution: [batch_size, decoder_vocab_size + oovs_max_size]
-                    step_final_distribution = decoder_logits[decoder_step]
-                    # targets: [batch_size]
-                    targets = self.decoder_targets_train[:, decoder_step]
-                    # indices: [batch_size, 2]
-                    indices = tf.stack((tf.range(0, self.batch_size), targets), axis=1)
-                    self.logger.debug('indices %s', indices)
-                    # step_final_probabilities: [batch_size]
-                    step_final_probabilities = tf.gather_nd(step_final_distribution, indices)
-                    # step_losses: [batch_size]
-                    step_losses = -tf.log(step_final_probabilities)
-                    self.logger.debug('step_losses %s', step_losses)
-                    # losses_group: (decoder_max_time_steps + 1) * [batch_size]
-                    losses_group.append(step_losses)
+                # decoder_targets: [batch_size, decoder_train_steps]
+                decoder_targets = self.decoder_targets_train[:, :self.decoder_train_steps]
+                # encoder_inputs_extend: [batch_size, 1, encoder_time_steps], same for every step
+                encoder_inputs_extend = tf.expand_dims(self.encoder_inputs_extend, axis=1)
                 
-                # decoder_masked_length: [batch_size]
-                decoder_masked_length = tf.reduce_sum(self.decoder_masks, axis=1)
-                self.logger.debug('decoder_masked_length %s', decoder_masked_length)
-                # masked_losses: (decoder_max_time_steps + 1) * [batch_size]
-                masked_losses = [v * self.decoder_masks[:, decoder_step] for decoder_step, v in enumerate(losses_group)]
-                self.logger.debug('masked_losses %s', masked_losses)
+                # losses: [batch_size, decoder_train_steps], -log of target in final distribution
+                losses = -pointer_log_probs(decoder_targets, vocab_log_probs(self.decoder_logits, decoder_targets),
+                                            p_gen_logits, attention_distributions, encoder_inputs_extend,
+                                            self.decoder_vocab_size)
+                self.logger.debug('losses %s', losses)
                 
-                # merged_losses: [batch_size]
-                merged_losses = sum(masked_losses) / decoder_masked_length
-                self.logger.debug('merged_losses %s', merged_losses)
-                
-                self.generator_loss = tf.reduce_mean(merged_losses)
+                self.generator_loss = sequence_mean(losses, self.decoder_masks)
                 self.logger.debug('generator_loss %s', self.generator_loss)
                 
-                # coverage_matrix: [batch_size, encoder_time_steps]
-                coverage_matrix = tf.zeros_like(attention_distributions[0])
-                # coverage_loss
-                coverage_losses = []
-                for attention_distribution in attention_distributions:
-                    # coverage_loss: [batch_size]
-                    coverage_loss = tf.reduce_sum(tf.minimum(attention_distribution, coverage_matrix),
-                                                  [1])
-                    coverage_losses.append(coverage_loss)
-                    coverage_matrix += attention_distribution
-                
-                # decoder_masked_length: [batch_size]
-                decoder_masked_length = tf.reduce_sum(self.decoder_masks, axis=1)
-                self.logger.debug('decoder_masked_length %s', decoder_masked_length)
-                
-                # masked_losses: (decoder_max_time_steps + 1) * [batch_size]
-                masked_losses = [v * self.decoder_masks[:, decoder_step] for decoder_step, v in
-                                 enumerate(coverage_losses)]
-                self.logger.debug('masked_losses %s', masked_losses)
-                
-                # merged_losses: [batch_size]
-                merged_losses = sum(masked_losses) / decoder_masked_length
-                self.logger.debug('merged_losses %s', merged_losses)
+                # attention_distributions: summed in float32
+                attention_distributions = tf.cast(attention_distributions, tf.float32)
+                # coverage_matrix: [batch_size, decoder_train_steps, encoder_time_steps], sum of previous attentions
+                coverage_matrix = tf.cumsum(attention_distributions, axis=1, exclusive=True)
+                # coverage_losses: [batch_size, decoder_train_steps]
+                coverage_losses = tf.reduce_sum(tf.minimum(attention_distributions, coverage_matrix), axis=2)
                 
                 # coverage_loss: []
-                self.coverage_loss = tf.reduce_mean(merged_losses)
+                self.coverage_loss = sequence_mean(coverage_losses, self.decoder_masks)
                 self.logger.debug('coverage_loss %s', self.coverage_loss)
                 
-                # total loss
+                # total loss, full softmax, for eval
                 self.loss = self.generator_loss + self.coverage_loss_weight * self.coverage_loss
                 self.logger.debug('total loss %s', self.loss)
-            
+                
+                if self.num_sampled:
+                    # sampled_losses: [batch_size, decoder_train_steps], only vocab part is sampled, copy part is exact
+                    weights, biases, inputs = sampled_projection(self.outputs_dense, self.decoder_outputs)
+                    sampled_log_probs = sampled_vocab_log_probs(weights, biases, inputs, decoder_targets,
+                                                                self.num_sampled, self.decoder_vocab_size)
+                    sampled_losses = -pointer_log_probs(decoder_targets, sampled_log_probs, p_gen_logits,
+                                                        attention_distributions, encoder_inputs_extend,
+                                                        self.decoder_vocab_size)
+                    # train_loss: [], sampled softmax, for training only
+                    self.train_loss = sequence_mean(sampled_losses, self.decoder_masks) + \
+                                      self.coverage_loss_weight * self.coverage_loss
+                else:
+                    self.train_loss = self.loss
+                self.logger.debug('train_loss %s', self.train_loss)
             
             else:
-    
-                self.decoder_scores = []
-                self.decoder_probabilities = []
-                self.decoder_predicts = []
-    
+                
                 # decoder_initial_tokens: [batch_size]
                 self.decoder_initial_tokens = tf.ones(shape=[self.batch_size], dtype=tf.int32,
                                                       name='initial_tokens') * GO
                 self.logger.debug('decoder_initial_tokens %s', self.decoder_initial_tokens)
-    
+                
                 # decoder_initial_tokens_embedded: [batch_size, embedding_size]
                 self.decoder_initial_tokens_embedded = tf.nn.embedding_lookup(params=self.decoder_embeddings,
                                                                               ids=self.decoder_initial_tokens)
                 self.logger.debug('decoder_initial_tokens_embedded %s', self.decoder_initial_tokens_embedded)
-    
-                inputs = self.decoder_initial_tokens_embedded
+                
+                def step(time, loop_state):
+                    inputs, state, coverage = loop_state
+                    outputs, p_gen_dense, alpha_i, state, coverage = self.decode_step(inputs, state, coverage)
+                    # outputs_logits: [batch_size, decoder_vocab_size]
+                    outputs_logits = self.outputs_dense(outputs)
+                    # p_gen: [batch_size, 1], distributions are float32 for float16 models
+                    p_gen = tf.nn.sigmoid(tf.cast(p_gen_dense, tf.float32), name='p_gen_sigmoid')
+                    # vocab_distribution: [batch_size, decoder_vocab_size]
+                    vocab_distribution = tf.nn.softmax(tf.cast(outputs_logits, tf.float32), axis=-1)
+                    # final_distribution: [batch_size, decoder_vocab_size + oovs_max_size]
+                    final_distribution = self.merge_distribution(p_gen, tf.cast(alpha_i, tf.float32),
+                                                                 vocab_distribution, self.oovs_max_size)
+                    # predicts: [batch_size], argmax index
+                    predicts = tf.argmax(final_distribution, -1)
+                    # scores: [batch_size], argmax probability score
+                    scores = tf.reduce_max(final_distribution, -1)
+                    # greater_index: [batch_size], whether predict is extended oov id
+                    greater_index = tf.cast(tf.greater_equal(predicts, self.decoder_vocab_size), tf.int64)
+                    # next input, extended oov ids are fed as unk
+                    input_next = predicts * (1 - greater_index) + greater_index * UNK
+                    inputs = tf.nn.embedding_lookup(params=self.decoder_embeddings, ids=input_next)
+                    return (predicts, scores), (inputs, state, coverage), tf.equal(predicts, EOS)
+                
+                # coverage: [batch_size, hidden_units]
+                coverage = tf.zeros(shape=[self.batch_size, self.hidden_units], dtype=self.dtype)
+                
                 with tf.variable_scope('loop', reuse=tf.AUTO_REUSE):
-                    coverage = tf.zeros(shape=[self.batch_size, self.hidden_units])
-
-                    for _ in range(self.decoder_max_time_steps):
-                        c_i, alpha_i, coverage = self.attention(state[-1], encoder_outputs=self.encoder_outputs_unstack, coverage=coverage)
-            
-                        # p_gen_dense: [batch_size, 1]
-                        p_gen_dense = tf.layers.dense(tf.concat([c_i, state[-1], inputs], axis=-1),
-                                                      units=1,
-                                                      name='p_gen_dense')
-            
-                        self.logger.debug('p_gen_dense %s', p_gen_dense)
-                        # p_gen: [batch_size, 1]
-                        p_gen = tf.nn.sigmoid(p_gen_dense, name='p_gen_sigmoid')
-                        self.logger.debug('p_gen %s', p_gen)
-            
-                        inputs = tf.concat([inputs, c_i], axis=1)
-                        outputs, state = self.decoder_cell(inputs=inputs, state=state)
-            
-                        # outputs_logits: [batch_size, decoder_vocab_size]
-                        outputs_logits = tf.layers.dense(inputs=outputs,
-                                                         units=self.decoder_vocab_size,
-                                                         name='outputs_dense')
-                        self.logger.debug('outputs_logits %s', outputs_logits)
-            
-                        # vocab_distribution: [batch_size, decoder_vocab_size]
-                        vocab_distribution = tf.nn.softmax(outputs_logits, axis=-1)
-            
-                        # attention_distribution: [batch_size, encoder_inputs_length]
-                        attention_distribution = alpha_i
-            
-                        # final_distribution: [batch_size, decoder_vocab_size + oovs_max_size]
-                        final_distribution = self.merge_distribution(p_gen, attention_distribution, vocab_distribution,
-                                                                     self.oovs_max_size)
-            
-                        self.logger.debug('final_distribution %s', final_distribution)
-            
-                        self.decoder_probabilities.append(final_distribution)
-            
-                        # argmax index
-                        predicts = tf.argmax(final_distribution, -1)
-            
-                        self.logger.debug('predicts %s', predicts)
-            
-                        self.decoder_predicts.append(predicts)
-            
-                        # self.logger.debug('oov_vocabs %s', self.oovs_vocabs)
-            
-                        greater_index = tf.cast(tf.greater_equal(predicts, self.decoder_vocab_size), tf.int64)
-            
-                        self.logger.debug('greater index %s', greater_index)
-            
-                        indices = tf.ones([self.batch_size], tf.int64) - greater_index
-            
-                        self.logger.debug('indices %s', indices)
-            
-                        input_next = tf.multiply(predicts, indices) + \
-                                     tf.multiply(greater_index, tf.ones([self.batch_size], tf.int64) * UNK)
-            
-                        self.logger.debug('predicts %s', predicts)
-            
-                        # argmax probability score
-                        scores = tf.reduce_max(final_distribution, -1)
-            
-                        self.decoder_scores.append(scores)
-            
-                        # next input
-                        inputs = tf.nn.embedding_lookup(params=self.decoder_embeddings,
-                                                        ids=input_next)
-    
-                self.decoder_probabilities = tf.stack(self.decoder_probabilities, axis=1)
-                self.decoder_predicts = tf.stack(self.decoder_predicts, axis=1)
-                self.decoder_scores = tf.stack(self.decoder_scores, axis=1)
-    
-                self.logger.debug('decoder_probabilities %s', self.decoder_probabilities)
+                    (self.decoder_predicts, self.decoder_scores), (_, state, _) = dynamic_decode(
+                        step, (self.decoder_initial_tokens_embedded, state, coverage), self.max_inference_steps,
+                        [tf.int64, tf.float32], finished=tf.zeros([self.batch_size], dtype=tf.bool))
+                
+                self.decoder_last_state = state
                 self.logger.debug('decoder_predicts %s', self.decoder_predicts)
                 self.logger.debug('decoder_scores %s', self.decoder_scores)
     
+    def decode_step(self, inputs, state, coverage):
+        """
+        one decoder step, shared by train and inference loops
+        :param inputs: [batch_size, embedding_size]
+        :param state: decoder_depth * [batch_size, hidden_units]
+        :param coverage: [batch_size, hidden_units]
+        :return: decoder outputs, p_gen logits, attention distribution, next state, next coverage
+        """
+        # c_i: [batch_size, hidden_units]
+        # alpha_i: [batch_size, encoder_time_steps]
+        c_i, alpha_i, coverage = self.attention(state[-1], encoder_outputs=self.encoder_outputs,
+                                                coverage=coverage)
+        
+        # p_gen_dense: [batch_size, 1]
+        p_gen_dense = tf.layers.dense(tf.concat([c_i, state[-1], inputs], axis=-1),
+                                      units=1,
+                                      name='p_gen_dense')
+        
+        inputs = tf.concat([inputs, c_i], axis=1)
+        # outputs: [batch_size, hidden_units]
+        outputs, state = self.decoder_cell(inputs=inputs, state=state)
+        return outputs, p_gen_dense, alpha_i, state, coverage
+    
     def merge_distribution(self, p_gen, attention_distribution, vocab_distribution, oovs_max_size):
         """
         merge attention_distribution and vocab_distribution
@@ -640,7 +562,9 @@ class PointerGeneratorCoverageModel():
         self.logger.debug('attention_distribution %s', attention_distribution)
         
         # vocab_distribution: [batch_size, encoder_vocab_size + oovs_max_size]
-        vocab_distribution = tf.concat([vocab_distribution, tf.zeros(shape=[self.batch_size, oovs_max_size])], axis=-1)
+        vocab_distribution = tf.concat([vocab_distribution,
+                                        tf.zeros(shape=[self.batch_size, oovs_max_size],
+                                                 dtype=vocab_distribution.dtype)], axis=-1)
         self.logger.debug('vocab_distribution %s', vocab_distribution)
         
         # final_distribution: [batch_size, encoder_vocab_size + oovs_max_size]
@@ -664,8 +588,13 @@ class PointerGeneratorCoverageModel():
                 self.optimizer = tf.train.AdamOptimizer(learning_rate=self.learning_rate)
                 self.logger.info('Optimizer has been set')
             
-            # compute gradients
-            self.gradients = tf.gradients(ys=self.loss, xs=self.trainable_verbs)
+            if self.dtype == tf.float16:
+                self.optimizer = loss_scale_optimizer(self.optimizer)
+                self.logger.info('Loss scaling has been set')
+            
+            # compute gradients, unscaled
+            self.gradients = [gradient for gradient, _ in self.optimizer.compute_gradients(self.train_loss,
+                                                                                           self.trainable_verbs)]
             
             # clip gradients by a given maximum_gradient_norm
             self.clip_gradients, _ = tf.clip_by_global_norm(self.gradients, self.max_gradient_norm)
@@ -724,7 +653,7 @@ class PointerGeneratorCoverageModel():
         }
         
         output_feed = [
-            self.loss,
+            self.train_loss,
             self.train_op,
         ]
         outputs = sess.run(fetches=output_feed, feed_dict=input_feed)
@@ -757,12 +686,13 @@ class PointerGeneratorCoverageModel():
         outputs = sess.run(fetches=output_feed, feed_dict=input_feed)
         return outputs
     
-    def inference(self, sess, encoder_inputs, encoder_inputs_extend, encoder_inputs_length, oovs_max_size):
+    def inference(self, sess, encoder_inputs, encoder_inputs_extend, encoder_inputs_length, oovs_max_size, max_inference_steps=None):
         """
         inference process
         :param sess: session object
         :param encoder_inputs:
         :param encoder_inputs_length:
+        :param max_inference_steps: limit of decoding steps, None for decoder_max_time_steps
         :return: None
         """
         input_feed = {
@@ -772,6 +702,8 @@ class PointerGeneratorCoverageModel():
             self.oovs_max_size.name: oovs_max_size,
             self.keep_prob.name: 1
         }
+        if max_inference_steps is not None:
+            input_feed[self.max_inference_steps.name] = max_inference_steps
         
         output_feed = [
             self.decoder_predicts,
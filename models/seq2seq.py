@@ -1,23 +1,34 @@
 import tensorflow as tf
 import math
 from utils.config import GO, EOS
+from utils.dataset import input_placeholder
+from utils.losses import sampled_vocab_log_probs
+from utils.projection import output_projection, sampled_projection
+from utils.precision import float32_variable_getter, loss_scale_optimizer
 
 
 class Seq2SeqModel():
-    def __init__(self, config, mode, logger):
+    # inputs may be padded to longest sentence of batch instead of max time steps
+    pad_to_longest = True
+    
+    def __init__(self, config, mode, logger, inputs=None):
         """
         init model
         :param config: config dict
         :param mode: train or inference
         :param logger: logger object
+        :param inputs: input tensors by placeholder name, eg: from utils.dataset, None to feed
         """
         assert mode.lower() in ['train', 'inference']
         self.mode = mode.lower()
         self.logger = logger
+        self.inputs = inputs
         self.init_config(config)
-        self.build_placeholders()
-        self.build_encoder()
-        self.build_decoder()
+        # float16 variables are stored in float32, names are unchanged
+        with tf.variable_scope(tf.get_variable_scope(), custom_getter=float32_variable_getter):
+            self.build_placeholders()
+            self.build_encoder()
+            self.build_decoder()
         self.build_optimizer()
     
     def init_config(self, config):
@@ -43,6 +54,9 @@ class Seq2SeqModel():
         self.max_gradient_norm = config['max_gradient_norm']
         self.use_bidirectional = config['use_bidirectional']
         self.use_dropout = config['use_dropout']
+        self.num_sampled = config.get('num_sampled', 0)
+        self.share_embeddings = config.get('share_embeddings', False)
+        self.tie_output_projection = config.get('tie_output_projection', False)
         self.global_step = tf.Variable(0, trainable=False, name='global_step')
         self.global_epoch_step = tf.Variable(0, trainable=False, name='global_epoch_step')
         self.global_epoch_step_op = tf.assign(self.global_epoch_step, tf.add(self.global_epoch_step, 1))
@@ -55,13 +69,13 @@ class Seq2SeqModel():
         self.keep_prob = tf.placeholder(self.dtype, shape=[], name='keep_prob')
         
         # encoder_inputs: [batch_size, max_time_steps]
-        self.encoder_inputs = tf.placeholder(dtype=tf.int32, shape=[None, None],
-                                             name='encoder_inputs')
+        self.encoder_inputs = input_placeholder(self.inputs, dtype=tf.int32, shape=[None, None],
+                                                name='encoder_inputs')
         self.logger.debug('encoder_inputs %s', self.encoder_inputs)
         
         # encoder_inputs_length: [batch_size]
-        self.encoder_inputs_length = tf.placeholder(dtype=tf.int32, shape=[None],
-                                                    name='encoder_inputs_length')
+        self.encoder_inputs_length = input_placeholder(self.inputs, dtype=tf.int32, shape=[None],
+                                                       name='encoder_inputs_length')
         self.logger.debug('encoder_inputs_length %s', self.encoder_inputs_length)
         
         # batch_size
@@ -71,13 +85,13 @@ class Seq2SeqModel():
         if self.mode == 'train':
             
             # decoder_inputs: [batch_size, max_time_steps]
-            self.decoder_inputs = tf.placeholder(dtype=tf.int32, shape=[None, None],
-                                                 name='decoder_inputs')
+            self.decoder_inputs = input_placeholder(self.inputs, dtype=tf.int32, shape=[None, None],
+                                                    name='decoder_inputs')
             self.logger.debug('decoder_inputs %s', self.decoder_inputs)
             
             # decoder_inputs_length: [batch_size]
-            self.decoder_inputs_length = tf.placeholder(dtype=tf.int32, shape=[None],
-                                                        name='decoder_inputs_length')
+            self.decoder_inputs_length = input_placeholder(self.inputs, dtype=tf.int32, shape=[None],
+                                                           name='decoder_inputs_length')
             self.logger.debug('decoder_inputs_length %s', self.decoder_inputs_length)
             
             # decoder_start_token: [batch_size, 1]
@@ -253,15 +267,24 @@ class Seq2SeqModel():
             self.decoder_cell = self.build_decoder_cell()
             self.logger.debug('decoder_cell %s', self.decoder_cell)
             
-            # decoder_embeddings: [decoder_vocab_size, embedding_size]
-            self.decoder_embeddings = tf.get_variable(name='embedding',
-                                                      shape=[self.decoder_vocab_size, self.embedding_size],
-                                                      dtype=self.dtype,
-                                                      initializer=tf.random_uniform_initializer(-math.sqrt(3),
-                                                                                                math.sqrt(3),
-                                                                                                dtype=self.dtype))
+            # decoder_embeddings: [decoder_vocab_size, embedding_size], shared with encoder if same vocab
+            if self.share_embeddings:
+                assert self.encoder_vocab_size == self.decoder_vocab_size, 'Shared embeddings need same vocab size'
+                self.decoder_embeddings = self.encoder_embeddings
+            else:
+                self.decoder_embeddings = tf.get_variable(name='embedding',
+                                                          shape=[self.decoder_vocab_size, self.embedding_size],
+                                                          dtype=self.dtype,
+                                                          initializer=tf.random_uniform_initializer(-math.sqrt(3),
+                                                                                                    math.sqrt(3),
+                                                                                                    dtype=self.dtype))
             self.logger.debug('decoder_embeddings %s', self.decoder_embeddings)
             
+            # logits_dense: decoder outputs to vocab logits, tied to decoder embeddings through adapter if
+            # tie_output_projection
+            self.logits_dense = output_projection(self.decoder_vocab_size, 'decoder_logits',
+                                                  self.decoder_embeddings if self.tie_output_projection else None)
+            
             if self.mode == 'train':
                 # decoder_inputs_embedded: [batch_size, decoder_time_steps, embedding_size]
                 self.decoder_inputs_embedded = tf.nn.embedding_lookup(params=self.decoder_embeddings,
@@ -277,25 +300,35 @@ class Seq2SeqModel():
                                                                                   dtype=self.dtype,
                                                                                   scope=scope)
                 # decoder_logits: [batch_size, decoder_max_time_steps, decoder_vocab_size]
-                self.decoder_logits = tf.layers.dense(inputs=self.decoder_outputs,
-                                                      units=self.decoder_vocab_size,
-                                                      name='decoder_logits')
+                self.decoder_logits = self.logits_dense(self.decoder_outputs)
                 self.logger.debug('decoder_logits %s', self.decoder_logits)
                 
                 # decoder_masks: [batch_size, reduce_max(decoder_inputs_length)]
                 self.decoder_masks = tf.sequence_mask(lengths=self.decoder_inputs_train_length,
-                                                      # add go symbol length
-                                                      maxlen=self.decoder_max_time_steps + 1,
+                                                      # padded length with go symbol
+                                                      maxlen=tf.shape(self.decoder_targets_train)[1],
                                                       dtype=self.dtype,
                                                       name='masks')
                 
                 self.logger.debug('decoder_masks %s', self.decoder_masks)
                 
-                # loss
-                self.loss = tf.contrib.seq2seq.sequence_loss(logits=self.decoder_logits,
+                # loss, in float32 for float16 models
+                self.loss = tf.contrib.seq2seq.sequence_loss(logits=tf.cast(self.decoder_logits, tf.float32),
                                                              targets=self.decoder_targets_train,
-                                                             weights=self.decoder_masks)
+                                                             weights=tf.cast(self.decoder_masks, tf.float32))
                 self.logger.debug('loss %s', self.loss)
+                
+                if self.num_sampled:
+                    # sampled_losses: [batch_size, decoder_time_steps], sampled softmax, for training only
+                    weights, biases, inputs = sampled_projection(self.logits_dense, self.decoder_outputs)
+                    sampled_losses = -sampled_vocab_log_probs(weights, biases, inputs, self.decoder_targets_train,
+                                                              self.num_sampled, self.decoder_vocab_size)
+                    # train_loss: [], averaged over real steps like sequence_loss
+                    masks = tf.cast(self.decoder_masks, tf.float32)
+                    self.train_loss = tf.reduce_sum(sampled_losses * masks) / tf.reduce_sum(masks)
+                else:
+                    self.train_loss = self.loss
+                self.logger.debug('train_loss %s', self.train_loss)
             
             else:
                 
@@ -329,11 +362,9 @@ class Seq2SeqModel():
                         inputs=input,
                         state=state)
                     
-                    logits = tf.layers.dense(inputs=output,
-                                             units=self.decoder_vocab_size,
-                                             name='decoder_logits', reuse=tf.AUTO_REUSE)
+                    logits = self.logits_dense(output)
                     # probability matrix
-                    probabilities = tf.nn.softmax(logits, -1)
+                    probabilities = tf.nn.softmax(tf.cast(logits, tf.float32), -1)
                     
                     # argmax index
                     predicts = tf.argmax(probabilities, -1)
@@ -380,8 +411,13 @@ class Seq2SeqModel():
                 self.optimizer = tf.train.AdamOptimizer(learning_rate=self.learning_rate)
                 self.logger.info('Optimizer has been set')
             
-            # compute gradients
-            self.gradients = tf.gradients(ys=self.loss, xs=self.trainable_verbs)
+            if self.dtype == tf.float16:
+                self.optimizer = loss_scale_optimizer(self.optimizer)
+                self.logger.info('Loss scaling has been set')
+            
+            # compute gradients, unscaled
+            self.gradients = [gradient for gradient, _ in self.optimizer.compute_gradients(self.train_loss,
+                                                                                           self.trainable_verbs)]
             
             # clip gradients by a given maximum_gradient_norm
             self.clip_gradients, _ = tf.clip_by_global_norm(self.gradients, self.max_gradient_norm)
@@ -437,7 +473,7 @@ class Seq2SeqModel():
         }
         
         output_feed = [
-            self.loss,
+            self.train_loss,
             self.train_op,
         ]
         outputs = sess.run(fetches=output_feed, feed_dict=input_feed)
@@ -1,23 +1,35 @@
 import tensorflow as tf
 import math
 from utils.config import GO, EOS
+from utils.dataset import input_placeholder
+from utils.losses import sampled_vocab_log_probs
+from utils.projection import output_projection, sampled_projection
+from utils.precision import float32_variable_getter, loss_scale_optimizer
+from utils.attention import attention_keys, attention_mask, additive_attention
 
 
 class Seq2SeqAttentionModel():
-    def __init__(self, config, mode, logger):
+    # train decoder is unrolled over decoder_max_time_steps, inputs are padded to max time steps
+    pad_to_longest = False
+    
+    def __init__(self, config, mode, logger, inputs=None):
         """
         init model
         :param config: config dict
         :param mode: train or inference
         :param logger: logger object
+        :param inputs: input tensors by placeholder name, eg: from utils.dataset, None to feed
         """
         assert mode.lower() in ['train', 'inference']
         self.mode = mode.lower()
         self.logger = logger
+        self.inputs = inputs
         self.init_config(config)
-        self.build_placeholders()
-        self.build_encoder()
-        self.build_decoder()
+        # float16 variables are stored in float32, names are unchanged
+        with tf.variable_scope(tf.get_variable_scope(), custom_getter=float32_variable_getter):
+            self.build_placeholders()
+            self.build_encoder()
+            self.build_decoder()
         self.build_optimizer()
     
     def init_config(self, config):
@@ -44,6 +56,10 @@ class Seq2SeqAttentionModel():
         self.use_bidirectional = config['use_bidirectional']
         self.use_dropout = config['use_dropout']
         self.attention_units = config['attention_units']
+        self.mask_attention = config.get('mask_attention', False)
+        self.num_sampled = config.get('num_sampled', 0)
+        self.share_embeddings = config.get('share_embeddings', False)
+        self.tie_output_projection = config.get('tie_output_projection', False)
         self.global_step = tf.Variable(0, trainable=False, name='global_step')
         self.global_epoch_step = tf.Variable(0, trainable=False, name='global_epoch_step')
         self.global_epoch_step_op = tf.assign(self.global_epoch_step, tf.add(self.global_epoch_step, 1))
@@ -56,13 +72,13 @@ class Seq2SeqAttentionModel():
         self.keep_prob = tf.placeholder(self.dtype, shape=[], name='keep_prob')
         
         # encoder_inputs: [batch_size, encoder_time_steps]
-        self.encoder_inputs = tf.placeholder(dtype=tf.int32, shape=[None, self.encoder_max_time_steps],
-                                             name='encoder_inputs')
+        self.encoder_inputs = input_placeholder(self.inputs, dtype=tf.int32, shape=[None, self.encoder_max_time_steps],
+                                                name='encoder_inputs')
         self.logger.debug('encoder_inputs %s', self.encoder_inputs)
         
         # encoder_inputs_length: [batch_size]
-        self.encoder_inputs_length = tf.placeholder(dtype=tf.int32, shape=[None],
-                                                    name='encoder_inputs_length')
+        self.encoder_inputs_length = input_placeholder(self.inputs, dtype=tf.int32, shape=[None],
+                                                       name='encoder_inputs_length')
         self.logger.debug('encoder_inputs_length %s', self.encoder_inputs_length)
         
         # batch_size
@@ -72,13 +88,14 @@ class Seq2SeqAttentionModel():
         if self.mode == 'train':
             
             # decoder_inputs: [batch_size, decoder_time_steps]
-            self.decoder_inputs = tf.placeholder(dtype=tf.int32, shape=[None, self.decoder_max_time_steps],
-                                                 name='decoder_inputs')
+            self.decoder_inputs = input_placeholder(self.inputs, dtype=tf.int32,
+                                                    shape=[None, self.decoder_max_time_steps],
+                                                    name='decoder_inputs')
             self.logger.debug('decoder_inputs %s', self.decoder_inputs)
             
             # decoder_inputs_length: [batch_size]
-            self.decoder_inputs_length = tf.placeholder(dtype=tf.int32, shape=[None],
-                                                        name='decoder_inputs_length')
+            self.decoder_inputs_length = input_placeholder(self.inputs, dtype=tf.int32, shape=[None],
+                                                           name='decoder_inputs_length')
             self.logger.debug('decoder_inputs_length %s', self.decoder_inputs_length)
             
             # decoder_start_token: [batch_size, 1]
@@ -120,17 +137,17 @@ class Seq2SeqAttentionModel():
             
             # attention_u: [hidden_units, attention_units]
             self.attention_u = tf.get_variable(name='a', shape=[self.hidden_units, self.attention_units],
-                                               initializer=tf.truncated_normal_initializer)
+                                               dtype=self.dtype, initializer=tf.truncated_normal_initializer)
             self.logger.debug('attention_u %s', self.attention_u)
             
             # attention_w: [hidden_units, attention_units]
             self.attention_w = tf.get_variable(name='w', shape=[self.hidden_units, self.attention_units],
-                                               initializer=tf.truncated_normal_initializer)
+                                               dtype=self.dtype, initializer=tf.truncated_normal_initializer)
             self.logger.debug('attention_w %s', self.attention_w)
             
             # attention_v: [attention_units, 1]
             self.attention_v = tf.get_variable(name='v', shape=[self.attention_units, 1],
-                                               initializer=tf.truncated_normal_initializer)
+                                               dtype=self.dtype, initializer=tf.truncated_normal_initializer)
             self.logger.debug('attention_v %s', self.attention_v)
     
     def build_single_cell(self):
@@ -266,43 +283,9 @@ class Seq2SeqAttentionModel():
         :param encoder_outputs: encoder outputs
         :return: attention result
         """
-        e_i = []
-        c_i = []
-        # encoder_outputs: encoder_time_steps * [batch_size, hidden_units]
-        # output: [batch_size, hidden_units]
-        for output in encoder_outputs:
-            # e_i_j: [batch_size, 1]
-            e_i_j = tf.matmul(
-                # tanh: [batch_size, attention_units]
-                tf.tanh(
-                    # prev_state: [batch_size, hidden_units]
-                    # attention_w: [hidden_units, attention_units]
-                    tf.matmul(prev_state, self.attention_w) +
-                    # output: [batch_size, hidden_units]
-                    # attention_u: [hidden_units, attention_units]
-                    tf.matmul(output, self.attention_u)
-                ),
-                # attention_v: [attention_units, 1]
-                self.attention_v)
-            # e_i: encoder_time_steps * [batch_size, 1]
-            e_i.append(e_i_j)
-        # e_i: [batch_size, encoder_time_steps]
-        e_i = tf.concat(e_i, axis=1)
-        # alpha_i: [batch_size, encoder_time_steps]
-        alpha_i = tf.nn.softmax(e_i, axis=-1)
-        # alpha_i: encoder_time_steps * [batch_size, 1]
-        alpha_i = tf.split(alpha_i, alpha_i.shape[-1], axis=-1)
-        # alpha_i: encoder_time_steps * [batch_size, 1]
-        # encoder_outputs: encoder_time_steps * [batch_size, hidden_units]
-        for alpha_i_j, output in zip(alpha_i, encoder_outputs):
-            # alpha_i_j: [batch_size, 1]
-            # output: [batch_size, hidden_units]
-            # c_i_j: [batch_size, hidden_units]
-            c_i_j = tf.multiply(alpha_i_j, output)
-            # c_i: encoder_time_steps * [batch_size, hidden_units]
-            c_i.append(c_i_j)
         # c_i: [batch_size, hidden_units]
-        c_i = tf.reduce_sum(c_i, axis=0)
+        c_i, _, _ = additive_attention(prev_state, encoder_outputs, self.encoder_keys,
+                                       self.attention_w, self.attention_v, mask=self.encoder_masks)
         return c_i
     
     def build_decoder(self):
@@ -318,17 +301,32 @@ class Seq2SeqAttentionModel():
             self.decoder_cell = self.build_decoder_cell()
             self.logger.debug('decoder_cell %s', self.decoder_cell)
             
-            # decoder_embeddings: [decoder_vocab_size, embedding_size]
-            self.decoder_embeddings = tf.get_variable(name='embedding',
-                                                      shape=[self.decoder_vocab_size, self.embedding_size],
-                                                      dtype=self.dtype,
-                                                      initializer=tf.random_uniform_initializer(-math.sqrt(3),
-                                                                                                math.sqrt(3),
-                                                                                                dtype=self.dtype))
+            # decoder_embeddings: [decoder_vocab_size, embedding_size], shared with encoder if same vocab
+            if self.share_embeddings:
+                assert self.encoder_vocab_size == self.decoder_vocab_size, 'Shared embeddings need same vocab size'
+                self.decoder_embeddings = self.encoder_embeddings
+            else:
+                self.decoder_embeddings = tf.get_variable(name='embedding',
+                                                          shape=[self.decoder_vocab_size, self.embedding_size],
+                                                          dtype=self.dtype,
+                                                          initializer=tf.random_uniform_initializer(-math.sqrt(3),
+                                                                                                    math.sqrt(3),
+                                                                                                    dtype=self.dtype))
             self.logger.debug('decoder_embeddings %s', self.decoder_embeddings)
             
-            # encoder_outputs_unstack: encoder_time_steps * [batch_size, hidden_units]
-            self.encoder_outputs_unstack = tf.unstack(self.encoder_outputs, axis=1)
+            # logits_dense: decoder outputs to vocab logits, tied to decoder embeddings through adapter if
+            # tie_output_projection
+            self.logits_dense = output_projection(self.decoder_vocab_size, 'decoder_logits',
+                                                  self.decoder_embeddings if self.tie_output_projection else None)
+            
+            # encoder_keys: [batch_size, encoder_time_steps, attention_units]
+            self.encoder_keys = attention_keys(self.encoder_outputs, self.attention_u)
+            self.logger.debug('encoder_keys %s', self.encoder_keys)
+            
+            # encoder_masks: [batch_size, encoder_time_steps]
+            self.encoder_masks = attention_mask(self.encoder_inputs_length,
+                                                self.encoder_max_time_steps) if self.mask_attention else None
+            self.logger.debug('encoder_masks %s', self.encoder_masks)
             
             # state: encoder_depth * [batch_size, hidden_units]
             state = self.decoder_initial_state
@@ -346,12 +344,9 @@ class Seq2SeqAttentionModel():
                                   len(self.decoder_inputs_embedded_unstack),
                                   self.decoder_inputs_embedded_unstack[0])
                 
-                self.logger.debug('encoder_outputs_unstack length %s sample %s',
-                                  len(self.encoder_outputs_unstack), self.encoder_outputs_unstack[0])
-                
                 decoder_outputs = []
                 for i, inputs in enumerate(self.decoder_inputs_embedded_unstack):
-                    c_i = self.attention(state[-1], encoder_outputs=self.encoder_outputs_unstack)
+                    c_i = self.attention(state[-1], encoder_outputs=self.encoder_outputs)
                     inputs = tf.concat([inputs, c_i], axis=1)
                     outputs, state = self.decoder_cell(inputs=inputs, state=state)
                     decoder_outputs.append(outputs)
@@ -365,9 +360,7 @@ class Seq2SeqAttentionModel():
                 self.logger.debug('decoder_last_state %s', self.decoder_last_state)
                 
                 # decoder_logits: [batch_size, decoder_max_time_steps, decoder_vocab_size]
-                self.decoder_logits = tf.layers.dense(inputs=self.decoder_outputs,
-                                                      units=self.decoder_vocab_size,
-                                                      name='decoder_logits')
+                self.decoder_logits = self.logits_dense(self.decoder_outputs)
                 self.logger.debug('decoder_logits %s', self.decoder_logits)
                 
                 # decoder_masks: [batch_size, reduce_max(decoder_inputs_length)]
@@ -377,11 +370,23 @@ class Seq2SeqAttentionModel():
                                                       name='masks')
                 self.logger.debug('decoder_masks %s', self.decoder_masks)
                 
-                # loss
-                self.loss = tf.contrib.seq2seq.sequence_loss(logits=self.decoder_logits,
+                # loss, in float32 for float16 models
+                self.loss = tf.contrib.seq2seq.sequence_loss(logits=tf.cast(self.decoder_logits, tf.float32),
                                                              targets=self.decoder_targets_train,
-                                                             weights=self.decoder_masks)
+                                                             weights=tf.cast(self.decoder_masks, tf.float32))
                 self.logger.debug('loss %s', self.loss)
+                
+                if self.num_sampled:
+                    # sampled_losses: [batch_size, decoder_time_steps], sampled softmax, for training only
+                    weights, biases, inputs = sampled_projection(self.logits_dense, self.decoder_outputs)
+                    sampled_losses = -sampled_vocab_log_probs(weights, biases, inputs, self.decoder_targets_train,
+                                                              self.num_sampled, self.decoder_vocab_size)
+                    # train_loss: [], averaged over real steps like sequence_loss
+                    masks = tf.cast(self.decoder_masks, tf.float32)
+                    self.train_loss = tf.reduce_sum(sampled_losses * masks) / tf.reduce_sum(masks)
+                else:
+                    self.train_loss = self.loss
+                self.logger.debug('train_loss %s', self.train_loss)
             else:
                 
                 # decoder_initial_tokens: [batch_size]
@@ -409,7 +414,7 @@ class Seq2SeqAttentionModel():
                 for _ in range(self.decoder_max_time_steps):
                     # decode one step
                     
-                    c_i = self.attention(state[-1], encoder_outputs=self.encoder_outputs_unstack)
+                    c_i = self.attention(state[-1], encoder_outputs=self.encoder_outputs)
                     inputs = tf.concat([inputs, c_i], axis=1)
                     
                     # input: [batch_size, embedding_size]
@@ -418,11 +423,9 @@ class Seq2SeqAttentionModel():
                         inputs=inputs,
                         state=state)
                     
-                    logits = tf.layers.dense(inputs=output,
-                                             units=self.decoder_vocab_size,
-                                             name='decoder_logits', reuse=tf.AUTO_REUSE)
+                    logits = self.logits_dense(output)
                     # probability matrix
-                    probabilities = tf.nn.softmax(logits, -1)
+                    probabilities = tf.nn.softmax(tf.cast(logits, tf.float32), -1)
                     
                     # argmax index
                     predicts = tf.argmax(probabilities, -1)
@@ -469,8 +472,13 @@ class Seq2SeqAttentionModel():
                 self.optimizer = tf.train.AdamOptimizer(learning_rate=self.learning_rate)
                 self.logger.info('Optimizer has been set')
             
-            # compute gradients
-            self.gradients = tf.gradients(ys=self.loss, xs=self.trainable_verbs)
+            if self.dtype == tf.float16:
+                self.optimizer = loss_scale_optimizer(self.optimizer)
+                self.logger.info('Loss scaling has been set')
+            
+            # compute gradients, unscaled
+            self.gradients = [gradient for gradient, _ in self.optimizer.compute_gradients(self.train_loss,
+                                                                                           self.trainable_verbs)]
             
             # clip gradients by a given maximum_gradient_norm
             self.clip_gradients, _ = tf.clip_by_global_norm(self.gradients, self.max_gradient_norm)
@@ -526,7 +534,7 @@ class Seq2SeqAttentionModel():
         }
         
         output_feed = [
-            self.loss,
+            self.train_loss,
             self.train_op,
         ]
         outputs = sess.run(fetches=output_feed, feed_dict=input_feed)
@@ -1,9 +1,17 @@
 from preprocess.writer import Writer
-from preprocess.vocab import VocabTransformer
+from preprocess.vocab import VocabTransformer, save_counts
+from preprocess.reader import read_lines, read_lcsts, read_parallel
 import json
 from os.path import exists, join
 from os import makedirs
 from preprocess.pipeline import *
+import tensorflow as tf
+
+tf.app.flags.DEFINE_integer('min_count', 1, 'Words counted less are dropped from vocabs')
+tf.app.flags.DEFINE_boolean('update_vocabs', False,
+                            'Count sources as appended data, merge with saved counts and rebuild vocabs')
+
+FLAGS = tf.app.flags.FLAGS
 
 output_dir = join('dataset', 'bytecup', 'word')
 
@@ -21,8 +29,11 @@ pipelines = [
     # CharPipeline()
 ]
 
+# run all pipelines on each text, chunks of texts are processed in parallel
+pipeline = ParallelPipeline(pipelines)
+
 writer = Writer(folder=output_dir)
-vocab_transformer = VocabTransformer(limit=vocab_size_limit)
+vocab_transformer = VocabTransformer(limit=vocab_size_limit, min_count=FLAGS.min_count)
 
 train_flag, eval_flag, test_flag = True, False, False
 
@@ -31,35 +42,16 @@ if train_flag:
     sources_file = './dataset/bytecup/word/contents.txt'
     # summaries_file = './dataset/bytecup/titles.train.txt'
     
-    sources = []
-    # summaries = []
-    #
-    for line in open(sources_file, encoding='utf-8').readlines():
-        sources.append(line.strip())
-    #
-    # for line in open(sources_file, encoding='utf-8').readlines():
-    #     sources.append(line.strip())
-    #
-    # # text = open(file, encoding='utf-8').read()
-    # # pattern = re.compile('<doc id=(\d+)>.*?<summary>(.*?)</summary>.*?<short_text>(.*?)</short_text>.*?</doc>', re.S)
-    # # results = re.findall(pattern, text)
-    #
-    #
-    #
-    # for result in results:
-    #     summary = result[1].strip()
-    #     source = result[2].strip()
-    #     sources.append(source)
-    #     summaries.append(summary)
-    #
-    # # pre precess by pipeline
-    # for pipeline in pipelines:
-    #     print('Running', pipeline)
-    #     sources = pipeline.process_all(sources)
-    #     summaries = pipeline.process_all(summaries)
-    print('Sources', len(sources))
-    # get vocabs of articles and summaries, they use the same vocabs
-    word2id, id2word = vocab_transformer.build_vocabs(sources)
+    # count words line by line, keep frequencies to update vocabs when data is appended
+    counts_file = join(output_dir, 'vocabs_lower.counts.json')
+    if FLAGS.update_vocabs:
+        # sources only hold appended data, old corpus is not counted again
+        word2id, id2word = vocab_transformer.update_vocabs(read_lines(sources_file), counts_file)
+    else:
+        counter = vocab_transformer.count_words(read_lines(sources_file))
+        save_counts(counter, counts_file)
+        # get vocabs of articles and summaries, they use the same vocabs
+        word2id, id2word = vocab_transformer.build_vocabs_from_counts(counter)
     
     # write data to txt
     # writer.write_to_txt(sources, 'sources.train.txt')
@@ -70,66 +62,27 @@ if train_flag:
 
 if eval_flag:
     
-    # eval
+    # eval, read doc by doc
     file = './dataset/lcsts/origin/LCSTS/DATA/PART_II.txt'
+    records = read_lcsts(file)
     
-    # start processing
-    sources = []
-    summaries = []
-    
-    text = open(file, encoding='utf-8').read()
-    pattern = re.compile('<doc id=(\d+)>.*?<summary>(.*?)</summary>.*?<short_text>(.*?)</short_text>.*?</doc>', re.S)
-    results = re.findall(pattern, text)
-    
-    for result in results:
-        summary = result[1].strip()
-        source = result[2].strip()
-        sources.append(source)
-        summaries.append(summary)
-    
-    # pre precess by pipeline
-    for pipeline in pipelines:
-        print('Running', pipeline)
-        sources = pipeline.process_all(sources)
-        summaries = pipeline.process_all(summaries)
+    # pre precess by fused pipelines in worker processes
+    print('Running', pipeline)
+    records = pipeline.process_pairs(records)
     
     # write data to txt
-    writer.write_to_txt(sources, 'sources.eval.txt')
-    writer.write_to_txt(summaries, 'summaries.eval.txt')
+    writer.write_pairs_to_txt(records, 'sources.eval.txt', 'summaries.eval.txt')
 
 if test_flag:
-    # eval
-    # file = './dataset/lcsts/origin/LCSTS/DATA/PART_III.txt'
-    #
-    # # start processing
-    # sources = []
-    # summaries = []
-    #
-    # text = open(file, encoding='utf-8').read()
-    # pattern = re.compile(
-    #     '<doc id=.*?>.*?<human_label>(.*?)</human_label>.*?<summary>(.*?)</summary>.*?<short_text>(.*?)</short_text>.*?</doc>',
-    #     re.S)
-    #
-    # results = re.findall(pattern, text)
-    
-    # for result in results:
-    #     rank = int(result[0].strip())
-    #     if rank >= 2:
-    #         summary = result[1].strip()
-    #         source = result[2].strip()
-    #         sources.append(source)
-    #         summaries.append(summary)
+    # test, docs labeled 2 or higher
+    # records = read_lcsts('./dataset/lcsts/origin/LCSTS/DATA/PART_III.txt', min_label=2)
     sources_file = '/private/var/py/Seq2Seq/dataset/lcsts/origin/LCSTS/Result/weibo.txt'
     summaries_file = '/private/var/py/Seq2Seq/dataset/lcsts/origin/LCSTS/Result/sumary.human.txt'
-    sources = open(sources_file, encoding='utf-8').read().split('\n')
-    summaries = open(summaries_file, encoding='utf-8').read().split('\n')
+    records = read_parallel(sources_file, summaries_file)
     
-    # pre precess by pipeline
-    for pipeline in pipelines:
-        print('Running', pipeline)
-        sources = pipeline.process_all(sources)
-        summaries = pipeline.process_all(summaries)
+    # pre precess by fused pipelines in worker processes
+    print('Running', pipeline)
+    records = pipeline.process_pairs(records)
     
     # write data to txt
-    writer.write_to_txt(sources, 'sources.test.txt')
-    writer.write_to_txt(summaries, 'summaries.test.txt')
+    writer.write_pairs_to_txt(records, 'sources.test.txt', 'summaries.test.txt')
@@ -0,0 +1,236 @@
+import heapq
+from collections import defaultdict
+from . import config
+from .parallel import chunks, ordered_map
+
+# suffix of subwords followed by another subword of the same word
+SEPARATOR = '@@'
+
+
+def pairs_of(symbols):
+    """
+    get adjacent symbol pairs of word
+    :param symbols: tuple of symbols
+    :return: list of pairs
+    """
+    return list(zip(symbols, symbols[1:]))
+
+
+def merge_symbols(symbols, pair, merged):
+    """
+    merge non-overlapping occurrences of pair from left to right
+    :param symbols: tuple of symbols
+    :param pair: (first, second)
+    :param merged: first + second
+    :return: tuple of symbols
+    """
+    first, second = pair
+    result = []
+    i = 0
+    while i < len(symbols):
+        if i < len(symbols) - 1 and symbols[i] == first and symbols[i + 1] == second:
+            result.append(merged)
+            i += 2
+        else:
+            result.append(symbols[i])
+            i += 1
+    return tuple(result)
+
+
+def learn_bpe(word_counts, num_merges, min_frequency=2, verbose=False):
+    """
+    learn bpe merges, pair counts are updated incrementally for words containing the merged pair only
+    :param word_counts: dict of word to frequency, eg: Counter from VocabTransformer.count_words
+    :param num_merges: max number of merges
+    :param min_frequency: stop when most frequent pair is counted less
+    :param verbose: print each merge
+    :return: list of pairs in merge order
+    """
+    words = [tuple(word) for word in word_counts]
+    freqs = list(word_counts.values())
+    # stats: pair to frequency, indices: pair to {word index: occurrences}
+    stats = defaultdict(int)
+    indices = defaultdict(lambda: defaultdict(int))
+    for idx, (symbols, freq) in enumerate(zip(words, freqs)):
+        for pair in pairs_of(symbols):
+            stats[pair] += freq
+            indices[pair][idx] += 1
+    # max heap of (-frequency, pair), stale entries are checked when popped
+    heap = [(-freq, pair) for pair, freq in stats.items()]
+    heapq.heapify(heap)
+    
+    merges = []
+    while heap and len(merges) < num_merges:
+        neg_freq, pair = heapq.heappop(heap)
+        freq = stats.get(pair, 0)
+        if -neg_freq != freq:
+            if freq > 0:
+                heapq.heappush(heap, (-freq, pair))
+            continue
+        if freq < min_frequency:
+            break
+        merges.append(pair)
+        if verbose:
+            print('Merge', len(merges), pair, freq)
+        merged = pair[0] + pair[1]
+        changed = set()
+        for idx in list(indices[pair]):
+            old, word_freq = words[idx], freqs[idx]
+            new = merge_symbols(old, pair, merged)
+            words[idx] = new
+            for old_pair in pairs_of(old):
+                stats[old_pair] -= word_freq
+                indices[old_pair][idx] -= 1
+                if not indices[old_pair][idx]:
+                    del indices[old_pair][idx]
+                changed.add(old_pair)
+            for new_pair in pairs_of(new):
+                stats[new_pair] += word_freq
+                indices[new_pair][idx] += 1
+                changed.add(new_pair)
+        for changed_pair in changed:
+            changed_freq = stats[changed_pair]
+            if changed_freq <= 0:
+                del stats[changed_pair]
+                indices.pop(changed_pair, None)
+            elif changed_pair != pair:
+                heapq.heappush(heap, (-changed_freq, changed_pair))
+    return merges
+
+
+def save_merges(merges, filename):
+    """
+    save merges, one pair per line in merge order
+    :param merges: list of pairs
+    :param filename: target file
+    :return:
+    """
+    print('Write %d merges to %s' % (len(merges), filename))
+    with open(filename, 'w', encoding='utf-8') as f:
+        for first, second in merges:
+            f.write('%s %s\n' % (first, second))
+
+
+def load_merges(filename):
+    """
+    load merges saved by save_merges
+    :param filename: merges file
+    :return: list of pairs
+    """
+    merges = []
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line:
+                merges.append(tuple(line.split(' ')))
+    return merges
+
+
+class BPE(object):
+    def __init__(self, merges, separator=SEPARATOR, split_sign=config.SEGMENT_JOIN_FLAG):
+        """
+        init encoder
+        :param merges: list of pairs in merge order
+        :param separator: suffix of subwords continued by next subword
+        :param split_sign: separator of words in line
+        """
+        self.merges = [tuple(pair) for pair in merges]
+        # ranks: pair to merge order, lower merges first
+        self.ranks = {pair: rank for rank, pair in enumerate(self.merges)}
+        self.separator = separator
+        self.split_sign = split_sign
+        # cache: word to subwords
+        self.cache = {}
+    
+    def segment(self, word):
+        """
+        split word to subwords by applying merges in order, memoized per word
+        :param word: word
+        :return: tuple of subwords
+        """
+        subwords = self.cache.get(word)
+        if subwords is not None:
+            return subwords
+        symbols = tuple(word)
+        while len(symbols) > 1:
+            ranked = [(self.ranks[pair], pair) for pair in pairs_of(symbols) if pair in self.ranks]
+            if not ranked:
+                break
+            _, pair = min(ranked)
+            symbols = merge_symbols(symbols, pair, pair[0] + pair[1])
+        self.cache[word] = symbols
+        return symbols
+    
+    def encode_words(self, words):
+        """
+        encode words to subwords, all but last subword of a word end with separator
+        :param words: list of words
+        :return: list of subwords
+        """
+        result = []
+        for word in words:
+            subwords = self.segment(word)
+            result.extend(subword + self.separator for subword in subwords[:-1])
+            result.append(subwords[-1] if subwords else word)
+        return result
+    
+    def encode_line(self, line):
+        """
+        encode line of words
+        :param line: words joined with split sign
+        :return: subwords joined with split sign
+        """
+        line = line.strip()
+        if not line:
+            return line
+        return self.split_sign.join(self.encode_words(line.split(self.split_sign)))
+    
+    def decode_line(self, line):
+        """
+        restore words from encoded line
+        :param line: subwords joined with split sign
+        :return: words joined with split sign
+        """
+        return line.replace(self.separator + self.split_sign, '')
+    
+    def encode_lines(self, lines, processes=1, chunk_size=10000):
+        """
+        encode lines, in worker processes if processes > 1, keep order
+        :param lines: iterable of lines, consumed lazily
+        :param processes: number of worker processes
+        :param chunk_size: number of lines sent to worker at once
+        :return: generator of encoded lines
+        """
+        if processes <= 1:
+            for line in lines:
+                yield self.encode_line(line)
+            return
+        for chunk in ordered_map(_encode_chunk, chunks(lines, chunk_size), processes,
+                                 initializer=_init_worker, initargs=(self.merges, self.separator, self.split_sign)):
+            for line in chunk:
+                yield line
+
+
+# encoder of current worker process, cache is kept across chunks
+_worker_bpe = None
+
+
+def _init_worker(merges, separator, split_sign):
+    """
+    build encoder once per worker process
+    :param merges: list of pairs in merge order
+    :param separator: suffix of subwords continued by next subword
+    :param split_sign: separator of words in line
+    :return: None
+    """
+    global _worker_bpe
+    _worker_bpe = BPE(merges, separator, split_sign)
+
+
+def _encode_chunk(lines):
+    """
+    encode chunk of lines by encoder of worker
+    :param lines: list of lines
+    :return: list of encoded lines
+    """
+    return [_worker_bpe.encode_line(line) for line in lines]
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from functools import lru_cache
+
+# full width characters are half width ones shifted by this offset
+WIDTH_OFFSET = 65248
+FULL_SPACE = 12288
+HALF_SPACE = 32
+
+# str.translate tables, code point to string
+FULL_TO_HALF = {code: chr(code - WIDTH_OFFSET) for code in range(65281, 65375)}
+FULL_TO_HALF[FULL_SPACE] = chr(HALF_SPACE)
+
+HALF_TO_FULL = {code: chr(code + WIDTH_OFFSET) for code in range(33, 127)}
+HALF_TO_FULL[HALF_SPACE] = chr(FULL_SPACE)
+
+# digits and letters only
+NUMBER_LETTER_CODES = list(range(48, 58)) + list(range(65, 91)) + list(range(97, 123))
+NUMBER_LETTER_TO_HALF = {code + WIDTH_OFFSET: chr(code) for code in NUMBER_LETTER_CODES}
+NUMBER_LETTER_TO_FULL = {code: chr(code + WIDTH_OFFSET) for code in NUMBER_LETTER_CODES}
+
+# code points of basic multilingual plane map to themselves
+IDENTITY = list(range(0x10000))
+
+# greek capital sigma lowers depending on its position in word, left to str.lower
+CONTEXT_CASE_CODES = {931}
+
+
+@lru_cache(maxsize=2)
+def case_table(lower=True):
+    """
+    build table of per character case conversion, built once on first use,
+    lower case table leaves capital sigma unchanged, use str.lower if it matters
+    :param lower: lower case table if True else upper case table
+    :return: translate table
+    """
+    table = {}
+    for code in range(0x110000):
+        if code in CONTEXT_CASE_CODES:
+            continue
+        char = chr(code)
+        converted = char.lower() if lower else char.upper()
+        if converted != char:
+            table[code] = converted
+    return table
+
+
+def compose_tables(*tables):
+    """
+    combine translate tables into one table applying them in order
+    :param tables: translate tables, values are strings, code points or None
+    :return: translate table
+    """
+    composed = {}
+    for table in tables:
+        # characters produced so far are converted by this table too
+        for code, value in composed.items():
+            if value:
+                composed[code] = value.translate(table)
+        for code, value in table.items():
+            if code not in composed:
+                composed[code] = chr(value) if isinstance(value, int) else value
+    return composed
+
+
+def dense_table(table):
+    """
+    convert translate table to list indexed by code point, str.translate reads list faster than dict
+    :param table: translate table
+    :return: list, code points beyond it are kept unchanged
+    """
+    size = max(len(IDENTITY), max(table) + 1 if table else 0)
+    dense = IDENTITY + list(range(len(IDENTITY), size))
+    for code, value in table.items():
+        dense[code] = value
+    return dense
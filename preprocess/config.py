@@ -44,6 +44,9 @@ TIME_PLACEHOLDER = 'time'
 
 SEGMENT_JOIN_FLAG = ' '
 
+# max number of recent segmentations kept by Segmenter
+SEGMENT_CACHE_SIZE = 10000
+
 SEGMENT_WORDS = [
     EMAIL_PLACEHOLDER,
     PHONE_PLACEHOLDER,
@@ -0,0 +1,43 @@
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+
+def chunks(data, chunk_size):
+    """
+    split data to chunks
+    :param data: iterable, consumed lazily
+    :param chunk_size: number of items per chunk
+    :return: generator of list
+    """
+    chunk = []
+    for item in data:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ordered_map(func, chunks, processes, initializer=None, initargs=(), threads=False):
+    """
+    map func over chunks in process pool, keep order, at most two chunks per worker are pending,
+    Pool.imap reads all input ahead instead
+    :param func: picklable function of chunk
+    :param chunks: iterable of chunk, consumed lazily
+    :param processes: number of worker processes
+    :param initializer: called once in each worker
+    :param initargs: arguments of initializer
+    :param threads: run func in threads instead, for io bound func such as http requests
+    :return: generator of func results
+    """
+    pool_class = ThreadPool if threads else Pool
+    with pool_class(processes, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(func, (chunk,)))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
@@ -2,8 +2,20 @@
 # -*- coding: utf-8 -*-
 
 import re
+import sys
+from itertools import chain
+from multiprocessing import cpu_count
 from . import config
-import jieba
+from .parallel import chunks, ordered_map
+from .chars import FULL_TO_HALF, HALF_TO_FULL, NUMBER_LETTER_TO_HALF, NUMBER_LETTER_TO_FULL, case_table, \
+    compose_tables, dense_table
+from .segment import Segmenter
+
+# private parser of re, its output layout is checked by check_parser on import
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
 
 
 class Pipeline(object):
@@ -33,6 +45,27 @@ class Pipeline(object):
         :return: text
         """
         raise NotImplementedError
+    
+    def setup(self):
+        """
+        load resources needed by process_text, called again in each worker process
+        :return: None
+        """
+        pass
+    
+    def rules(self):
+        """
+        get regex rules equal to process_text, used to fuse regex pipelines
+        :return: list of (pattern, replacement), None if pipeline is not regex based
+        """
+        return None
+    
+    def table(self):
+        """
+        get str.translate table equal to process_text, used to fuse character conversions
+        :return: translate table, None if pipeline is not per character
+        """
+        return None
 
 
 class StripPipeline(Pipeline):
@@ -57,6 +90,13 @@ class UrlPipeline(Pipeline):
         :return: text containing url placeholder
         """
         return re.sub(self.regex, self.placeholder, text, flags=re.S)
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return [(self.regex, self.placeholder)]
 
 
 class RemovePipeline(Pipeline):
@@ -72,6 +112,13 @@ class RemovePipeline(Pipeline):
         for pattern in self.patterns:
             text = re.sub(pattern, '', text, flags=re.S)
         return text
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return [(pattern, '') for pattern in self.patterns]
 
 
 class ReplacePipeline(Pipeline):
@@ -87,6 +134,13 @@ class ReplacePipeline(Pipeline):
         for pattern in self.patterns:
             text = re.sub(pattern[0], pattern[1], text, flags=re.S)
         return text
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return [(pattern[0], pattern[1]) for pattern in self.patterns]
 
 
 class PhonePipeline(Pipeline):
@@ -101,6 +155,13 @@ class PhonePipeline(Pipeline):
         :return: text containing phone placeholder
         """
         return re.sub(self.regex, self.placeholder, text, flags=re.S)
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return [(self.regex, self.placeholder)]
 
 
 class EmailPipeline(Pipeline):
@@ -111,17 +172,35 @@ class EmailPipeline(Pipeline):
         :return: text containing email placeholder
         """
         return re.sub(config.EMAIL_REGEX, config.EMAIL_PLACEHOLDER, text, flags=re.S)
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return [(config.EMAIL_REGEX, config.EMAIL_PLACEHOLDER)]
 
 
 class JiebaPipeline(Pipeline):
-    def __init__(self, join_flag=config.SEGMENT_JOIN_FLAG, words=config.SEGMENT_WORDS):
+    def __init__(self, join_flag=config.SEGMENT_JOIN_FLAG, words=config.SEGMENT_WORDS, cache_file=None,
+                 cache_size=config.SEGMENT_CACHE_SIZE):
         """
-        add user dict
+        load dictionary and add user dict
+        :param join_flag: separator of words
+        :param words: user words
+        :param cache_file: path of prebuilt jieba dictionary cache
+        :param cache_size: max number of recent segmentations kept
         """
         self.join_flag = join_flag
         self.words = words
-        for word in self.words:
-            jieba.add_word(word)
+        self.segmenter = Segmenter(words, cache_file=cache_file, cache_size=cache_size, join_flag=join_flag)
+    
+    def setup(self):
+        """
+        load jieba dictionary and add user words, segmenter is pickled to workers without dictionary
+        :return: None
+        """
+        self.segmenter.setup()
     
     def process_text(self, text):
         """
@@ -129,7 +208,7 @@ class JiebaPipeline(Pipeline):
         :param text: text before segment cut
         :return: text joined with flag after segment
         """
-        return self.join_flag.join(jieba.cut(text))
+        return self.segmenter.segment(text)
 
 
 class CharPipeline(Pipeline):
@@ -159,21 +238,15 @@ class MaxPipeline(Pipeline):
 
 
 class HalfWidthPipeline(Pipeline):
+    TABLE = dense_table(FULL_TO_HALF)
+    
     def f2h(self, f_str):
         """
         transfer full width to half width
         :param f_str:
         :return:
         """
-        h_str = ''
-        for uchar in f_str:
-            inside_code = ord(uchar)
-            if inside_code == 12288:
-                inside_code = 32
-            elif inside_code >= 65281 and inside_code <= 65374:
-                inside_code -= 65248
-            h_str += chr(inside_code)
-        return h_str
+        return f_str.translate(self.TABLE)
     
     def process_text(self, text):
         """
@@ -182,24 +255,24 @@ class HalfWidthPipeline(Pipeline):
         :return: text contains full width
         """
         return self.f2h(text)
+    
+    def table(self):
+        """
+        get translate table
+        :return: translate table
+        """
+        return FULL_TO_HALF
 
 
 class FullWidthPipeline(Pipeline):
+    TABLE = dense_table(HALF_TO_FULL)
+    
     def h2f(self, h_str):
         """
         transfer half width to full width
         :return:
         """
-        f_str = ''
-        for uchar in h_str:
-            inside_code = ord(uchar)
-            if inside_code == 32:
-                inside_code = 12288
-            elif inside_code >= 32 and inside_code <= 126:
-                inside_code += 65248
-            
-            f_str += chr(inside_code)
-        return f_str
+        return h_str.translate(self.TABLE)
     
     def process_text(self, text):
         """
@@ -208,40 +281,51 @@ class FullWidthPipeline(Pipeline):
         :return: text contains full width
         """
         return self.h2f(text)
+    
+    def table(self):
+        """
+        get translate table
+        :return: translate table
+        """
+        return HALF_TO_FULL
 
 
 class NumberLetterHalfPipeline(Pipeline):
+    TABLE = dense_table(NUMBER_LETTER_TO_HALF)
+    
     def process_text(self, text):
         """
         transfer number letter to half width
         :param text:
         :return:
         """
-        result = ''
-        for c in text:
-            inside_code = ord(c)
-            if 65296 <= inside_code <= 65305 or 65345 <= inside_code <= 65370 or 65313 <= inside_code <= 65338:
-                inside_code = inside_code - 65248
-                c = chr(inside_code)
-            result += c
-        return result
+        return text.translate(self.TABLE)
+    
+    def table(self):
+        """
+        get translate table
+        :return: translate table
+        """
+        return NUMBER_LETTER_TO_HALF
 
 
 class NumberLetterFullPipeline(Pipeline):
+    TABLE = dense_table(NUMBER_LETTER_TO_FULL)
+    
     def process_text(self, text):
         """
         transfer number letter to full width
         :param text:
         :return:
         """
-        result = ''
-        for c in text:
-            inside_code = ord(c)
-            if 48 <= inside_code <= 57 or 97 <= inside_code <= 122 or 65 <= inside_code <= 90:
-                inside_code = inside_code + 65248
-                c = chr(inside_code)
-            result += c
-        return result
+        return text.translate(self.TABLE)
+    
+    def table(self):
+        """
+        get translate table
+        :return: translate table
+        """
+        return NUMBER_LETTER_TO_FULL
 
 
 class LowerPipeline(Pipeline):
@@ -262,6 +346,13 @@ class UpperPipeline(Pipeline):
         :return:
         """
         return text.upper()
+    
+    def table(self):
+        """
+        get translate table, upper case of each character does not depend on context
+        :return: translate table
+        """
+        return case_table(lower=False)
 
 
 class DatePipeline(Pipeline):
@@ -277,6 +368,13 @@ class DatePipeline(Pipeline):
         for pattern in self.patterns:
             text = re.sub(pattern, config.DATE_PLACEHOLDER, text, flags=re.S)
         return text
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return [(pattern, config.DATE_PLACEHOLDER) for pattern in self.patterns]
 
 
 class TimePipeline(Pipeline):
@@ -292,3 +390,460 @@ class TimePipeline(Pipeline):
         for pattern in self.patterns:
             text = re.sub(pattern, config.TIME_PLACEHOLDER, text, flags=re.S)
         return text
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return [(pattern, config.TIME_PLACEHOLDER) for pattern in self.patterns]
+
+
+class TranslatePipeline(Pipeline):
+    def __init__(self, tables):
+        """
+        combine character conversions into one translate table
+        :param tables: list of translate tables, applied in order
+        """
+        self.tables = list(tables)
+        self.composed = compose_tables(*self.tables)
+        self.dense = dense_table(self.composed)
+    
+    def process_text(self, text):
+        """
+        convert all characters in one pass
+        :param text: text before conversion
+        :return: text after conversion
+        """
+        return text.translate(self.dense)
+    
+    def table(self):
+        """
+        get translate table
+        :return: translate table
+        """
+        return self.composed
+
+
+def required_literal(pattern, flags=re.S):
+    """
+    get a character every match of pattern contains, rule can be skipped if text does not contain it
+    :param pattern: regex pattern
+    :param flags: regex flags
+    :return: character, None if not found
+    """
+    if re.compile(pattern, flags).flags & re.I:
+        return None
+    items = sre_parse.parse(pattern, flags)
+    while True:
+        for op, av in items:
+            if op == sre_parse.LITERAL:
+                return chr(av)
+        # descend into pattern wrapped by one group
+        if len(items) == 1 and items[0][0] == sre_parse.SUBPATTERN:
+            items = items[0][1][-1]
+            continue
+        return None
+
+
+# pattern of each category sre_parse may put in a character set
+CATEGORY_PATTERNS = {
+    sre_parse.CATEGORY_DIGIT: r'\d',
+    sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s',
+    sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w',
+    sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+
+# anchors looking at no character around them
+PLAIN_ANCHORS = (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END_STRING)
+
+
+def char_may_match(op, av, char):
+    """
+    check if single character item of parsed pattern may match char, unknown items may
+    :param op: item opcode
+    :param av: item argument
+    :param char: character
+    :return: bool
+    """
+    if op == sre_parse.LITERAL:
+        return ord(char) == av
+    if op == sre_parse.NOT_LITERAL:
+        return ord(char) != av
+    if op == sre_parse.IN:
+        negate = bool(av) and av[0][0] == sre_parse.NEGATE
+        for item_op, item_av in av[1:] if negate else av:
+            if item_op == sre_parse.LITERAL:
+                found = ord(char) == item_av
+            elif item_op == sre_parse.RANGE:
+                found = item_av[0] <= ord(char) <= item_av[1]
+            elif item_op == sre_parse.CATEGORY and item_av in CATEGORY_PATTERNS:
+                found = re.match(CATEGORY_PATTERNS[item_av], char) is not None
+            else:
+                return True
+            if found:
+                return not negate
+        return negate
+    return True
+
+
+def pattern_may_touch(pattern, chars, flags=re.S):
+    """
+    check if pattern may match or look at any of chars, answers True when unsure
+    :param pattern: regex pattern or parsed items
+    :param chars: set of characters
+    :param flags: regex flags
+    :return: bool
+    """
+    if isinstance(pattern, str):
+        if re.compile(pattern, flags).flags & re.I:
+            return True
+        items = sre_parse.parse(pattern, flags)
+        # empty matches depend on where scan resumes after replacements
+        if items.getwidth()[0] == 0:
+            return True
+        pattern = items
+    for op, av in pattern:
+        if op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.IN, sre_parse.ANY):
+            if any(char_may_match(op, av, char) for char in chars):
+                return True
+        elif op == sre_parse.SUBPATTERN:
+            # av: (group, add_flags, del_flags, items)
+            if av[1] & re.I or pattern_may_touch(av[-1], chars, flags):
+                return True
+        elif op == sre_parse.BRANCH:
+            if any(pattern_may_touch(items, chars, flags) for items in av[1]):
+                return True
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            if pattern_may_touch(av[2], chars, flags):
+                return True
+        elif op == sre_parse.ASSERT:
+            if pattern_may_touch(av[1], chars, flags):
+                return True
+        elif op == sre_parse.AT:
+            if av not in PLAIN_ANCHORS and (av != sre_parse.AT_END or '\n' in chars):
+                return True
+        else:
+            # negative lookarounds, word boundaries, group references...
+            return True
+    return False
+
+
+def check_parser():
+    """
+    check sre_parse output has the layout required_literal and pattern_may_touch read, internals of re change
+    between python versions, fail loudly instead of fusing rules differently from chain
+    :return: None
+    """
+    checks = [
+        (required_literal('(a)'), 'a'),
+        (required_literal('x(y)'), 'x'),
+        (required_literal('x|y'), None),
+        (pattern_may_touch('[^a-c]\\d+', {'a'}), False),
+        (pattern_may_touch('[^a-c]\\d+', {'5'}), True),
+        (pattern_may_touch('(?:ab)*c', {'b'}), True),
+        (pattern_may_touch('(?:ab)*c|d', {'z'}), False),
+        (pattern_may_touch('a(?=b)', {'b'}), True),
+        (pattern_may_touch('a\\b', {'z'}), True),
+    ]
+    if any(result != expected for result, expected in checks):
+        raise RuntimeError('Unsupported regex parser of python %s, rules can not be fused' % sys.version)
+
+
+check_parser()
+
+
+class RuleConflict(Exception):
+    """Earlier rule may match inside match of later rule, single scan differs from chain."""
+    pass
+
+
+class RegexPipeline(Pipeline):
+    # name of group wrapping each rule in combined regex
+    GROUP_PREFIX = 'rule'
+    
+    def __init__(self, rules, flags=re.S):
+        """
+        compile rules into one alternation of named groups, replace all of them in one scan
+        replacements are processed by following rules, as chained re.sub does, following rules
+        must not match or look at characters of replacements, see fuse_rules
+        :param rules: list of (pattern, replacement), applied in order like chained re.sub
+        :param flags: regex flags
+        """
+        self.replacements = list(rules)
+        self.flags = flags
+        self.compiled = [re.compile(pattern, flags) for pattern, _ in self.replacements]
+        self.literals = [required_literal(pattern, flags) for pattern, _ in self.replacements]
+        self.regex = None
+        # numbered back references are shifted in combined regex, keep chain for them
+        if len(self.replacements) > 1 and not any(re.search(r'\\[1-9]', pattern) for pattern, _ in self.replacements):
+            try:
+                self.regex = self.combine(range(len(self.replacements)))
+            except re.error:
+                pass
+        # number of texts processed by chain after RuleConflict
+        self.conflicts = 0
+        # combined regex of rules may match in text, by rule indexes
+        self.regexes = {}
+        self.prefixes = {}
+        self.tails = {}
+        # constant replacements processed by following rules, computed once
+        self.constants = [None] * len(self.replacements)
+        for index, (_, replacement) in enumerate(self.replacements):
+            if self.regex is not None and not callable(replacement) and '\\' not in replacement:
+                self.constants[index] = self.tail(index + 1).process_text(replacement) \
+                    if index + 1 < len(self.replacements) else replacement
+    
+    def __str__(self):
+        """
+        get class name and number of rules
+        :return:
+        """
+        return '%s(%d rules)' % (self.__class__.__name__, len(self.replacements))
+    
+    def rules(self):
+        """
+        get regex rules
+        :return: list of (pattern, replacement)
+        """
+        return self.replacements
+    
+    def combine(self, indexes):
+        """
+        compile rules to one alternation, each rule in group named by its index
+        :param indexes: rule indexes
+        :return: compiled regex
+        """
+        return re.compile('|'.join('(?P<%s%d>%s)' % (self.GROUP_PREFIX, index, self.replacements[index][0])
+                                   for index in indexes), self.flags)
+    
+    def prefix(self, index):
+        """
+        get regex of rules before index
+        :param index: rule index
+        :return: compiled regex
+        """
+        if index not in self.prefixes:
+            self.prefixes[index] = re.compile('|'.join('(?:%s)' % pattern for pattern, _ in
+                                                       self.replacements[:index]), self.flags)
+        return self.prefixes[index]
+    
+    def tail(self, index):
+        """
+        get pipeline of rules from index
+        :param index: rule index
+        :return: RegexPipeline
+        """
+        if index not in self.tails:
+            self.tails[index] = RegexPipeline(self.replacements[index:], self.flags)
+        return self.tails[index]
+    
+    def replace(self, match):
+        """
+        replace match of combined regex
+        :param match: match object
+        :return: replacement processed by following rules
+        """
+        index = int(match.lastgroup[len(self.GROUP_PREFIX):])
+        start, end = match.span()
+        text = match.string
+        # chain would apply earlier rule first if it matches inside this match
+        if index > 0:
+            prefix = self.prefix(index)
+            for pos in range(start + 1, end):
+                if prefix.match(text, pos):
+                    raise RuleConflict()
+        if self.constants[index] is not None:
+            return self.constants[index]
+        rule_match = self.compiled[index].match(text, start)
+        if rule_match is None or rule_match.end() != end:
+            raise RuleConflict()
+        replacement = self.replacements[index][1]
+        result = replacement(rule_match) if callable(replacement) else rule_match.expand(replacement)
+        if result and index + 1 < len(self.replacements):
+            result = self.tail(index + 1).process_text(result)
+        return result
+    
+    def process_rules(self, text):
+        """
+        apply rules one by one like chained pipelines
+        :param text: text before replacement
+        :return: text after replacement
+        """
+        for compiled, (_, replacement) in zip(self.compiled, self.replacements):
+            text = compiled.sub(replacement, text)
+        return text
+    
+    def process_text(self, text):
+        """
+        apply all rules in one scan, fall back to chain on conflict
+        :param text: text before replacement
+        :return: text after replacement
+        """
+        if self.regex is None:
+            return self.process_rules(text)
+        # skip rules whose required character is missing
+        indexes = tuple(index for index, literal in enumerate(self.literals) if literal is None or literal in text)
+        if not indexes:
+            return text
+        if indexes not in self.regexes:
+            self.regexes[indexes] = self.combine(indexes)
+        try:
+            return self.regexes[indexes].sub(self.replace, text)
+        except RuleConflict:
+            self.conflicts += 1
+            return self.process_rules(text)
+
+
+def fuse_rules(rules):
+    """
+    split rules to RegexPipelines, chain applies each rule to text replaced by earlier rules,
+    single scan matches original text, so a rule that may match or look at characters of earlier
+    constant replacements in its pipeline starts a new pipeline, a rule not replaced by constant
+    text ends its pipeline, as its replacement may join text around it
+    :param rules: list of (pattern, replacement)
+    :return: list of RegexPipeline
+    """
+    fused, group, replaced = [], [], set()
+    for pattern, replacement in rules:
+        if group and pattern_may_touch(pattern, replaced):
+            fused.append(RegexPipeline(group))
+            group, replaced = [], set()
+        group.append((pattern, replacement))
+        if callable(replacement) or not replacement or '\\' in replacement:
+            fused.append(RegexPipeline(group))
+            group, replaced = [], set()
+        else:
+            replaced.update(replacement)
+    if group:
+        fused.append(RegexPipeline(group))
+    return fused
+
+
+def fuse_pipelines(pipelines):
+    """
+    merge consecutive regex pipelines into RegexPipelines, consecutive character conversions
+    into one TranslatePipeline
+    :param pipelines: list of pipelines
+    :return: list of pipelines
+    """
+    fused, rules, tables = [], [], []
+    for pipeline in pipelines:
+        pipeline_rules, pipeline_table = pipeline.rules(), pipeline.table()
+        if pipeline_rules is None:
+            fused.extend(fuse_rules(rules))
+            rules = []
+        if pipeline_table is None and tables:
+            fused.append(TranslatePipeline(tables))
+            tables = []
+        if pipeline_rules is not None:
+            rules.extend(pipeline_rules)
+        elif pipeline_table is not None:
+            tables.append(pipeline_table)
+        else:
+            fused.append(pipeline)
+    fused.extend(fuse_rules(rules))
+    if tables:
+        fused.append(TranslatePipeline(tables))
+    return fused
+
+
+# pipelines of current worker process, set by worker initializer
+_worker_pipelines = []
+
+
+def _init_worker(pipelines):
+    """
+    set up pipelines once per worker process
+    :param pipelines: list of pipelines
+    :return: None
+    """
+    global _worker_pipelines
+    for pipeline in pipelines:
+        pipeline.setup()
+    _worker_pipelines = pipelines
+
+
+def _process_chunk(chunk):
+    """
+    process chunk of text by pipelines of worker
+    :param chunk: list of text
+    :return: list of text
+    """
+    return [process_pipelines(_worker_pipelines, text) for text in chunk]
+
+
+def process_pipelines(pipelines, text):
+    """
+    process text by pipelines one by one
+    :param pipelines: list of pipelines
+    :param text: text
+    :return: text
+    """
+    for pipeline in pipelines:
+        text = pipeline.process_text(text)
+    return text
+
+
+class ParallelPipeline(Pipeline):
+    def __init__(self, pipelines, processes=None, chunk_size=1000):
+        """
+        fuse pipelines into one per text function, run over chunks in process pool
+        :param pipelines: list of pipelines, applied in order, consecutive regex pipelines run in one scan
+        :param processes: number of worker processes, None for cpu count, 1 to run in current process
+        :param chunk_size: number of texts sent to worker at once
+        """
+        self.pipelines = fuse_pipelines(pipelines)
+        self.processes = processes or cpu_count()
+        self.chunk_size = chunk_size
+    
+    def __str__(self):
+        """
+        get names of fused pipelines
+        :return:
+        """
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(map(str, self.pipelines)))
+    
+    def process_text(self, text):
+        """
+        process text by all pipelines
+        :param text: text
+        :return: text
+        """
+        return process_pipelines(self.pipelines, text)
+    
+    def process_iter(self, data):
+        """
+        process data in worker processes, keep order
+        :param data: iterable of text, consumed lazily
+        :return: generator of text
+        """
+        if self.processes <= 1:
+            for text in data:
+                yield self.process_text(text)
+            return
+        for chunk in ordered_map(_process_chunk, chunks(data, self.chunk_size), self.processes,
+                                 initializer=_init_worker, initargs=(self.pipelines,)):
+            for text in chunk:
+                yield text
+    
+    def process_pairs(self, pairs):
+        """
+        process sources and summaries of records in worker processes, keep order
+        :param pairs: iterable of (source, summary), consumed lazily
+        :return: iterator of (source, summary)
+        """
+        texts = self.process_iter(chain.from_iterable(pairs))
+        return zip(texts, texts)
+    
+    def process_all(self, data):
+        """
+        process all data in worker processes, keep order
+        :param data: array of text
+        :return: array of text
+        """
+        if len(data) <= self.chunk_size:
+            return [self.process_text(text) for text in data]
+        return list(self.process_iter(data))
@@ -0,0 +1,106 @@
+import re
+import json
+from itertools import zip_longest
+from utils.shards import open_data
+
+LCSTS_DOC_PATTERN = re.compile('<doc id=(\d+)>.*?<summary>(.*?)</summary>.*?<short_text>(.*?)</short_text>.*?</doc>',
+                               re.S)
+LCSTS_LABEL_PATTERN = re.compile('<human_label>(.*?)</human_label>', re.S)
+
+
+def read_lines(filename):
+    """
+    read stripped lines of file one by one
+    :param filename: file path, plain, compressed or sharded
+    :return: generator of line
+    """
+    with open_data(filename) as f:
+        for line in f:
+            yield line.strip()
+
+
+def read_blocks(filename, start='<doc', end='</doc>'):
+    """
+    read file block by block, only one block is kept in memory
+    :param filename: file path
+    :param start: sign of block start
+    :param end: sign of block end
+    :return: generator of block text
+    """
+    lines = []
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            if not lines and start not in line:
+                continue
+            lines.append(line)
+            if end in line:
+                yield ''.join(lines)
+                lines = []
+
+
+def read_lcsts(filename, min_label=None):
+    """
+    read LCSTS PART_I, PART_II or PART_III xml doc by doc
+    :param filename: path of PART_*.txt
+    :param min_label: keep docs whose human label >= min_label, None to keep all
+    :return: generator of (source, summary)
+    """
+    for block in read_blocks(filename):
+        match = re.search(LCSTS_DOC_PATTERN, block)
+        if not match:
+            continue
+        if min_label is not None:
+            label = re.search(LCSTS_LABEL_PATTERN, block)
+            if not label or int(label.group(1).strip()) < min_label:
+                continue
+        yield match.group(3).strip(), match.group(2).strip()
+
+
+def read_json_lines(filename, source_key, summary_key):
+    """
+    read json lines file line by line
+    :param filename: file path
+    :param source_key: key of source
+    :param summary_key: key of summary, empty summary if missing
+    :return: generator of (source, summary)
+    """
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            yield item[source_key].strip(), item.get(summary_key, '').strip()
+
+
+def read_bytecup(filename):
+    """
+    read Bytecup corpus, validation and test sets have no title
+    :param filename: path of bytecup.corpus.*.txt
+    :return: generator of (content, title)
+    """
+    return read_json_lines(filename, 'content', 'title')
+
+
+def read_nlpcc(filename):
+    """
+    read NLPCC summarization corpus
+    :param filename: path of json lines file
+    :return: generator of (article, summarization)
+    """
+    return read_json_lines(filename, 'article', 'summarization')
+
+
+def read_parallel(source_file, summary_file):
+    """
+    read aligned source and summary files line by line
+    :param source_file: path of sources, one per line, plain, compressed or sharded
+    :param summary_file: path of summaries, one per line, plain, compressed or sharded
+    :return: generator of (source, summary)
+    """
+    with open_data(source_file) as sources, open_data(summary_file) as summaries:
+        for source, summary in zip_longest(sources, summaries):
+            if source is None or summary is None:
+                raise ValueError('Lines mismatch! %s and %s have different number of lines' %
+                                 (source_file, summary_file))
+            yield source.strip(), summary.strip()
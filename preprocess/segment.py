@@ -0,0 +1,178 @@
+from collections import OrderedDict
+from . import config
+from .parallel import chunks, ordered_map
+import jieba
+
+
+class LRUCache():
+    """Bounded mapping, least recently used item is dropped when full."""
+    
+    def __init__(self, max_size=config.SEGMENT_CACHE_SIZE):
+        """
+        init cache
+        :param max_size: max number of items, 0 to disable cache
+        """
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def get(self, key):
+        """
+        get item and mark it as recently used
+        :param key: key
+        :return: value, None if missing
+        """
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items.move_to_end(key)
+        return value
+    
+    def put(self, key, value):
+        """
+        put item, drop least recently used item if full
+        :param key: key
+        :param value: value
+        :return: None
+        """
+        if not self.max_size:
+            return
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+    
+    def clear(self):
+        self.items.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class Segmenter():
+    """Jieba segmentation loaded eagerly, with LRU of recent results and batches cut in worker processes."""
+    
+    def __init__(self, words=config.SEGMENT_WORDS, dictionary=None, cache_file=None,
+                 cache_size=config.SEGMENT_CACHE_SIZE, join_flag=config.SEGMENT_JOIN_FLAG, remove_spaces=False):
+        """
+        init segmenter and load dictionary
+        :param words: user words added to dictionary
+        :param dictionary: path of main dictionary, None for jieba default dictionary
+        :param cache_file: path of prebuilt dictionary cache, built there on first load if missing,
+            None for jieba default cache in temp dir
+        :param cache_size: max number of texts kept in LRU, 0 to disable
+        :param join_flag: separator of words in segmented text
+        :param remove_spaces: remove join flag from text before segment, for text segmented already
+        """
+        self.words = words
+        self.dictionary = dictionary
+        self.cache_file = cache_file
+        self.cache_size = cache_size
+        self.join_flag = join_flag
+        self.remove_spaces = remove_spaces
+        self.tokenizer = None
+        self.cache = LRUCache(cache_size)
+        self.setup()
+    
+    def __getstate__(self):
+        """
+        pickle options only, dictionary is loaded again by worker instead of being sent
+        :return: state dict
+        """
+        state = self.__dict__.copy()
+        state['tokenizer'] = None
+        state['cache'] = LRUCache(self.cache_size)
+        return state
+    
+    def setup(self):
+        """
+        load dictionary and add user words, only once
+        :return: None
+        """
+        if self.tokenizer is not None:
+            return
+        tokenizer = jieba.Tokenizer(self.dictionary) if self.dictionary else jieba.Tokenizer()
+        if self.cache_file:
+            tokenizer.cache_file = self.cache_file
+        tokenizer.initialize()
+        for word in self.words:
+            tokenizer.add_word(word)
+        self.tokenizer = tokenizer
+    
+    def normalize(self, text):
+        """
+        normalize text used as cache key and segment input, text is not stripped, jieba keeps its spaces
+        :param text: text
+        :return: text
+        """
+        if self.remove_spaces:
+            text = text.replace(self.join_flag, '')
+        return text
+    
+    def cut(self, text):
+        """
+        segment text to words, recent results are kept in LRU
+        :param text: text before segment cut
+        :return: tuple of words
+        """
+        text = self.normalize(text)
+        words = self.cache.get(text)
+        if words is None:
+            self.setup()
+            words = tuple(self.tokenizer.cut(text))
+            self.cache.put(text, words)
+        return words
+    
+    def segment(self, text):
+        """
+        segment text
+        :param text: text before segment cut
+        :return: text joined with flag after segment
+        """
+        return self.join_flag.join(self.cut(text))
+    
+    def segment_batch(self, texts, processes=1, chunk_size=1000):
+        """
+        segment texts, in worker processes if processes > 1, keep order
+        :param texts: iterable of text, consumed lazily
+        :param processes: number of worker processes, each loads dictionary once
+        :param chunk_size: number of texts sent to worker at once
+        :return: generator of segmented text
+        """
+        if processes <= 1:
+            for text in texts:
+                yield self.segment(text)
+            return
+        for chunk in ordered_map(_segment_chunk, chunks(texts, chunk_size), processes,
+                                 initializer=_init_worker, initargs=(self,)):
+            for text in chunk:
+                yield text
+
+
+# segmenter of current worker process, cache is kept across chunks
+_worker_segmenter = None
+
+
+def _init_worker(segmenter):
+    """
+    load dictionary once per worker process
+    :param segmenter: segmenter pickled without dictionary
+    :return: None
+    """
+    global _worker_segmenter
+    segmenter.setup()
+    _worker_segmenter = segmenter
+
+
+def _segment_chunk(texts):
+    """
+    segment chunk of texts by segmenter of worker
+    :param texts: list of text
+    :return: list of segmented text
+    """
+    return [_worker_segmenter.segment(text) for text in texts]
@@ -0,0 +1,46 @@
+import hashlib
+
+# names of splits, ratios of eval and test are given, train takes the rest
+SPLITS = ('train', 'eval', 'test')
+
+
+def hash_fraction(text, seed=''):
+    """
+    map text to stable fraction by md5, same on every run and machine
+    :param text: text
+    :param seed: salt of hash, change it to draw another split
+    :return: float in [0, 1)
+    """
+    digest = hashlib.md5((seed + text).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / float(1 << 64)
+
+
+def assign_split(text, eval_ratio, test_ratio, seed=''):
+    """
+    assign text to split by its hash
+    :param text: text, records with same text always fall into same split
+    :param eval_ratio: expected ratio of eval split
+    :param test_ratio: expected ratio of test split
+    :param seed: salt of hash
+    :return: name of split
+    """
+    fraction = hash_fraction(text, seed)
+    if fraction < eval_ratio:
+        return 'eval'
+    if fraction < eval_ratio + test_ratio:
+        return 'test'
+    return 'train'
+
+
+def split_pairs(pairs, eval_ratio, test_ratio, seed=''):
+    """
+    assign records to splits by hash of source, no shuffle in memory
+    :param pairs: iterable of (source, summary), consumed lazily
+    :param eval_ratio: expected ratio of eval split
+    :param test_ratio: expected ratio of test split
+    :param seed: salt of hash
+    :return: generator of (split, source, summary)
+    """
+    assert 0 <= eval_ratio and 0 <= test_ratio and eval_ratio + test_ratio <= 1, 'Invalid split ratios'
+    for source, summary in pairs:
+        yield assign_split(source, eval_ratio, test_ratio, seed), source, summary
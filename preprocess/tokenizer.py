@@ -0,0 +1,244 @@
+import re
+import json
+import time
+import threading
+from bisect import bisect_right
+from .chars import FULL_TO_HALF, dense_table
+from .parallel import chunks, ordered_map
+
+F2H_TABLE = dense_table(FULL_TO_HALF)
+
+# english tokens close to PTB tokenizer of CoreNLP, tried in order:
+# url, email, abbreviation, formatted number, word before n't, n't, clitic, word, dashes and ellipsis, punctuation
+TOKEN_PATTERN = re.compile(r"""
+    https?://[^\s]+?(?=[.,;:!?)\]'"]*(?:\s|$))
+    | \w[\w.+-]*@\w[\w.-]*\w
+    | (?:[a-z]\.){2,}
+    | \d+(?:[.,:/]\d+)+(?!\w)
+    | \w+(?=n't\b)
+    | n't\b
+    | '(?:s|re|ve|ll|d|m)\b
+    | \w+(?:-\w+)*
+    | -{2,} | \.{2,}
+    | [^\w\s]
+""", re.I | re.X)
+
+# documents of one request are joined by blank line, which always breaks sentence
+DOC_SEPARATOR = '\n\n'
+CORENLP_PROPERTIES = {
+    'annotators': 'tokenize,ssplit',
+    'ssplit.newlineIsSentenceBreak': 'two',
+    'outputFormat': 'json',
+}
+
+
+def normalize(text):
+    """
+    normalize text before tokenize, strip, lower and convert full width chars to half width
+    :param text: text
+    :return: text
+    """
+    return text.strip().lower().translate(F2H_TABLE)
+
+
+def utf16_length(text):
+    """
+    get length of text counted as CoreNLP does, chars out of BMP take two units in java strings
+    :param text: text
+    :return: number of utf-16 units
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+class RegexTokenizer(object):
+    """Pure python tokenizer by TOKEN_PATTERN, no server needed."""
+    
+    def __init__(self, processes=1, chunk_size=10000):
+        """
+        init tokenizer
+        :param processes: number of worker processes
+        :param chunk_size: number of texts sent to worker at once
+        """
+        self.processes = processes
+        self.chunk_size = chunk_size
+    
+    def tokenize(self, text):
+        """
+        split text to tokens
+        :param text: text
+        :return: list of tokens
+        """
+        return TOKEN_PATTERN.findall(text)
+    
+    def tokenize_batch(self, texts):
+        """
+        tokenize texts
+        :param texts: list of text
+        :return: list of tokens joined with space
+        """
+        return [' '.join(self.tokenize(text)) for text in texts]
+    
+    def tokenize_lines(self, lines):
+        """
+        tokenize lines, in worker processes if processes > 1, keep order
+        :param lines: iterable of text, consumed lazily
+        :return: generator of tokens joined with space
+        """
+        if self.processes <= 1:
+            for line in lines:
+                yield ' '.join(self.tokenize(line))
+            return
+        for batch in ordered_map(_tokenize_chunk, chunks(lines, self.chunk_size), self.processes):
+            for line in batch:
+                yield line
+
+
+def _tokenize_chunk(texts):
+    """
+    tokenize chunk of texts in worker
+    :param texts: list of text
+    :return: list of tokens joined with space
+    """
+    return RegexTokenizer().tokenize_batch(texts)
+
+
+class CoreNLPError(Exception):
+    def __init__(self, message, rejected=False):
+        """
+        init error
+        :param message: message
+        :param rejected: server answered with error, so documents of request may be bad, otherwise server is down
+        """
+        super(CoreNLPError, self).__init__(message)
+        self.rejected = rejected
+
+
+class CoreNLPTokenizer(object):
+    """Tokenize batches of documents by CoreNLP server, several requests in flight over pooled connections."""
+    
+    def __init__(self, url='http://localhost:9000', batch_size=100, max_chars=100000, concurrency=8, retries=3,
+                 backoff=1.0, timeout=60, fallback=None):
+        """
+        init client
+        :param url: url of CoreNLP server
+        :param batch_size: max number of documents per request
+        :param max_chars: max number of chars per request, long document is sent alone
+        :param concurrency: number of requests in flight
+        :param retries: times to retry failed request, then batch rejected by server is split to find bad documents
+        :param backoff: seconds to wait before first retry, doubled each retry
+        :param timeout: seconds to wait for response
+        :param fallback: tokenizer of documents still failing, eg: RegexTokenizer, None to raise CoreNLPError
+        """
+        self.url = url
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.fallback = fallback
+        # imported here so RegexTokenizer works without requests installed
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # number of documents tokenized by fallback
+        self.errors = 0
+        self.lock = threading.Lock()
+    
+    def request(self, text):
+        """
+        send text to server
+        :param text: text
+        :return: annotation dict
+        """
+        response = self.session.post(self.url, params={'properties': json.dumps(CORENLP_PROPERTIES)},
+                                     data=text.encode('utf-8'),
+                                     headers={'Content-Type': 'text/plain; charset=utf-8'}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def request_with_retries(self, text):
+        """
+        send text to server, retry with backoff when failed
+        :param text: text
+        :return: annotation dict
+        """
+        import requests
+        for attempt in range(self.retries + 1):
+            try:
+                return self.request(text)
+            except (requests.RequestException, ValueError) as e:
+                if attempt == self.retries:
+                    raise CoreNLPError('Request failed after %d retries: %s' % (self.retries, e),
+                                       rejected=not isinstance(e, (requests.ConnectionError, requests.Timeout)))
+                time.sleep(self.backoff * 2 ** attempt)
+    
+    def tokenize_batch(self, texts):
+        """
+        tokenize documents by one request, tokens are assigned back to documents by offsets
+        :param texts: list of text
+        :return: list of tokens joined with space, aligned with texts
+        """
+        indexes = [index for index, text in enumerate(texts) if text]
+        results = [''] * len(texts)
+        if not indexes:
+            return results
+        try:
+            annotation = self.request_with_retries(DOC_SEPARATOR.join(texts[index] for index in indexes))
+        except CoreNLPError as e:
+            if e.rejected and len(indexes) > 1:
+                # split batch to isolate documents server fails on
+                half = len(indexes) // 2
+                for part in (indexes[:half], indexes[half:]):
+                    for index, result in zip(part, self.tokenize_batch([texts[index] for index in part])):
+                        results[index] = result
+                return results
+            if self.fallback is None:
+                raise
+            with self.lock:
+                self.errors += len(indexes)
+            for index, result in zip(indexes, self.fallback.tokenize_batch([texts[index] for index in indexes])):
+                results[index] = result
+            return results
+        # starts: utf-16 offset of each document in joined text
+        starts, offset = [], 0
+        for index in indexes:
+            starts.append(offset)
+            offset += utf16_length(texts[index]) + len(DOC_SEPARATOR)
+        tokens = [[] for _ in indexes]
+        for sentence in annotation['sentences']:
+            for token in sentence['tokens']:
+                tokens[bisect_right(starts, token['characterOffsetBegin']) - 1].append(
+                    token['originalText'] or token['word'])
+        for index, doc_tokens in zip(indexes, tokens):
+            results[index] = ' '.join(doc_tokens)
+        return results
+    
+    def batches(self, texts):
+        """
+        group texts to batches limited by batch size and chars
+        :param texts: iterable of text, consumed lazily
+        :return: generator of list of text
+        """
+        batch, chars = [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_chars):
+                yield batch
+                batch, chars = [], 0
+            batch.append(text)
+            chars += len(text) + len(DOC_SEPARATOR)
+        if batch:
+            yield batch
+    
+    def tokenize_lines(self, lines):
+        """
+        tokenize lines batch by batch with concurrent requests, keep order, no line is dropped
+        :param lines: iterable of text, consumed lazily
+        :return: generator of tokens joined with space
+        """
+        for batch in ordered_map(self.tokenize_batch, self.batches(lines), self.concurrency, threads=True):
+            for line in batch:
+                yield line
@@ -1,15 +1,58 @@
-from itertools import chain
-import pandas as pd
+import json
+from os.path import exists
+from collections import Counter
+from multiprocessing import cpu_count
 from . import config
+from .parallel import chunks, ordered_map
+
+
+def count_chunk(lines):
+    """
+    count words of lines
+    :param lines: list of lines joined with flag
+    :return: Counter
+    """
+    counter = Counter()
+    for line in lines:
+        counter.update(line.split(config.SEGMENT_JOIN_FLAG))
+    return counter
+
+
+def save_counts(counter, filename):
+    """
+    save word frequencies to json, in order of first appearance to keep order of ties when updated
+    :param counter: Counter of words
+    :param filename: target file
+    :return:
+    """
+    print('Write %d counts to %s' % (len(counter), filename))
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(dict(counter), f, ensure_ascii=False)
+
+
+def load_counts(filename):
+    """
+    load word frequencies saved by save_counts
+    :param filename: frequency file
+    :return: Counter of words
+    """
+    with open(filename, encoding='utf-8') as f:
+        return Counter(json.load(f))
 
 
 class VocabTransformer(object):
-    def __init__(self, limit=-1):
+    def __init__(self, limit=-1, min_count=1, processes=None, chunk_size=10000):
         """
         max size of vocabs
-        :param limit:
+        :param limit: max size of vocabs including special tokens, -1 for no limit
+        :param min_count: words counted less are dropped
+        :param processes: number of worker processes counting words, None for cpu count
+        :param chunk_size: number of lines sent to worker at once
         """
         self.limit = limit
+        self.min_count = min_count
+        self.processes = processes or cpu_count()
+        self.chunk_size = chunk_size
     
     def split_lines(self, data):
         """
@@ -23,35 +66,59 @@ class VocabTransformer(object):
         print('Total Words', len(result))
         return result
     
+    def count_words(self, data, counter=None):
+        """
+        count words of lines chunk by chunk, in worker processes
+        :param data: iterable of lines joined with flag, consumed lazily
+        :param counter: Counter to update, eg: counts of old corpus
+        :return: Counter of words
+        """
+        counter = Counter() if counter is None else counter
+        if self.processes <= 1:
+            for chunk in chunks(data, self.chunk_size):
+                counter.update(count_chunk(chunk))
+        else:
+            for chunk_counter in ordered_map(count_chunk, chunks(data, self.chunk_size), self.processes):
+                counter.update(chunk_counter)
+        return counter
+    
+    def build_vocabs_from_counts(self, counter):
+        """
+        build vocabs from word frequencies, most common first, ties in order of first appearance
+        :param counter: Counter of words
+        :return: word2id, id2word
+        """
+        special_tokens = (config.GO, config.EOS, config.UNK)
+        words = list(special_tokens)
+        for word, count in counter.most_common():
+            if count < self.min_count:
+                break
+            if word not in special_tokens:
+                words.append(word)
+        if self.limit >= 0:
+            words = words[:self.limit]
+        print('All words', len(words))
+        word2id = {word: idx for idx, word in enumerate(words)}
+        id2word = dict(enumerate(words))
+        return word2id, id2word
+    
     def build_vocabs(self, data):
         """
         build vocabs
-        :param data:
-        :return:
+        :param data: iterable of lines joined with flag, consumed lazily
+        :return: word2id, id2word
         """
-        # split lines
-        data = self.split_lines(data)
         print('Building Vocabs...')
-        # merge all words
-        all_words = list(chain(*data))
-        # all words to Series
-        all_words_sr = pd.Series(all_words)
-        # get value count, index changed to set
-        all_words_counts = all_words_sr.value_counts()
-        # get words set
-        all_words_set = list(all_words_counts.index)
-        
-        for token in (config.UNK, config.EOS, config.GO):
-            all_words_set.insert(0, token)
-        
-        if self.limit >= 0:
-            all_words_set = all_words_set[:self.limit]
-        print('All words', len(all_words_set))
-        # get words ids
-        all_words_ids = range(len(all_words_set))
-        
-        # dict to transform
-        word2id = pd.Series(all_words_ids, index=all_words_set).to_dict()
-        id2word = pd.Series(all_words_set, index=all_words_ids).to_dict()
-        
-        return word2id, id2word
+        return self.build_vocabs_from_counts(self.count_words(data))
+    
+    def update_vocabs(self, data, counts_file):
+        """
+        count appended data only, merge with saved frequencies and rebuild vocabs
+        :param data: iterable of new lines joined with flag
+        :param counts_file: frequency file of old corpus, updated in place, created if missing
+        :return: word2id, id2word
+        """
+        counter = load_counts(counts_file) if exists(counts_file) else Counter()
+        counter = self.count_words(data, counter)
+        save_counts(counter, counts_file)
+        return self.build_vocabs_from_counts(counter)
@@ -1,41 +1,100 @@
 import json
 import pickle
 from os.path import join
+from itertools import islice
+from utils.shards import ShardedWriter, BUFFER_SIZE, BUFFER_LINES
+
+
+def iter_json(data, ensure_ascii=False):
+    """
+    encode data to json piece by piece, same text as json.dumps
+    :param data: data, dict and list are encoded item by item
+    :param ensure_ascii: ensure ascii
+    :return: generator of json text
+    """
+    if isinstance(data, dict) and data:
+        yield '{'
+        for idx, (key, value) in enumerate(data.items()):
+            # encode key as json.dumps does, eg: int keys become strings
+            item = json.dumps({key: value}, ensure_ascii=ensure_ascii)[1:-1]
+            yield item if idx == 0 else ', ' + item
+        yield '}'
+    elif isinstance(data, list) and data:
+        yield '['
+        for idx, value in enumerate(data):
+            item = json.dumps(value, ensure_ascii=ensure_ascii)
+            yield item if idx == 0 else ', ' + item
+        yield ']'
+    else:
+        yield json.dumps(data, ensure_ascii=ensure_ascii)
 
 
 class Writer(object):
     
-    def __init__(self, folder='dataset'):
+    def __init__(self, folder='dataset', shard_lines=0, compress=None, buffer_size=BUFFER_SIZE):
         """
         init folder
         :param folder:
+        :param shard_lines: max lines of each txt shard, 0 to write one txt file
+        :param compress: compression of txt files, None, gzip, bz2 or xz
+        :param buffer_size: buffer size of files
         """
         self.folder = folder
+        self.shard_lines = shard_lines
+        self.compress = compress
+        self.buffer_size = buffer_size
+    
+    def open_txt(self, file_name):
+        """
+        open txt writer, sharded and compressed as configured
+        :param file_name: target file, shards are listed in its manifest
+        :return: ShardedWriter
+        """
+        return ShardedWriter(join(self.folder, file_name), shard_lines=self.shard_lines, compress=self.compress,
+                             buffer_size=self.buffer_size)
     
     def write_to_txt(self, data, file_name):
         """
-        write to txt line by line
-        :param data: data of array
+        write to txt line by line, buffered, sharded and compressed as configured
+        :param data: data of array, or iterable consumed lazily
         :param file_name: target_file
         :return:
         """
-        print('Write %d items to %s' % (len(data), file_name))
-        with open(join(self.folder, file_name), 'w', encoding='utf-8') as f:
-            for item in data:
-                f.write(item)
-                f.write('\n')
+        with self.open_txt(file_name) as writer:
+            writer.write_lines(data)
+        print('Write %d items to %s' % (writer.count, file_name))
+    
+    def write_pairs_to_txt(self, pairs, source_file_name, summary_file_name):
+        """
+        write (source, summary) records to two aligned txt files line by line, shards are aligned too
+        :param pairs: iterable of (source, summary), consumed lazily
+        :param source_file_name: target file of sources
+        :param summary_file_name: target file of summaries
+        :return:
+        """
+        with self.open_txt(source_file_name) as source_writer, self.open_txt(summary_file_name) as summary_writer:
+            pairs = iter(pairs)
+            while True:
+                batch = list(islice(pairs, BUFFER_LINES))
+                if not batch:
+                    break
+                sources, summaries = zip(*batch)
+                source_writer.write_lines(sources)
+                summary_writer.write_lines(summaries)
+        print('Write %d items to %s and %s' % (source_writer.count, source_file_name, summary_file_name))
     
     def write_to_json(self, data, file_name, ensure_ascii=False):
         """
-        write to json
+        write to json piece by piece
         :param data: data
         :param file_name: target_file
         :param ensure_ascii: ensure ascii
         :return:
         """
         print('Write %d items to %s' % (len(data), file_name))
-        with open(join(self.folder, file_name), 'w', encoding='utf-8') as f:
-            f.write(json.dumps(data, ensure_ascii=ensure_ascii))
+        with open(join(self.folder, file_name), 'w', encoding='utf-8', buffering=self.buffer_size) as f:
+            for piece in iter_json(data, ensure_ascii=ensure_ascii):
+                f.write(piece)
     
     def write_to_pickle(self, data, file_name):
         """
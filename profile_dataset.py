@@ -0,0 +1,144 @@
+# !/usr/bin/env python
+# coding: utf-8
+import json
+import numpy as np
+import tensorflow as tf
+from utils.vocab import load_vocab
+from utils.profiling import collect_stats, length_summary, candidate_lengths, truncation, suggest_buckets, \
+    padding_waste, batch_oovs_max_size, softmax_cost, percentile, PERCENTILES
+
+tf.app.flags.DEFINE_string('source_data', 'dataset/lcsts/split/sources.train.txt', 'Path to source data')
+tf.app.flags.DEFINE_string('target_data', 'dataset/lcsts/split/summaries.train.txt', 'Path to target data')
+tf.app.flags.DEFINE_string('source_vocabulary', 'dataset/lcsts/split/vocabs.json', 'Path to source vocabulary')
+tf.app.flags.DEFINE_string('target_vocabulary', 'dataset/lcsts/split/vocabs.json', 'Path to target vocabulary')
+tf.app.flags.DEFINE_string('split_sign', ' ', 'Separator of dataset')
+tf.app.flags.DEFINE_string('source_max_lengths', '', 'Candidate encoder_max_time_steps, eg: 60,80,100, '
+                                                     'empty to derive from length percentiles')
+tf.app.flags.DEFINE_string('target_max_lengths', '', 'Candidate decoder_max_time_steps, empty to derive')
+tf.app.flags.DEFINE_string('vocab_sizes', '10000,20000,30000,50000', 'Candidate encoder and decoder vocab sizes, '
+                                                                     'full vocab is always added')
+tf.app.flags.DEFINE_integer('num_buckets', 4, 'Number of suggested buckets')
+tf.app.flags.DEFINE_integer('batch_size', 64, 'Batch size used to estimate padding and oovs_max_size')
+tf.app.flags.DEFINE_integer('hidden_units', 400, 'Decoder output size used to estimate softmax cost')
+tf.app.flags.DEFINE_string('report', '', 'Also write report to this json file')
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def parse_ints(text):
+    return [int(item) for item in text.split(',') if item]
+
+
+def vocab_sizes(vocab):
+    """
+    get candidate sizes within vocab, and full size
+    :param vocab: Vocabulary
+    :return: sorted sizes
+    """
+    return sorted(set([size for size in parse_ints(FLAGS.vocab_sizes) if size < vocab.full_size] + [vocab.full_size]))
+
+
+def main(_):
+    np.random.seed(0)
+    source_dict = load_vocab(FLAGS.source_vocabulary)
+    target_dict = source_dict if FLAGS.target_vocabulary == FLAGS.source_vocabulary else \
+        load_vocab(FLAGS.target_vocabulary)
+    source_sizes, target_sizes = vocab_sizes(source_dict), vocab_sizes(target_dict)
+    stats = collect_stats(FLAGS.source_data, FLAGS.target_data, source_dict, target_dict, source_sizes, target_sizes,
+                          split_sign=FLAGS.split_sign)
+    source_lengths, target_lengths = stats['source_lengths'], stats['target_lengths']
+    source_max_lengths = parse_ints(FLAGS.source_max_lengths) or candidate_lengths(source_lengths)
+    target_max_lengths = parse_ints(FLAGS.target_max_lengths) or candidate_lengths(target_lengths)
+    report = {'pairs': len(source_lengths)}
+    print('Pairs', len(source_lengths))
+    
+    # lengths and truncation of each candidate max length
+    print('\nLengths', ', '.join('p%d' % q for q in PERCENTILES))
+    for side, lengths, max_lengths in (('source', source_lengths, source_max_lengths),
+                                       ('target', target_lengths, target_max_lengths)):
+        summary = length_summary(lengths)
+        print('%s mean %.1f, %s' % (side, summary['mean'], ', '.join(str(summary['p%d' % q]) for q in PERCENTILES)))
+        report['%s_lengths' % side] = summary
+        report['%s_truncation' % side] = [truncation(lengths, max_length) for max_length in max_lengths]
+    for side in ('source', 'target'):
+        print('\n%s max length | truncated pairs | lost tokens | padded steps when fully unrolled' % side)
+        for item in report['%s_truncation' % side]:
+            print('%d | %.2f%% | %.2f%% | %.2f%%' % (item['max_length'], item['truncated'] * 100,
+                                                    item['lost_tokens'] * 100, item['padding'] * 100))
+    
+    # oov rates and article oovs of each candidate vocab size
+    print('\nencoder vocab size | source oov tokens | article oovs p50, p90, p99, max | '
+          'oovs_max_size of batch mean, max')
+    source_tokens = max(int(np.sum(source_lengths)), 1)
+    report['source_vocab'] = []
+    for idx, size in enumerate(source_sizes):
+        article_oovs = stats['article_oovs'][:, idx]
+        sorted_oovs = np.sort(article_oovs)
+        batch_mean, batch_max = batch_oovs_max_size(article_oovs, FLAGS.batch_size)
+        item = {
+            'vocab_size': int(size),
+            'oov_tokens': float(stats['source_oov_tokens'][idx]) / source_tokens,
+            'article_oovs': {'p%d' % q: int(percentile(sorted_oovs, q)) for q in PERCENTILES},
+            'batch_oovs_max_size': {'mean': batch_mean, 'max': batch_max},
+        }
+        report['source_vocab'].append(item)
+        print('%d | %.2f%% | %s | %.1f, %d' % (size, item['oov_tokens'] * 100, ', '.join(
+            str(item['article_oovs']['p%d' % q]) for q in (50, 90, 99, 100)), batch_mean, batch_max))
+    
+    print('\ndecoder vocab size | target oov tokens | target oov tokens copyable from article')
+    target_tokens = max(int(np.sum(target_lengths)), 1)
+    report['target_vocab'] = []
+    for idx, size in enumerate(target_sizes):
+        oov_tokens = int(stats['target_oov_tokens'][idx])
+        item = {
+            'vocab_size': int(size),
+            'oov_tokens': float(oov_tokens) / target_tokens,
+            'copyable': float(stats['target_oov_copyable'][idx]) / max(oov_tokens, 1),
+        }
+        report['target_vocab'].append(item)
+        print('%d | %.2f%% | %.2f%%' % (size, item['oov_tokens'] * 100, item['copyable'] * 100))
+    
+    # padding waste of batches and buckets for each pair of max lengths
+    print('\nsource, target max length | bucket boundaries | padded tokens fully unrolled, random batches, buckets')
+    report['configs'] = []
+    for source_max_length in source_max_lengths:
+        boundaries = suggest_buckets(source_lengths, FLAGS.num_buckets, source_max_length)
+        for target_max_length in target_max_lengths:
+            fixed = 1.0 - float(np.sum(np.minimum(source_lengths, source_max_length)) + np.sum(
+                np.minimum(target_lengths, target_max_length))) / max(
+                len(source_lengths) * (source_max_length + target_max_length), 1)
+            item = {
+                'source_max_length': source_max_length,
+                'target_max_length': target_max_length,
+                'bucket_boundaries': boundaries,
+                'padding_unrolled': fixed,
+                'padding_batches': padding_waste(source_lengths, target_lengths, source_max_length,
+                                                 target_max_length, FLAGS.batch_size),
+                'padding_buckets': padding_waste(source_lengths, target_lengths, source_max_length,
+                                                 target_max_length, FLAGS.batch_size, boundaries),
+            }
+            report['configs'].append(item)
+            print('%d, %d | %s | %.2f%%, %.2f%%, %.2f%%' % (
+                source_max_length, target_max_length, ','.join(map(str, boundaries)), fixed * 100,
+                item['padding_batches'] * 100, item['padding_buckets'] * 100))
+    
+    # softmax cost of each decoder length and vocab size, extended by oovs_max_size of encoder vocab of same size
+    print('\ntarget max length | decoder vocab size | softmax multiply-adds per pair (M)')
+    report['softmax'] = []
+    for target_max_length in target_max_lengths:
+        for idx, size in enumerate(target_sizes):
+            source_items = [item for item in report['source_vocab'] if item['vocab_size'] >= size]
+            oovs_size = source_items[0]['batch_oovs_max_size']['max'] if source_items else 0
+            cost = softmax_cost(target_max_length, FLAGS.hidden_units, size, oovs_size)
+            report['softmax'].append({'target_max_length': target_max_length, 'vocab_size': int(size),
+                                      'oovs_max_size': oovs_size, 'multiply_adds': cost})
+            print('%d | %d | %.1f' % (target_max_length, size, cost / 1e6))
+    
+    if FLAGS.report:
+        with open(FLAGS.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print('Write report to', FLAGS.report)
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -2,10 +2,9 @@
 # coding: utf-8
 import os
 import logging
-import jieba
-from preprocess.config import UNK
 from utils.iterator import UniTextIterator, end_token
-from utils.funcs import prepare_batch, load_inverse_dict, inverse_dict
+from utils.vocab import Vocabulary
+from utils.funcs import prepare_batch, inverse_dict, seq2words
 import json
 import tensorflow as tf
 from cls import get_model_class
@@ -18,6 +17,7 @@ tf.app.flags.DEFINE_string('model_path', 'checkpoints/lcsts_split_pointer_genera
                            'Path to a specific model checkpoint.')
 tf.app.flags.DEFINE_string('inference_input', 'storage/system.input.txt', 'Decoding input path')
 tf.app.flags.DEFINE_string('inference_output', 'storage/system.output.txt', 'Decoding output path')
+tf.app.flags.DEFINE_string('jieba_cache', None, 'Path of prebuilt jieba dictionary cache')
 
 # Runtime parameters
 tf.app.flags.DEFINE_boolean('allow_soft_placement', True, 'Allow device soft placement')
@@ -78,24 +78,6 @@ def attention_data(attention, source, summarization):
     return result, source.split(), summarization.split()
 
 
-def seq2words(seq, inverse_target_dictionary, oovs_vocab=None):
-    words = []
-    if oovs_vocab:
-        inverse_target_dictionary.update(oovs_vocab)
-    for w in seq:
-        if w == end_token:
-            break
-        if w in inverse_target_dictionary:
-            result = inverse_target_dictionary[w]
-            if result == '<UNK>':
-                words.append(result)
-            else:
-                words.append(result)
-        else:
-            words.append(UNK)
-    return ' '.join(words)
-
-
 # def decode():
 # os.environ['CUDA_VISIBLE_DEVICES'] = FLAGS.gpu
 
@@ -104,8 +86,9 @@ config = load_config(FLAGS)
 print(config)
 # Load source data to decode
 
-# Load inverse dictionary used in decoding
-target_inverse_dict = load_inverse_dict(config['target_vocabulary'])
+# Load vocabularies once, shared by all requests
+source_vocab = Vocabulary.load(config['source_vocabulary'], config['encoder_vocab_size'])
+target_vocab = Vocabulary.load(config['target_vocabulary'])
 
 # Initiate TF session
 sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=FLAGS.allow_soft_placement,
@@ -118,12 +101,15 @@ logger.info('Decoding %s...', FLAGS.inference_input)
 
 fout = open(FLAGS.inference_output, 'w', encoding='utf-8')
 
-import jieba
+from preprocess.segment import Segmenter
 
 from flask import Flask, request, render_template
 
 space = ' '
 
+# load dictionary before first request, recent sources are kept in LRU
+segmenter = Segmenter(cache_file=FLAGS.jieba_cache, join_flag=space, remove_spaces=True)
+
 app = Flask(__name__)
 
 
@@ -148,7 +134,7 @@ def copy_info(result, predicts, p_gen_seq):
 @app.route('/summarize', methods=['GET'])
 def summarize():
     source_text = request.args.get('source')
-    source_text = space.join(jieba.lcut(source_text.replace(space, '')))
+    source_text = segmenter.segment(source_text)
     
     with open(FLAGS.inference_input, 'w', encoding='utf-8') as f:
         f.write(source_text)
@@ -156,7 +142,7 @@ def summarize():
     test_set = UniTextIterator(source=config['inference_input'],
                                split_sign=config['split_sign'],
                                batch_size=config['inference_batch_size'],
-                               source_dict=config['source_vocabulary'],
+                               source_dict=source_vocab,
                                n_words_source=config['encoder_vocab_size'])
     
     test_set.reset()
@@ -173,13 +159,14 @@ def summarize():
                                                                                           encoder_inputs=source,
                                                                                           encoder_inputs_extend=source_extend,
                                                                                           encoder_inputs_length=source_len,
-                                                                                          oovs_max_size=oovs_max_size)
+                                                                                          oovs_max_size=oovs_max_size,
+                                                                                          max_inference_steps=FLAGS.max_inference_step)
         print('Shape', predicts.shape, scores.shape, probabilities.shape, p_gens.shape)
         for predict_seq, score_seq, prob_seq, p_gen_seq, oovs_vocab, attn in zip(predicts, scores, probabilities,
                                                                                  p_gens, oovs_vocabs, attns):
             print('Score', score_seq, 'predict_seq', predict_seq, 'p_gen_seq', p_gen_seq)
             print('Attns', attns)
-            summarization_text = seq2words(predict_seq, inverse_target_dictionary=target_inverse_dict,
+            summarization_text = seq2words(predict_seq, target_vocab=target_vocab,
                                            oovs_vocab=inverse_dict(oovs_vocab))
             logger.info('result %s', summarization_text)
             fout.write(summarization_text + '\n')
@@ -1,27 +1,58 @@
-from sklearn.model_selection import train_test_split
-from os.path import join
-
-input_dir = './dataset/bytecup/token'
-output_dir = './dataset/bytecup/token'
-
-contents = []
-for line in open(join(input_dir, 'contents.txt'), encoding='utf-8').readlines():
-    contents.append(line.strip())
-
-titles = []
-for line in open(join(input_dir, 'titles.txt'), encoding='utf-8').readlines():
-    titles.append(line.strip())
-
-print('Contents', len(contents))
-print('Titles', len(titles))
-
-x_train, x_test, y_train, y_test = train_test_split(contents, titles, test_size=0.01)
-
+# !/usr/bin/env python
+# coding: utf-8
+from os import makedirs
+from os.path import basename, exists, splitext
+from contextlib import ExitStack
+import tensorflow as tf
+from preprocess.reader import read_parallel
+from preprocess.split import SPLITS, split_pairs
 from preprocess.writer import Writer
 
-writer = Writer(output_dir)
-
-writer.write_to_txt(x_train, 'contents.train.txt')
-writer.write_to_txt(x_test, 'contents.eval.txt')
-writer.write_to_txt(y_train, 'titles.train.txt')
-writer.write_to_txt(y_test, 'titles.eval.txt')
+tf.app.flags.DEFINE_string('source_file', './dataset/bytecup/token/contents.txt', 'Sources, one per line')
+tf.app.flags.DEFINE_string('summary_file', './dataset/bytecup/token/titles.txt', 'Summaries aligned with sources')
+tf.app.flags.DEFINE_string('output_dir', './dataset/bytecup/token', 'Folder of split files')
+tf.app.flags.DEFINE_float('eval_ratio', 0.01, 'Ratio of eval split')
+tf.app.flags.DEFINE_float('test_ratio', 0.0, 'Ratio of test split, no test files are written if 0')
+tf.app.flags.DEFINE_string('seed', '', 'Salt of hash, change it to draw another split')
+tf.app.flags.DEFINE_integer('shard_lines', 0, 'Max lines of each output shard, 0 to write one file')
+tf.app.flags.DEFINE_string('compress', None, 'Compression of outputs, gzip, bz2 or xz')
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def split_name(path, split):
+    """
+    get file name of split, eg: contents.txt -> contents.train.txt
+    :param path: input path
+    :param split: name of split
+    :return: file name
+    """
+    root, ext = splitext(basename(path))
+    return '%s.%s%s' % (root, split, ext)
+
+
+def main(_):
+    ratios = {'train': 1 - FLAGS.eval_ratio - FLAGS.test_ratio, 'eval': FLAGS.eval_ratio, 'test': FLAGS.test_ratio}
+    splits = [split for split in SPLITS if ratios[split] > 0]
+    if not exists(FLAGS.output_dir):
+        makedirs(FLAGS.output_dir)
+    writer = Writer(FLAGS.output_dir, shard_lines=FLAGS.shard_lines, compress=FLAGS.compress)
+    
+    # records are read and written one by one, each goes to split chosen by hash of its source
+    with ExitStack() as stack:
+        writers = {}
+        for split in splits:
+            writers[split] = (stack.enter_context(writer.open_txt(split_name(FLAGS.source_file, split))),
+                              stack.enter_context(writer.open_txt(split_name(FLAGS.summary_file, split))))
+        pairs = read_parallel(FLAGS.source_file, FLAGS.summary_file)
+        for split, source, summary in split_pairs(pairs, FLAGS.eval_ratio, FLAGS.test_ratio, FLAGS.seed):
+            source_writer, summary_writer = writers[split]
+            source_writer.write(source)
+            summary_writer.write(summary)
+    
+    for split in splits:
+        print('Write %d items to %s split' % (writers[split][0].count, split))
+
+
+if __name__ == '__main__':
+    tf.app.run()
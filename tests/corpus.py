@@ -0,0 +1,37 @@
+import os
+import json
+import random
+
+# special tokens take ids 0, 1, 2 like preprocess vocabs
+SPECIAL_TOKENS = ['<GO>', '<EOS>', '<UNK>']
+
+
+def write_corpus(folder, pairs=50, vocab_words=30, words=40, max_length=12, empty_every=0, seed=0):
+    """
+    write random parallel corpus and shared vocab, words beyond vocab_words are oovs
+    :param folder: output folder
+    :param pairs: number of lines
+    :param vocab_words: number of words in vocab
+    :param words: number of distinct words used
+    :param max_length: max words of line
+    :param empty_every: write empty source line every this many lines, 0 for none
+    :param seed: random seed
+    :return: source path, target path, vocab path
+    """
+    generator = random.Random(seed)
+    source_path, target_path = os.path.join(folder, 'source.txt'), os.path.join(folder, 'target.txt')
+    vocab_path = os.path.join(folder, 'vocab.json')
+    with open(source_path, 'w', encoding='utf-8') as fs, open(target_path, 'w', encoding='utf-8') as ft:
+        for idx in range(pairs):
+            source = ['w%d' % generator.randrange(words) for _ in range(generator.randint(1, max_length))]
+            # target copies some source words, so they can be article oovs
+            target = [generator.choice(source) if generator.random() < 0.5 else 'w%d' % generator.randrange(words)
+                      for _ in range(generator.randint(1, max_length))]
+            if empty_every and idx % empty_every == 0:
+                source = []
+            fs.write(' '.join(source) + '\n')
+            ft.write(' '.join(target) + '\n')
+    word2id = {word: idx for idx, word in enumerate(SPECIAL_TOKENS + ['w%d' % i for i in range(vocab_words)])}
+    with open(vocab_path, 'w', encoding='utf-8') as f:
+        json.dump(word2id, f)
+    return source_path, target_path, vocab_path
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+from utils.attention import attention_keys, attention_mask, additive_attention
+
+
+def loop_attention(prev_state, encoder_outputs, attention_w, attention_u, attention_v, lengths):
+    """
+    per position bahdanau attention over real positions only, numpy
+    :param prev_state: [batch_size, hidden_units]
+    :param encoder_outputs: [batch_size, encoder_time_steps, hidden_units]
+    :param attention_w: [hidden_units, attention_units]
+    :param attention_u: [hidden_units, attention_units]
+    :param attention_v: [attention_units, 1]
+    :param lengths: [batch_size]
+    :return: context [batch_size, hidden_units], alpha [batch_size, encoder_time_steps]
+    """
+    batch_size, time_steps, _ = encoder_outputs.shape
+    alpha = np.zeros([batch_size, time_steps])
+    for b in range(batch_size):
+        query = prev_state[b].dot(attention_w)
+        e = np.array([np.tanh(query + encoder_outputs[b, j].dot(attention_u)).dot(attention_v)[0]
+                      for j in range(lengths[b])])
+        e = np.exp(e - e.max())
+        alpha[b, :lengths[b]] = e / e.sum()
+    context = np.einsum('bt,bth->bh', alpha, encoder_outputs)
+    return context, alpha
+
+
+class AttentionTest(unittest.TestCase):
+    def setUp(self):
+        generator = np.random.RandomState(0)
+        self.prev_state = generator.randn(3, 5).astype(np.float32)
+        self.encoder_outputs = generator.randn(3, 7, 5).astype(np.float32)
+        self.attention_w = generator.randn(5, 4).astype(np.float32)
+        self.attention_u = generator.randn(5, 4).astype(np.float32)
+        self.attention_v = generator.randn(4, 1).astype(np.float32)
+        self.lengths = np.array([7, 3, 1], dtype=np.int32)
+    
+    def run_attention(self, lengths=None, dtype=tf.float32):
+        with tf.Graph().as_default(), tf.Session() as sess:
+            encoder_outputs = tf.constant(self.encoder_outputs, dtype=dtype)
+            keys = attention_keys(encoder_outputs, tf.constant(self.attention_u, dtype=dtype))
+            mask = attention_mask(lengths, 7) if lengths is not None else None
+            outputs = additive_attention(tf.constant(self.prev_state, dtype=dtype), encoder_outputs, keys,
+                                         tf.constant(self.attention_w, dtype=dtype),
+                                         tf.constant(self.attention_v, dtype=dtype), mask=mask)
+            return sess.run(outputs)
+    
+    def test_masked_same_as_loop(self):
+        context, alpha, _ = self.run_attention(self.lengths)
+        expected_context, expected_alpha = loop_attention(self.prev_state, self.encoder_outputs, self.attention_w,
+                                                          self.attention_u, self.attention_v, self.lengths)
+        np.testing.assert_allclose(alpha, expected_alpha, atol=1e-5)
+        np.testing.assert_allclose(context, expected_context, atol=1e-5)
+    
+    def test_mask_sums_to_one(self):
+        for dtype in (tf.float32, tf.float16):
+            with self.subTest(dtype=dtype):
+                _, alpha, _ = self.run_attention(self.lengths, dtype)
+                alpha = alpha.astype(np.float32)
+                np.testing.assert_allclose(alpha.sum(axis=1), 1, atol=1e-2)
+                self.assertTrue(np.all(alpha[np.arange(7) >= self.lengths[:, None]] == 0))
+                self.assertTrue(np.all(alpha[np.arange(7) < self.lengths[:, None]] > 0))
+    
+    def test_no_mask_attends_all(self):
+        context, alpha, scores = self.run_attention()
+        full = np.full([3], 7, dtype=np.int32)
+        masked_context, masked_alpha, masked_scores = self.run_attention(full)
+        np.testing.assert_allclose(alpha, masked_alpha, atol=1e-6)
+        np.testing.assert_allclose(context, masked_context, atol=1e-6)
+        np.testing.assert_allclose(scores, masked_scores, atol=1e-6)
+        _, expected_alpha = loop_attention(self.prev_state, self.encoder_outputs, self.attention_w,
+                                           self.attention_u, self.attention_v, full)
+        np.testing.assert_allclose(alpha, expected_alpha, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import tempfile
+import unittest
+from utils.iterator import BiTextIterator
+from utils.binary import BinaryBiTextIterator, compile_dataset
+from tests.corpus import write_corpus
+
+
+def as_lists(seqs):
+    return [list(map(int, seq)) for seq in seqs]
+
+
+class BinaryBiTextIteratorTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.source, self.target, self.vocab = write_corpus(self.folder.name)
+        self.prefix = self.folder.name + '/train'
+    
+    def tearDown(self):
+        self.folder.cleanup()
+    
+    def assert_same_batches(self, extend, split=False, n_words=20, **kwargs):
+        """
+        check binary iterator yields same batches as text iterator in file order
+        :param extend: with extended ids
+        :param split: split out-of-article oovs
+        :param n_words: vocab size of both sides
+        :param kwargs: arguments of both iterators
+        :return: None
+        """
+        compile_dataset(self.source, self.target, self.vocab, self.vocab, self.prefix, n_words_source=n_words,
+                        n_words_target=n_words, extend=extend, split=split)
+        text = BiTextIterator(self.source, self.target, self.vocab, self.vocab, batch_size=7, n_words_source=n_words,
+                              n_words_target=n_words, **kwargs)
+        binary = BinaryBiTextIterator(self.prefix, batch_size=7, n_words_source=n_words, n_words_target=n_words,
+                                      **kwargs)
+        text.reset()
+        text_batches = list(text.next(extend=extend, split=split))
+        binary_batches = list(binary.next(extend=extend, split=split))
+        self.assertEqual(len(text_batches), len(binary_batches))
+        for text_batch, binary_batch in zip(text_batches, binary_batches):
+            if extend:
+                # article oovs words are not compiled, oovs max size is
+                self.assertEqual(text_batch[4], binary_batch[4])
+                text_batch, binary_batch = text_batch[:4], binary_batch[:4]
+            for text_seqs, binary_seqs in zip(text_batch, binary_batch):
+                self.assertEqual(as_lists(text_seqs), as_lists(binary_seqs))
+    
+    def test_batches(self):
+        self.assert_same_batches(extend=False)
+    
+    def test_extend_batches(self):
+        self.assert_same_batches(extend=True)
+    
+    def test_split_batches(self):
+        self.assert_same_batches(extend=True, split=True)
+    
+    def test_max_length(self):
+        self.assert_same_batches(extend=False, max_length=6)
+    
+    def test_meta_lines(self):
+        meta = compile_dataset(self.source, self.target, self.vocab, self.vocab, self.prefix)
+        self.assertEqual(meta['source']['lines'], 50)
+        self.assertEqual(meta['target']['lines'], 50)
+        self.assertEqual(len(BinaryBiTextIterator(self.prefix).source_lengths), 50)
+    
+    def test_lines_mismatch(self):
+        with open(self.target, 'a', encoding='utf-8') as f:
+            f.write('w1\n')
+        with self.assertRaises(ValueError):
+            compile_dataset(self.source, self.target, self.vocab, self.vocab, self.prefix)
+
+
+if __name__ == '__main__':
+    unittest.main()
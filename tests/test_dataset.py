@@ -0,0 +1,113 @@
+import tempfile
+import unittest
+import numpy as np
+import tensorflow as tf
+from utils.dataset import generator_dataset, write_tfrecords, tfrecord_dataset, batch_dataset, bucket_batch_sizes
+from utils.funcs import BatchCollator, flatten_batch
+from utils.iterator import BiTextIterator
+from tests.corpus import write_corpus
+
+
+def dataset_batches(dataset):
+    """
+    run dataset for one epoch in new session
+    :param dataset: dataset of inputs dict
+    :return: list of inputs dict
+    """
+    batches = []
+    inputs = dataset.make_one_shot_iterator().get_next()
+    with tf.Session() as sess:
+        while True:
+            try:
+                batches.append(sess.run(inputs))
+            except tf.errors.OutOfRangeError:
+                return batches
+
+
+class DatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.source, self.target, self.vocab = write_corpus(self.folder.name)
+    
+    def tearDown(self):
+        self.folder.cleanup()
+    
+    def bi_iterator(self):
+        return BiTextIterator(self.source, self.target, self.vocab, self.vocab, batch_size=7,
+                              n_words_source=20, n_words_target=20)
+    
+    def expected_batches(self, batch_size, pad_longest=False):
+        """
+        pad examples of iterator with BatchCollator like train.py, sources truncated to 8 and targets to 6
+        :param batch_size: batch size
+        :param pad_longest: pad to longest of batch
+        :return: list of inputs dict
+        """
+        iterator = self.bi_iterator()
+        iterator.reset()
+        examples = []
+        for source, target, source_extend, target_extend, _, oovs_vocabs in iterator.next(extend=True):
+            examples.extend(zip(source, target, source_extend, target_extend, oovs_vocabs))
+        source_collator = BatchCollator(8, pad_longest=pad_longest)
+        target_collator = BatchCollator(6, pad_longest=pad_longest)
+        batches = []
+        for start in range(0, len(examples), batch_size):
+            source, target, source_extend, target_extend, oovs_vocabs = zip(*examples[start:start + batch_size])
+            encoder_inputs, encoder_inputs_extend, encoder_inputs_length = \
+                source_collator.collate(*flatten_batch(source, source_extend))
+            decoder_inputs, decoder_inputs_extend, decoder_inputs_length = \
+                target_collator.collate(*flatten_batch(target, target_extend))
+            batches.append({
+                'encoder_inputs': encoder_inputs,
+                'encoder_inputs_extend': encoder_inputs_extend,
+                'encoder_inputs_length': encoder_inputs_length,
+                'decoder_inputs': decoder_inputs,
+                'decoder_inputs_extend': decoder_inputs_extend,
+                'decoder_inputs_length': decoder_inputs_length,
+                'oovs_max_size': max(len(oovs_vocab) for oovs_vocab in oovs_vocabs),
+            })
+        return batches
+    
+    def assert_same_batches(self, batches, expected):
+        self.assertEqual(len(batches), len(expected))
+        for batch, expected_batch in zip(batches, expected):
+            self.assertEqual(sorted(batch), sorted(expected_batch))
+            for key in expected_batch:
+                np.testing.assert_array_equal(batch[key], expected_batch[key], err_msg=key)
+    
+    def test_generator_same_as_collator(self):
+        for pad_longest in (False, True):
+            with self.subTest(pad_longest=pad_longest), tf.Graph().as_default():
+                dataset = batch_dataset(generator_dataset(self.bi_iterator(), extend=True), 5, 8, 6,
+                                        pad_longest=pad_longest)
+                self.assert_same_batches(dataset_batches(dataset), self.expected_batches(5, pad_longest))
+    
+    def test_tfrecord_same_as_generator(self):
+        prefix = self.folder.name + '/train'
+        write_tfrecords(self.bi_iterator(), prefix, num_shards=1, extend=True)
+        with tf.Graph().as_default():
+            dataset = batch_dataset(tfrecord_dataset(prefix + '-*.tfrecord', extend=True), 5, 8, 6)
+            self.assert_same_batches(dataset_batches(dataset), self.expected_batches(5))
+    
+    def test_bucket_batch_sizes(self):
+        self.assertEqual(bucket_batch_sizes([4, 8], 16, 0, 10, 6), [16, 16, 16])
+        self.assertEqual(bucket_batch_sizes([4, 8], 16, 64, 10, 6), [4, 4, 4])
+        # longest source of buckets is 3, 7 and 10
+        self.assertEqual(bucket_batch_sizes([4, 8], 16, 64, 10, 6, pad_longest=True), [7, 4, 4])
+        self.assertEqual(bucket_batch_sizes([4], 16, 8, 10, 6), [1, 1])
+    
+    def test_bucket_budget(self):
+        for pad_longest in (False, True):
+            with self.subTest(pad_longest=pad_longest), tf.Graph().as_default():
+                dataset = batch_dataset(generator_dataset(self.bi_iterator()), 16, 8, 6, bucket_boundaries=[4, 8],
+                                        max_tokens=60, pad_longest=pad_longest)
+                batches = dataset_batches(dataset)
+                self.assertEqual(sum(len(batch['encoder_inputs']) for batch in batches), 50)
+                for batch in batches:
+                    source_shape, target_shape = batch['encoder_inputs'].shape, batch['decoder_inputs'].shape
+                    self.assertLessEqual(source_shape[0] * (source_shape[1] + target_shape[1]), 60)
+                    self.assertEqual(len(set(np.digitize(batch['encoder_inputs_length'], [4, 8]))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+from utils.decoder import time_major, input_array, dynamic_decode
+
+
+class DynamicDecodeTest(unittest.TestCase):
+    def setUp(self):
+        generator = np.random.RandomState(0)
+        # inputs: [batch_size, time_steps, units]
+        self.inputs = generator.rand(3, 6, 2).astype(np.float32)
+    
+    def run_decode(self, max_steps, threshold=None):
+        """
+        decode running sum of inputs, each sequence finishes once its first unit sum exceeds threshold
+        :param max_steps: fn returning int or int tensor, called inside test graph
+        :param threshold: finish threshold, None to never finish
+        :return: sums [batch_size, steps, units], steps [batch_size, steps], final sum [batch_size, units]
+        """
+        with tf.Graph().as_default(), tf.Session() as sess:
+            inputs = input_array(tf.constant(self.inputs))
+            
+            def step_fn(time, state):
+                state = state + inputs.read(time)
+                finished = state[:, 0] > threshold if threshold is not None else None
+                return (state, tf.fill([3], time)), state, finished
+            
+            finished = tf.zeros([3], dtype=tf.bool) if threshold is not None else None
+            (sums, steps), final_state = dynamic_decode(step_fn, tf.zeros([3, 2]), max_steps(), (tf.float32, tf.int32),
+                                                        finished=finished)
+            self.assertEqual(sums.shape.as_list(), [3, None, 2])
+            return sess.run((sums, steps, final_state))
+    
+    def test_same_as_unrolled(self):
+        for max_steps in (lambda: 6, lambda: tf.constant(4)):
+            sums, steps, final_state = self.run_decode(max_steps)
+            expected = np.cumsum(self.inputs, axis=1)[:, :sums.shape[1]]
+            np.testing.assert_allclose(sums, expected, rtol=1e-6)
+            np.testing.assert_allclose(final_state, expected[:, -1], rtol=1e-6)
+            np.testing.assert_array_equal(steps, np.tile(np.arange(sums.shape[1]), [3, 1]))
+        self.assertEqual(self.run_decode(lambda: 4)[0].shape[1], 4)
+    
+    def test_stop_when_all_finished(self):
+        sums = np.cumsum(self.inputs, axis=1)
+        threshold = 1.5
+        # step where each sequence first exceeds threshold, last step if never
+        finish_steps = [next((t for t in range(6) if sums[b, t, 0] > threshold), 5) for b in range(3)]
+        outputs, _, _ = self.run_decode(lambda: 6, threshold)
+        self.assertEqual(outputs.shape[1], max(finish_steps) + 1)
+        np.testing.assert_allclose(outputs, sums[:, :max(finish_steps) + 1], rtol=1e-6)
+    
+    def test_time_major(self):
+        with tf.Graph().as_default(), tf.Session() as sess:
+            np.testing.assert_array_equal(sess.run(time_major(tf.constant(self.inputs))),
+                                          self.inputs.transpose([1, 0, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import numpy as np
+from utils.iterator import end_token
+from utils.funcs import BatchCollator, flatten_batch, prepare_batch, prepare_pair_batch
+
+
+def loop_prepare_batch(seqs_x, x_max_length=None):
+    """
+    prepare_batch before vectorization, padded by python loop
+    :param seqs_x: list of sentences
+    :param x_max_length: truncate and pad to this length, None to pad to longest
+    :return: x, x_lengths
+    """
+    seqs_x = [s_x[:x_max_length] if x_max_length is not None else s_x for s_x in seqs_x]
+    lengths_x = [len(s) for s in seqs_x]
+    x_lengths = np.array(lengths_x)
+    max_x = x_max_length if x_max_length else np.max(x_lengths)
+    x = np.ones((len(seqs_x), max_x)).astype('int32') * end_token
+    for idx, s_x in enumerate(seqs_x):
+        x[idx, :lengths_x[idx]] = s_x
+    return x, x_lengths
+
+
+def random_seqs(generator, batch_size, max_length=12, arrays=False):
+    """
+    build random sentences of ids
+    :param generator: numpy RandomState
+    :param batch_size: number of sentences
+    :param max_length: sentences are shorter than this
+    :param arrays: numpy arrays like binary iterator instead of lists
+    :return: list of sentences
+    """
+    seqs = [generator.randint(2, 50, generator.randint(0, max_length)) for _ in range(batch_size)]
+    return seqs if arrays else [seq.tolist() for seq in seqs]
+
+
+class BatchCollatorTest(unittest.TestCase):
+    def test_same_as_loop(self):
+        generator = np.random.RandomState(0)
+        for max_length in (None, 5, 20):
+            for arrays in (False, True):
+                for _ in range(20):
+                    seqs = random_seqs(generator, generator.randint(1, 8), arrays=arrays)
+                    if max(map(len, seqs)) == 0:
+                        continue
+                    x, x_lengths = prepare_batch(seqs, max_length)
+                    expected_x, expected_lengths = loop_prepare_batch(seqs, max_length)
+                    np.testing.assert_array_equal(x, expected_x)
+                    np.testing.assert_array_equal(x_lengths, expected_lengths)
+    
+    def test_pair_same_as_loop(self):
+        generator = np.random.RandomState(1)
+        for _ in range(20):
+            seqs_x, seqs_y = random_seqs(generator, 5), random_seqs(generator, 5)
+            x, x_lengths, y, y_lengths = prepare_pair_batch(seqs_x, seqs_y, 6, 4)
+            for outputs, expected in ((x, x_lengths), loop_prepare_batch(seqs_x, 6)), \
+                                     ((y, y_lengths), loop_prepare_batch(seqs_y, 4)):
+                np.testing.assert_array_equal(outputs[0], expected[0])
+                np.testing.assert_array_equal(outputs[1], expected[1])
+    
+    def test_reused_buffers(self):
+        generator = np.random.RandomState(2)
+        collator = BatchCollator(8, num_buffers=2)
+        # batches alive at the same time must not share buffers
+        alive = []
+        for _ in range(10):
+            seqs = random_seqs(generator, generator.randint(1, 8))
+            seqs_extend = [[idx + 100 for idx in seq] for seq in seqs]
+            x, x_extend, x_lengths = collator.collate(*flatten_batch(seqs, seqs_extend))
+            alive = (alive + [(x.copy(), x)])[-2:]
+            for expected, output in alive:
+                np.testing.assert_array_equal(output, expected)
+            np.testing.assert_array_equal(x, loop_prepare_batch(seqs, 8)[0])
+            np.testing.assert_array_equal(x_extend, loop_prepare_batch(seqs_extend, 8)[0])
+            np.testing.assert_array_equal(x_lengths, loop_prepare_batch(seqs, 8)[1])
+    
+    def test_pad_longest(self):
+        seqs = [[5, 6, 7], [8], [9, 10, 11, 12, 13, 14]]
+        x, lengths = BatchCollator(4, pad_longest=True).collate(*flatten_batch(seqs))
+        np.testing.assert_array_equal(x, loop_prepare_batch(seqs, 4)[0])
+        x, lengths = BatchCollator(8, pad_longest=True).collate(*flatten_batch(seqs))
+        self.assertEqual(x.shape, (3, 6))
+        np.testing.assert_array_equal(x, loop_prepare_batch(seqs)[0])
+        np.testing.assert_array_equal(lengths, [3, 1, 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
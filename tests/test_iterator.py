@@ -0,0 +1,170 @@
+import tempfile
+import unittest
+import numpy as np
+from utils.iterator import BiTextIterator, UniTextIterator, bucket_batches, extend_source, extend_target, unk_token
+from utils.vocab import Vocabulary
+from utils.binary import BinaryBiTextIterator, compile_dataset
+from tests.corpus import write_corpus
+
+
+def list_extend(source, target, source_dict, target_dict, split=False):
+    """
+    oov extension before per-article hash maps, oovs kept in list and searched by index
+    :param source: source words
+    :param target: target words
+    :param source_dict: word to id dict of visible source vocab
+    :param target_dict: word to id dict of visible target vocab
+    :param split: split out-of-article oov to chars
+    :return: source ids extend, target ids extend, oovs vocab
+    """
+    oovs, oovs_vocab = [], {}
+    source_ids_extend, target_ids_extend = [], []
+    for w in source:
+        if w not in source_dict:
+            if w not in oovs:
+                oovs.append(w)
+            source_ids_extend.append(len(source_dict) + oovs.index(w))
+            oovs_vocab[w] = len(source_dict) + oovs.index(w)
+        else:
+            source_ids_extend.append(source_dict[w])
+    for w in target:
+        if w in target_dict:
+            target_ids_extend.append(target_dict[w])
+        elif w in oovs:
+            target_ids_extend.append(len(target_dict) + oovs.index(w))
+        elif split:
+            target_ids_extend.extend(target_dict.get(w_split, unk_token) for w_split in w)
+        else:
+            target_ids_extend.append(unk_token)
+    return source_ids_extend, target_ids_extend, oovs_vocab
+
+
+class IteratorTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.source, self.target, self.vocab = write_corpus(self.folder.name)
+    
+    def tearDown(self):
+        self.folder.cleanup()
+    
+    def bi_iterator(self, batch_size=7, **kwargs):
+        iterator = BiTextIterator(self.source, self.target, self.vocab, self.vocab, batch_size=batch_size,
+                                  n_words_source=20, n_words_target=20, **kwargs)
+        iterator.reset()
+        return iterator
+
+
+class StreamingTest(IteratorTest):
+    def test_bi_text_same_batches(self):
+        for extend in (False, True):
+            with self.subTest(extend=extend):
+                batches = list(self.bi_iterator().next(extend=extend))
+                streamed = list(self.bi_iterator(streaming=True, max_load_batches=2).next(extend=extend))
+                self.assertEqual(streamed, batches)
+    
+    def test_bi_text_bounded_buffer(self):
+        iterator = self.bi_iterator(streaming=True, max_load_batches=2)
+        self.assertEqual(iterator.source_buffer, [])
+        sizes = []
+        for _ in iterator.next():
+            sizes.append(len(iterator.source_buffer))
+        self.assertLessEqual(max(sizes), 14)
+        self.assertEqual(iterator.length(), 50)
+    
+    def test_bi_text_epochs(self):
+        iterator = self.bi_iterator(streaming=True, max_load_batches=2)
+        first = list(iterator.next())
+        iterator.reset()
+        self.assertEqual(list(iterator.next()), first)
+        self.assertEqual(sum(len(source) for source, _ in first), 50)
+    
+    def test_uni_text_same_batches(self):
+        for extend in (False, True):
+            with self.subTest(extend=extend):
+                batches = list(UniTextIterator(self.source, self.vocab, batch_size=7).next(extend=extend))
+                streamed = list(UniTextIterator(self.source, self.vocab, batch_size=7, streaming=True,
+                                                max_load_batches=2).next(extend=extend))
+                self.assertEqual(streamed, batches)
+
+
+
+class BucketingTest(IteratorTest):
+    def assert_budget(self, batches, max_tokens, pad_to_max=False):
+        """
+        check padded tokens of each batch fit budget, a single long pair may exceed it alone
+        :param batches: list of (source, target)
+        :param max_tokens: token budget
+        :param pad_to_max: batches padded to max lengths 8 and 6
+        :return: None
+        """
+        for source, target in batches:
+            if pad_to_max:
+                tokens = len(source) * (8 + 6)
+            else:
+                tokens = len(source) * (min(max(map(len, source)), 8) + min(max(map(len, target)), 6))
+            self.assertTrue(len(source) == 1 or tokens <= max_tokens, (len(source), tokens))
+    
+    def test_bucket_batches(self):
+        generator = np.random.RandomState(0)
+        source_lengths, target_lengths = generator.randint(1, 30, 200), generator.randint(1, 10, 200)
+        for pad_to_max in (False, True):
+            batches = bucket_batches(source_lengths, target_lengths, bucket_boundaries=[10, 20], max_tokens=100,
+                                     source_max_length=25, target_max_length=8, pad_to_max=pad_to_max)
+            self.assertEqual(sorted(idx for batch in batches for idx in batch), list(range(200)))
+            for batch in batches:
+                self.assertEqual(len(set(np.digitize(source_lengths[batch], [10, 20]))), 1)
+                if pad_to_max:
+                    tokens = len(batch) * (25 + 8)
+                else:
+                    tokens = len(batch) * (min(max(source_lengths[batch]), 25) + min(max(target_lengths[batch]), 8))
+                self.assertTrue(len(batch) == 1 or tokens <= 100)
+    
+    def test_bi_text_budget(self):
+        for pad_to_max in (False, True):
+            for kwargs in ({}, {'max_length': 10, 'skip_empty': True}, {'streaming': True, 'max_load_batches': 2}):
+                with self.subTest(pad_to_max=pad_to_max, **kwargs):
+                    iterator = self.bi_iterator(bucket_boundaries=[4, 8], max_tokens=60, source_max_length=8,
+                                                target_max_length=6, pad_to_max=pad_to_max, **kwargs)
+                    batches = list(iterator.next())
+                    self.assert_budget(batches, 60, pad_to_max)
+                    expected = 50 if 'max_length' not in kwargs else \
+                        len(list(self.bi_iterator(batch_size=1, max_length=10).next()))
+                    self.assertEqual(sum(len(source) for source, _ in batches), expected)
+    
+    def test_binary_budget(self):
+        prefix = self.folder.name + '/train'
+        compile_dataset(self.source, self.target, self.vocab, self.vocab, prefix)
+        for kwargs in ({}, {'max_length': 10, 'skip_empty': True}):
+            with self.subTest(**kwargs):
+                iterator = BinaryBiTextIterator(prefix, bucket_boundaries=[4, 8], max_tokens=60, source_max_length=8,
+                                                target_max_length=6, **kwargs)
+                batches = list(iterator.next())
+                self.assert_budget(batches, 60)
+                self.assertEqual(sum(len(source) for source, _ in batches),
+                                 sum(len(source) for source, _ in BinaryBiTextIterator(prefix, **kwargs).next()))
+
+
+
+class ExtendTest(unittest.TestCase):
+    def test_same_as_list_extend(self):
+        words = ['<GO>', '<EOS>', '<UNK>'] + list('abcdefgh') + ['ab', 'cd', 'xy', 'ef', 'gz']
+        word2id = {word: idx for idx, word in enumerate(words)}
+        generator = np.random.RandomState(0)
+        for source_size, target_size in ((8, 8), (10, 6), (6, 12)):
+            source_dict = Vocabulary.from_dict(word2id).truncate(source_size)
+            target_dict = Vocabulary.from_dict(word2id).truncate(target_size)
+            plain_source = {w: i for w, i in word2id.items() if i < source_size}
+            plain_target = {w: i for w, i in word2id.items() if i < target_size}
+            for _ in range(50):
+                source = list(generator.choice(words + ['zz', 'qa'], generator.randint(1, 10)))
+                target = list(generator.choice(words + ['zz', 'qa', 'hq'], generator.randint(1, 10)))
+                for split in (False, True):
+                    source_ids_extend, oovs_vocab = extend_source(source, source_dict, len(source_dict))
+                    target_ids_extend = extend_target(target, target_dict, len(target_dict), oovs_vocab,
+                                                      len(source_dict), split)
+                    self.assertEqual((source_ids_extend, target_ids_extend, oovs_vocab),
+                                     list_extend(source, target, plain_source, plain_target, split))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+from utils.losses import vocab_log_probs, pointer_log_probs, sequence_mean
+
+BATCH_SIZE, VOCAB_SIZE, OOVS_MAX_SIZE, ENCODER_TIME_STEPS, DECODER_TIME_STEPS = 4, 10, 2, 5, 3
+
+
+def merge_distribution(p_gen, attention_distribution, vocab_distribution, encoder_inputs_extend, oovs_max_size):
+    """
+    final distribution of pointer generator over extended vocab in probability space, like models before log loss
+    :param p_gen: [batch_size, 1]
+    :param attention_distribution: [batch_size, encoder_time_steps]
+    :param vocab_distribution: [batch_size, vocab_size]
+    :param encoder_inputs_extend: [batch_size, encoder_time_steps] numpy array
+    :param oovs_max_size: oovs max size
+    :return: [batch_size, vocab_size + oovs_max_size]
+    """
+    batch_size, attention_length = encoder_inputs_extend.shape
+    attention_distribution = (1 - p_gen) * attention_distribution
+    vocab_distribution = p_gen * vocab_distribution
+    batch_indices = tf.tile(tf.expand_dims(tf.range(0, batch_size), axis=1), [1, attention_length])
+    indices = tf.stack((batch_indices, encoder_inputs_extend), axis=2)
+    shape_extend = [batch_size, VOCAB_SIZE + oovs_max_size]
+    attention_distribution = tf.scatter_nd(indices, attention_distribution, shape_extend)
+    vocab_distribution = tf.concat([vocab_distribution, tf.zeros(shape=[batch_size, oovs_max_size])], axis=-1)
+    return attention_distribution + vocab_distribution
+
+
+class PointerLossTest(unittest.TestCase):
+    def setUp(self):
+        generator = np.random.RandomState(0)
+        self.logits = generator.randn(BATCH_SIZE, DECODER_TIME_STEPS, VOCAB_SIZE).astype(np.float32)
+        self.p_gen_logits = generator.randn(BATCH_SIZE, DECODER_TIME_STEPS, 1).astype(np.float32)
+        scores = generator.randn(BATCH_SIZE, DECODER_TIME_STEPS, ENCODER_TIME_STEPS)
+        self.attention = (np.exp(scores) / np.exp(scores).sum(axis=-1, keepdims=True)).astype(np.float32)
+        self.encoder_inputs_extend = generator.randint(0, VOCAB_SIZE + OOVS_MAX_SIZE,
+                                                       [BATCH_SIZE, ENCODER_TIME_STEPS]).astype(np.int32)
+        # first source word is an article oov
+        self.encoder_inputs_extend[:, 0] = VOCAB_SIZE
+        targets = generator.randint(0, VOCAB_SIZE + OOVS_MAX_SIZE, [BATCH_SIZE, DECODER_TIME_STEPS])
+        # oov targets not in source have zero probability, take first source word instead
+        for b, t in zip(*np.nonzero(targets >= VOCAB_SIZE)):
+            if targets[b, t] not in self.encoder_inputs_extend[b]:
+                targets[b, t] = self.encoder_inputs_extend[b, 0]
+        # first step copies a source word also in vocab
+        targets[:, 0] = self.encoder_inputs_extend[:, 1]
+        self.targets = targets.astype(np.int32)
+    
+    def test_same_as_probability_space(self):
+        with tf.Graph().as_default(), tf.Session() as sess:
+            targets = tf.constant(self.targets)
+            log_probs = pointer_log_probs(targets, vocab_log_probs(tf.constant(self.logits), targets),
+                                          tf.constant(self.p_gen_logits), tf.constant(self.attention),
+                                          tf.expand_dims(tf.constant(self.encoder_inputs_extend), axis=1), VOCAB_SIZE)
+            expected = []
+            for step in range(DECODER_TIME_STEPS):
+                final_distribution = merge_distribution(tf.sigmoid(self.p_gen_logits[:, step]),
+                                                        self.attention[:, step],
+                                                        tf.nn.softmax(self.logits[:, step]),
+                                                        self.encoder_inputs_extend, OOVS_MAX_SIZE)
+                indices = tf.stack((tf.range(0, BATCH_SIZE), self.targets[:, step]), axis=1)
+                expected.append(tf.log(tf.gather_nd(final_distribution, indices)))
+            log_probs, expected = sess.run((log_probs, tf.stack(expected, axis=1)))
+        self.assertEqual(log_probs.dtype, np.float32)
+        np.testing.assert_allclose(log_probs, expected, rtol=1e-5, atol=1e-5)
+    
+    def test_uncopyable_oov_finite_gradients(self):
+        with tf.Graph().as_default(), tf.Session() as sess:
+            # oov target missing in source, reachable by neither branch
+            targets = tf.fill([BATCH_SIZE], VOCAB_SIZE + 1)
+            encoder_inputs_extend = np.minimum(self.encoder_inputs_extend, VOCAB_SIZE)
+            logits = tf.constant(self.logits[:, 0])
+            p_gen_logits = tf.constant(self.p_gen_logits[:, 0])
+            attention = tf.constant(self.attention[:, 0])
+            log_probs = pointer_log_probs(targets, vocab_log_probs(logits, targets), p_gen_logits, attention,
+                                          encoder_inputs_extend, VOCAB_SIZE)
+            gradients = tf.gradients(tf.reduce_sum(log_probs), [logits, p_gen_logits, attention])
+            log_probs, gradients = sess.run((log_probs, gradients))
+        self.assertTrue(np.all(log_probs < -1e30))
+        for gradient in gradients:
+            self.assertTrue(np.all(np.isfinite(gradient)))
+    
+    def test_float16_inputs(self):
+        with tf.Graph().as_default(), tf.Session() as sess:
+            targets = tf.constant(self.targets)
+            inputs = [tf.constant(self.logits), tf.constant(self.p_gen_logits), tf.constant(self.attention)]
+            
+            def log_probs(dtype):
+                logits, p_gen_logits, attention = [tf.cast(tensor, dtype) for tensor in inputs]
+                return pointer_log_probs(targets, vocab_log_probs(logits, targets), p_gen_logits, attention,
+                                         tf.expand_dims(self.encoder_inputs_extend, axis=1), VOCAB_SIZE)
+            
+            log_probs_32, log_probs_16 = sess.run((log_probs(tf.float32), log_probs(tf.float16)))
+        self.assertEqual(log_probs_16.dtype, np.float32)
+        np.testing.assert_allclose(log_probs_16, log_probs_32, rtol=1e-2, atol=1e-2)
+    
+    def test_sequence_mean(self):
+        losses = np.arange(12, dtype=np.float32).reshape([3, 4])
+        masks = np.array([[1, 1, 1, 1], [1, 1, 0, 0], [1, 0, 0, 0]], dtype=np.float32)
+        with tf.Graph().as_default(), tf.Session() as sess:
+            mean = sess.run(sequence_mean(tf.constant(losses), tf.constant(masks)))
+        self.assertAlmostEqual(mean, np.mean([1.5, 4.5, 8.0]), places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
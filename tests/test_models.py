@@ -0,0 +1,155 @@
+import logging
+import unittest
+import numpy as np
+import tensorflow as tf
+from cls import get_model_class
+from utils.funcs import BatchCollator, flatten_batch
+
+# debug models take a data argument and are not built by train.py
+MODEL_CLASSES = ['seq2seq', 'seq2seq_attention', 'pointer_generator', 'pointer_generator_lab',
+                 'pointer_generator_coverage', 'pointer_generator_coverage_limit', 'pointer_generator_limit',
+                 'pointer_generator_limit_lab']
+
+CONFIG = {
+    'attention_units': 8,
+    'batch_size': 4,
+    'coverage_loss_weight': 1.0,
+    'decoder_depth': 1,
+    'decoder_max_time_steps': 6,
+    'decoder_vocab_size': 30,
+    'dropout_rate': 0.0,
+    'embedding_size': 8,
+    'encoder_depth': 1,
+    'encoder_max_time_steps': 10,
+    'encoder_vocab_size': 30,
+    'hidden_units': 8,
+    'learning_rate': 0.001,
+    'logger_name': 'test',
+    'max_gradient_norm': 1.0,
+    'optimizer_type': 'adam',
+    'use_bidirectional': False,
+    'use_dropout': False,
+    'use_fp16': False,
+}
+
+logger = logging.getLogger('test')
+
+
+def random_batch(config, batch_size=4, seed=0):
+    """
+    build raw batch of random ids shorter than max time steps, extended ids add article oovs
+    :param config: model config
+    :param batch_size: batch size
+    :param seed: random seed
+    :return: source batch, target batch, source extend batch, target extend batch, oovs max size
+    """
+    generator = np.random.RandomState(seed)
+    sources, targets, sources_extend, targets_extend = [], [], [], []
+    for _ in range(batch_size):
+        source = generator.randint(3, config['encoder_vocab_size'], generator.randint(2, 8)).tolist()
+        target = generator.randint(3, config['decoder_vocab_size'], generator.randint(2, 5)).tolist()
+        sources.append(source)
+        targets.append(target)
+        # first word of source and target is an article oov
+        sources_extend.append([config['encoder_vocab_size']] + source[1:])
+        targets_extend.append([config['decoder_vocab_size']] + target[1:])
+    return sources, targets, sources_extend, targets_extend, 1
+
+
+def model_inputs(model_class, config, batch):
+    """
+    pad raw batch to inputs of model.train and model.eval like train.py
+    :param model_class: model class
+    :param config: model config
+    :param batch: raw batch of random_batch
+    :return: inputs dict
+    """
+    pad_longest = getattr(model_class, 'pad_to_longest', False)
+    source_collator = BatchCollator(config['encoder_max_time_steps'], pad_longest=pad_longest)
+    target_collator = BatchCollator(config['decoder_max_time_steps'], pad_longest=pad_longest)
+    sources, targets, sources_extend, targets_extend, oovs_max_size = batch
+    source, source_extend, source_len = source_collator.collate(*flatten_batch(sources, sources_extend))
+    target, target_extend, target_len = target_collator.collate(*flatten_batch(targets, targets_extend))
+    inputs = {
+        'encoder_inputs': source,
+        'encoder_inputs_length': source_len,
+        'decoder_inputs': target,
+        'decoder_inputs_length': target_len,
+    }
+    if 'encoder_inputs_extend' in model_class.train.__code__.co_varnames:
+        inputs.update({
+            'encoder_inputs_extend': source_extend,
+            'decoder_inputs_extend': target_extend,
+            'oovs_max_size': oovs_max_size,
+        })
+    return inputs
+
+
+def train_losses(name, config, steps=1):
+    """
+    build model in new graph and run train steps on random batch
+    :param name: model class name
+    :param config: model config
+    :param steps: number of train steps
+    :return: list of train losses
+    """
+    model_class = get_model_class(name)
+    inputs = model_inputs(model_class, config, random_batch(config))
+    with tf.Graph().as_default(), tf.Session() as sess:
+        tf.set_random_seed(0)
+        model = model_class(dict(config, model_class=name), 'train', logger)
+        sess.run(tf.global_variables_initializer())
+        return [model.train(sess, **inputs)[0] for _ in range(steps)]
+
+
+class ModelGraphTest(unittest.TestCase):
+    def test_build_train(self):
+        for name in MODEL_CLASSES:
+            with self.subTest(model_class=name):
+                losses = train_losses(name, CONFIG)
+                self.assertTrue(np.isfinite(losses[0]))
+    
+    def test_build_inference(self):
+        for name in MODEL_CLASSES:
+            with self.subTest(model_class=name):
+                model_class = get_model_class(name)
+                inputs = model_inputs(model_class, CONFIG, random_batch(CONFIG))
+                with tf.Graph().as_default(), tf.Session() as sess:
+                    model = model_class(dict(CONFIG, model_class=name), 'inference', logger)
+                    sess.run(tf.global_variables_initializer())
+                    feed = {key: inputs[key] for key in model.inference.__code__.co_varnames if key in inputs}
+                    predicts = model.inference(sess, **feed)[0]
+                    self.assertEqual(len(predicts), len(inputs['encoder_inputs']))
+    
+    def test_sampled_softmax(self):
+        for name in MODEL_CLASSES:
+            with self.subTest(model_class=name):
+                losses = train_losses(name, dict(CONFIG, num_sampled=5), steps=2)
+                self.assertTrue(np.all(np.isfinite(losses)))
+    
+    def test_tied_embeddings(self):
+        for name in MODEL_CLASSES:
+            for num_sampled in (0, 5):
+                with self.subTest(model_class=name, num_sampled=num_sampled):
+                    config = dict(CONFIG, share_embeddings=True, tie_output_projection=True, num_sampled=num_sampled)
+                    losses = train_losses(name, config, steps=2)
+                    self.assertTrue(np.all(np.isfinite(losses)))
+    
+    def test_float16(self):
+        for name in MODEL_CLASSES:
+            with self.subTest(model_class=name):
+                config = dict(CONFIG, use_fp16=True, model_class=name)
+                model_class = get_model_class(name)
+                inputs = model_inputs(model_class, config, random_batch(config))
+                with tf.Graph().as_default(), tf.Session() as sess:
+                    tf.set_random_seed(0)
+                    model = model_class(config, 'train', logger)
+                    # master weights stay float32, float16 is only computed
+                    self.assertEqual({v.dtype.base_dtype for v in tf.trainable_variables()}, {tf.float32})
+                    sess.run(tf.global_variables_initializer())
+                    losses = [model.train(sess, **inputs)[0] for _ in range(3)]
+                self.assertTrue(np.all(np.isfinite(losses)))
+
+
+if __name__ == '__main__':
+    unittest.main()
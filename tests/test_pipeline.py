@@ -0,0 +1,89 @@
+import random
+import unittest
+from preprocess import config
+from preprocess.pipeline import UrlPipeline, PhonePipeline, EmailPipeline, ReplacePipeline, RemovePipeline, \
+    DatePipeline, TimePipeline, RegexPipeline, fuse_pipelines, process_pipelines, check_parser
+
+# rules whose replacements join neighbouring text into matches of following rules
+ADVERSARIAL_PATTERNS = [
+    [('x', 'a'), ('ab', 'Z')],
+    [('b', 'a'), ('aa', 'Z')],
+    [('a', 'b'), ('(?<=b)c', 'Z')],
+    [('a', 'b'), ('\\bb', 'Z')],
+    [('a', 'b'), ('c(?!b)', 'Z')],
+    [('a', ' '), ('\\s\\w', 'Z')],
+    [('a', 'bc'), ('[^a]c', 'Z'), ('Z', 'a')],
+]
+
+ADVERSARIAL_TEXTS = ['xb', 'bb', 'ac', 'aa b', 'ca', 'a a', 'xab', 'bab', 'aac', 'abcabc']
+
+
+def random_texts(alphabet, count, max_length=20, seed=0):
+    """
+    build random texts for equivalence checks
+    :param alphabet: characters to draw from
+    :param count: number of texts
+    :param max_length: max text length
+    :param seed: random seed
+    :return: list of text
+    """
+    generator = random.Random(seed)
+    return [''.join(generator.choice(alphabet) for _ in range(generator.randint(0, max_length)))
+            for _ in range(count)]
+
+
+class FusePipelinesTest(unittest.TestCase):
+    def assert_equivalent(self, pipelines, texts):
+        """
+        check fused pipelines give same text as chain
+        :param pipelines: list of pipelines
+        :param texts: list of text
+        :return: None
+        """
+        fused = fuse_pipelines(pipelines)
+        for text in texts:
+            self.assertEqual(process_pipelines(fused, text), process_pipelines(pipelines, text), repr(text))
+    
+    def test_adversarial_patterns(self):
+        texts = ADVERSARIAL_TEXTS + random_texts('xabcZ ', 500)
+        for patterns in ADVERSARIAL_PATTERNS:
+            with self.subTest(patterns=patterns):
+                self.assert_equivalent([ReplacePipeline(patterns)], texts)
+    
+    def test_config_patterns(self):
+        pipelines = [
+            UrlPipeline(),
+            PhonePipeline(),
+            EmailPipeline(),
+            ReplacePipeline(),
+            RemovePipeline(),
+            DatePipeline(),
+            TimePipeline(),
+        ]
+        texts = [
+            'visit https://www.example.com/a?b=1 now',
+            'call 13812345678, or mail me@example.com!',
+            'say ""hi"" and "bye" (twice); done',
+            'www.example.com@a.b url@phone.email',
+        ] + random_texts('ab1@.:/w()",!; ' + config.URL_PLACEHOLDER + config.EMAIL_PLACEHOLDER, 500, max_length=40)
+        self.assert_equivalent(pipelines, texts)
+        self.assert_equivalent(pipelines[::-1], texts)
+
+    
+    def test_rule_conflict_fallback(self):
+        # earlier rule matches inside match of later rule, scan falls back to chain
+        pipeline = RegexPipeline([('b', 'X'), ('abc', 'Y')])
+        self.assertIsNotNone(pipeline.regex)
+        self.assertEqual(pipeline.process_text('xbx abc'), 'xXx aXc')
+        self.assertEqual(pipeline.conflicts, 1)
+        self.assertEqual(pipeline.process_text('xbx ac'), 'xXx ac')
+        self.assertEqual(pipeline.conflicts, 1)
+        texts = ADVERSARIAL_TEXTS + random_texts('abcX ', 500)
+        self.assert_equivalent([ReplacePipeline([('b', 'X'), ('abc', 'Y')])], texts)
+    
+    def test_check_parser(self):
+        check_parser()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import tensorflow as tf
+from utils.precision import float32_variable_getter, loss_scale_optimizer
+
+
+class PrecisionTest(unittest.TestCase):
+    def test_float32_variable_getter(self):
+        with tf.Graph().as_default():
+            with tf.variable_scope('model', custom_getter=float32_variable_getter):
+                weights = tf.get_variable('weights', shape=[2, 3], dtype=tf.float16)
+                steps = tf.get_variable('steps', shape=[], dtype=tf.float16, trainable=False)
+                biases = tf.get_variable('biases', shape=[3], dtype=tf.float32)
+            self.assertEqual(weights.dtype, tf.float16)
+            self.assertEqual(steps.dtype.base_dtype, tf.float16)
+            self.assertEqual(biases.dtype.base_dtype, tf.float32)
+            variables = {v.op.name: v.dtype.base_dtype for v in tf.global_variables()}
+            self.assertEqual(variables, {'model/weights': tf.float32, 'model/steps': tf.float16,
+                                         'model/biases': tf.float32})
+    
+    def test_loss_scale_skips_overflow(self):
+        with tf.Graph().as_default(), tf.Session() as sess:
+            variable = tf.Variable(1.0)
+            scale = tf.placeholder(tf.float32, shape=[])
+            loss = tf.cast(tf.cast(variable, tf.float16) * tf.cast(scale, tf.float16), tf.float32)
+            optimizer = loss_scale_optimizer(tf.train.GradientDescentOptimizer(0.5))
+            train_op = optimizer.minimize(loss)
+            sess.run(tf.global_variables_initializer())
+            # scaled gradient overflows float16, step is skipped
+            sess.run(train_op, feed_dict={scale: 1e4})
+            self.assertEqual(sess.run(variable), 1.0)
+            # halved loss scale fits float16, steps are applied with unscaled gradient 1
+            for _ in range(4):
+                sess.run(train_op, feed_dict={scale: 1.0})
+            self.assertAlmostEqual(sess.run(variable), 1.0 - 0.5 * 4, places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+from utils.losses import vocab_log_probs, sampled_vocab_log_probs
+from utils.projection import TiedOutputProjection, output_projection, sampled_projection
+
+VOCAB_SIZE, HIDDEN_UNITS = 20, 6
+
+
+class SampledSoftmaxTest(unittest.TestCase):
+    def setUp(self):
+        generator = np.random.RandomState(0)
+        self.weights = generator.randn(VOCAB_SIZE, HIDDEN_UNITS).astype(np.float32)
+        self.biases = generator.randn(VOCAB_SIZE).astype(np.float32)
+        self.inputs = generator.randn(4, 3, HIDDEN_UNITS).astype(np.float32)
+        # extended targets out of vocab included
+        self.targets = generator.randint(0, VOCAB_SIZE + 2, [4, 3]).astype(np.int32)
+    
+    def run_log_probs(self, biases, targets, dtype=tf.float32):
+        """
+        sampled and full log probabilities of targets
+        :param biases: [vocab_size] projection biases
+        :param targets: [4, 3] extended target ids
+        :param dtype: dtype of projection and inputs
+        :return: sampled log probs, full log probs, gradients of sampled log probs
+        """
+        with tf.Graph().as_default(), tf.Session() as sess:
+            tf.set_random_seed(0)
+            weights, biases, inputs = [tf.cast(tf.constant(value), dtype)
+                                       for value in (self.weights, biases, self.inputs)]
+            sampled = sampled_vocab_log_probs(weights, biases, inputs, tf.constant(targets), 5, VOCAB_SIZE)
+            logits = tf.tensordot(inputs, tf.transpose(weights), axes=1) + biases
+            full = vocab_log_probs(logits, tf.constant(targets))
+            gradients = tf.gradients(tf.reduce_sum(sampled), [inputs])
+            return sess.run((sampled, full, gradients))
+    
+    def test_sampled_log_probs(self):
+        for dtype in (tf.float32, tf.float16):
+            with self.subTest(dtype=dtype):
+                sampled, full, gradients = self.run_log_probs(self.biases, self.targets, dtype)
+                self.assertEqual(sampled.shape, self.targets.shape)
+                self.assertEqual(sampled.dtype, np.float32)
+                self.assertTrue(np.all(np.isfinite(sampled)))
+                self.assertTrue(np.all(sampled <= 1e-6))
+                self.assertTrue(np.all(np.isfinite(gradients[0].astype(np.float32))))
+                self.assertEqual(full.shape, self.targets.shape)
+    
+    def test_dominant_target(self):
+        # target logit far above all others, sampled and full probability both close to one
+        targets = np.full([4, 3], 3, dtype=np.int32)
+        biases = self.biases.copy()
+        biases[3] = 50
+        sampled, full, _ = self.run_log_probs(biases, targets)
+        np.testing.assert_allclose(sampled, 0, atol=1e-4)
+        np.testing.assert_allclose(full, 0, atol=1e-4)
+
+
+
+class TiedProjectionTest(unittest.TestCase):
+    def setUp(self):
+        generator = np.random.RandomState(0)
+        self.embeddings = generator.randn(VOCAB_SIZE, 4).astype(np.float32)
+        self.inputs = generator.randn(2, 3, HIDDEN_UNITS).astype(np.float32)
+    
+    def test_tied_logits(self):
+        with tf.Graph().as_default(), tf.Session() as sess:
+            embeddings = tf.Variable(self.embeddings)
+            projection = output_projection(VOCAB_SIZE, 'output_projection', embeddings)
+            self.assertIsInstance(projection, TiedOutputProjection)
+            logits = projection(tf.constant(self.inputs))
+            self.assertEqual(logits.shape.as_list(), [2, 3, VOCAB_SIZE])
+            # only adapter kernel and bias are added, no [hidden_units, vocab_size] kernel
+            self.assertEqual(sorted(v.shape.as_list() for v in tf.trainable_variables()),
+                             sorted([[VOCAB_SIZE, 4], [HIDDEN_UNITS, 4], [VOCAB_SIZE]]))
+            gradient = tf.gradients(tf.reduce_sum(logits), [embeddings])[0]
+            sess.run(tf.global_variables_initializer())
+            sess.run(projection.bias.assign(np.arange(VOCAB_SIZE, dtype=np.float32)))
+            logits, adapter_kernel, gradient = sess.run((logits, projection.adapter.kernel, gradient))
+        expected = self.inputs.dot(adapter_kernel).dot(self.embeddings.T) + np.arange(VOCAB_SIZE)
+        np.testing.assert_allclose(logits, expected, rtol=1e-5, atol=1e-5)
+        self.assertTrue(np.any(gradient != 0))
+    
+    def test_sampled_projection_same_logits(self):
+        for tied in (False, True):
+            with self.subTest(tied=tied), tf.Graph().as_default(), tf.Session() as sess:
+                embeddings = tf.Variable(self.embeddings) if tied else None
+                projection = output_projection(VOCAB_SIZE, 'output_projection', embeddings)
+                inputs = tf.constant(self.inputs)
+                logits = projection(inputs)
+                weights, biases, sampled_inputs = sampled_projection(projection, inputs)
+                sampled_logits = tf.tensordot(sampled_inputs, tf.transpose(weights), axes=1) + biases
+                sess.run(tf.global_variables_initializer())
+                logits, sampled_logits = sess.run((logits, sampled_logits))
+                np.testing.assert_allclose(sampled_logits, logits, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+import unittest
+import jieba
+from preprocess.segment import Segmenter
+
+TEXTS = ['我爱北京天安门', ' 我爱北京 ', '我爱北京\n', ' a b ', '', 'url和email']
+
+
+class SegmenterTest(unittest.TestCase):
+    def test_same_as_jieba(self):
+        segmenter = Segmenter(words=[], cache_size=2)
+        # twice to read results from cache
+        for text in TEXTS + TEXTS:
+            self.assertEqual(segmenter.segment(text), ' '.join(jieba.cut(text)), repr(text))
+    
+    def test_remove_spaces(self):
+        segmenter = Segmenter(words=[], remove_spaces=True)
+        for text in TEXTS:
+            self.assertEqual(segmenter.segment(text), ' '.join(jieba.lcut(text.replace(' ', ''))), repr(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
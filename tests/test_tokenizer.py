@@ -0,0 +1,139 @@
+import re
+import json
+import socket
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from preprocess.tokenizer import CoreNLPTokenizer, CoreNLPError, RegexTokenizer, DOC_SEPARATOR, utf16_length
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer like CoreNLP tokenize,ssplit, tokens split by whitespace, offsets in utf-16 units."""
+    
+    def do_POST(self):
+        text = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        documents = text.split(DOC_SEPARATOR)
+        if not self.server.record(documents):
+            self.send_error(500)
+            return
+        sentences = []
+        for sentence in re.finditer(r'.+?(?:\n\n|$)', text, re.S):
+            tokens = [{
+                'word': token.group(),
+                'originalText': token.group(),
+                'characterOffsetBegin': utf16_length(text[:token.start()]),
+            } for token in re.finditer(r'\S+', text[:sentence.end()]) if token.start() >= sentence.start()]
+            sentences.append({'tokens': tokens})
+        body = json.dumps({'sentences': sentences}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        # number of requests to fail before answering
+        self.failures = 0
+        # requests containing this text are rejected
+        self.bad_text = None
+        # documents of each request
+        self.requests = []
+        self.lock = threading.Lock()
+    
+    def record(self, documents):
+        """
+        record request, decide whether to answer it
+        :param documents: documents of request
+        :return: False to answer with error
+        """
+        with self.lock:
+            self.requests.append(documents)
+            if self.failures > 0:
+                self.failures -= 1
+                return False
+        return self.bad_text is None or not any(self.bad_text in document for document in documents)
+    
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+
+class CoreNLPTokenizerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def tokenizer(self, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        return CoreNLPTokenizer(url=self.server.url, **kwargs)
+    
+    def test_offsets(self):
+        texts = ['a \U0001F600 b', '\U0001D4B3\U0001D4B3 y', 'z中 \U00020000x w']
+        results = self.tokenizer().tokenize_batch(texts)
+        self.assertEqual(results, texts)
+        self.assertEqual(self.server.requests, [texts])
+    
+    def test_empty_texts(self):
+        results = self.tokenizer().tokenize_batch(['', 'a b', '', 'c'])
+        self.assertEqual(results, ['', 'a b', '', 'c'])
+        self.assertEqual(self.server.requests, [['a b', 'c']])
+    
+    def test_retries(self):
+        self.server.failures = 2
+        results = self.tokenizer(retries=2).tokenize_batch(['a b', 'c'])
+        self.assertEqual(results, ['a b', 'c'])
+        self.assertEqual(len(self.server.requests), 3)
+    
+    def test_batch_halving(self):
+        self.server.bad_text = 'bad'
+        tokenizer = self.tokenizer(retries=0, fallback=RegexTokenizer())
+        results = tokenizer.tokenize_batch(['a b', 'bad, doc', 'c', 'd e'])
+        self.assertEqual(results, ['a b', 'bad , doc', 'c', 'd e'])
+        self.assertEqual([len(documents) for documents in self.server.requests], [4, 2, 1, 1, 2])
+        self.assertEqual(tokenizer.errors, 1)
+    
+    def test_rejected_without_fallback(self):
+        self.server.bad_text = 'bad'
+        with self.assertRaises(CoreNLPError):
+            self.tokenizer(retries=0).tokenize_batch(['a', 'bad'])
+    
+    def test_fallback_when_down(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://%s:%d' % sock.getsockname()
+        sock.close()
+        tokenizer = CoreNLPTokenizer(url=url, retries=1, backoff=0, fallback=RegexTokenizer())
+        self.assertEqual(tokenizer.tokenize_batch(['a,b', 'c']), ['a , b', 'c'])
+        self.assertEqual(tokenizer.errors, 2)
+        with self.assertRaises(CoreNLPError):
+            CoreNLPTokenizer(url=url, retries=0, backoff=0).tokenize_batch(['a'])
+    
+    def test_line_alignment(self):
+        self.server.bad_text = 'bad'
+        lines = ['line %d' % index if index % 7 else '' for index in range(100)]
+        lines[42] = 'bad.line'
+        tokenizer = self.tokenizer(batch_size=8, max_chars=50, concurrency=4, retries=0, fallback=RegexTokenizer())
+        results = list(tokenizer.tokenize_lines(iter(lines)))
+        expected = list(lines)
+        expected[42] = 'bad . line'
+        self.assertEqual(results, expected)
+        self.assertEqual(tokenizer.errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import unittest
+from utils.config import UNK_WORD
+from utils.vocab import Vocabulary, load_vocab
+
+WORD2ID = {'<GO>': 0, '<EOS>': 1, '<UNK>': 2, 'a': 3, '中文': 4, 'bc': 6, 'd': 7}
+
+
+class VocabularyTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    
+    def assert_same_as_dict(self, vocab, n_words):
+        word2id = {w: i for w, i in WORD2ID.items() if n_words < 0 or i < n_words}
+        self.assertEqual(len(vocab), len(word2id))
+        for word in list(WORD2ID) + ['missing']:
+            self.assertEqual(word in vocab, word in word2id)
+            self.assertEqual(vocab.get(word), word2id.get(word))
+            self.assertEqual(vocab.get(word, -1), word2id.get(word, -1))
+        self.assertEqual(vocab.ids(list(WORD2ID) + ['missing'], 2),
+                         [word2id.get(w, 2) for w in list(WORD2ID) + ['missing']])
+        id2word = {i: w for w, i in word2id.items()}
+        for idx in range(-1, 10):
+            self.assertEqual(vocab.word(idx), id2word.get(idx, UNK_WORD))
+        with self.assertRaises(KeyError):
+            vocab['missing']
+    
+    def test_from_dict(self):
+        self.assert_same_as_dict(Vocabulary.from_dict(WORD2ID), -1)
+    
+    def test_truncate(self):
+        vocab = Vocabulary.from_dict(WORD2ID)
+        for n_words in (-1, 0, 3, 5, 7, 100):
+            with self.subTest(n_words=n_words):
+                view = vocab.truncate(n_words)
+                self.assert_same_as_dict(view, n_words if n_words < 8 else -1)
+                self.assertIs(view.data, vocab.data)
+        # truncating a view again can widen it up to full vocab
+        self.assert_same_as_dict(vocab.truncate(3).truncate(-1), -1)
+        self.assert_same_as_dict(load_vocab(vocab, 4), 4)
+    
+    def test_load(self):
+        json_path = os.path.join(self.folder, 'vocab.json')
+        pickle_path = os.path.join(self.folder, 'vocab.pkl')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(WORD2ID, f, ensure_ascii=False)
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(WORD2ID, f)
+        for path in (json_path, pickle_path):
+            with self.subTest(path=path):
+                self.assert_same_as_dict(Vocabulary.load(path), -1)
+                self.assert_same_as_dict(load_vocab(path, 5), 5)
+        # loading leaves nothing next to vocab file
+        self.assertEqual(sorted(os.listdir(self.folder)), ['vocab.json', 'vocab.pkl'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,8 +7,11 @@ import numpy as np
 import tensorflow as tf
 from os.path import join
 from utils.iterator import BiTextIterator
+from utils.binary import BinaryBiTextIterator
+from utils.prefetch import BatchPrefetcher
+from utils.dataset import DatasetInputs, generator_dataset, tfrecord_dataset, batch_dataset
 from tqdm import tqdm
-from utils.funcs import prepare_pair_batch, get_summary, remove_variable_suffix, add_variable_suffix
+from utils.funcs import BatchCollator, flatten_batch, get_summary, remove_variable_suffix, add_variable_suffix
 import os
 import logging
 from cls import get_model_class
@@ -25,6 +28,10 @@ tf.app.flags.DEFINE_string('source_valid_data', 'dataset/couplet/valid.x.txt',
                            'Path to source validation data')
 tf.app.flags.DEFINE_string('target_valid_data', 'dataset/couplet/valid.y.txt',
                            'Path to target validation data')
+tf.app.flags.DEFINE_string('train_binary', '', 'Prefix of compiled binary training data, see compile.py')
+tf.app.flags.DEFINE_string('valid_binary', '', 'Prefix of compiled binary validation data, see compile.py')
+tf.app.flags.DEFINE_string('train_tfrecord', '', 'File pattern of training tfrecord shards, see compile.py')
+tf.app.flags.DEFINE_string('valid_tfrecord', '', 'File pattern of validation tfrecord shards, see compile.py')
 
 # Network parameters
 tf.app.flags.DEFINE_string('model_class', 'pointer_generator_coverage', 'Model class')
@@ -32,6 +39,9 @@ tf.app.flags.DEFINE_string('cell_type', 'gru', 'RNN cell for encoder and decoder
 tf.app.flags.DEFINE_string('attention_type', 'bahdanau', 'Attention mechanism: (bahdanau, luong), default: bahdanau')
 tf.app.flags.DEFINE_integer('hidden_units', 400, 'Number of hidden units in each layer')
 tf.app.flags.DEFINE_integer('attention_units', 256, 'Number of attention units in each layer')
+tf.app.flags.DEFINE_boolean('mask_attention', False, 'Give no attention to padded encoder positions')
+tf.app.flags.DEFINE_boolean('share_embeddings', False, 'Share encoder and decoder embeddings, vocab sizes must match')
+tf.app.flags.DEFINE_boolean('tie_output_projection', False, 'Tie output projection to decoder embeddings by adapter')
 tf.app.flags.DEFINE_integer('encoder_depth', 3, 'Number of layers in encoder')
 tf.app.flags.DEFINE_integer('decoder_depth', 3, 'Number of layers in decoder')
 tf.app.flags.DEFINE_integer('embedding_size', 300, 'Embedding dimensions of encoder and decoder inputs')
@@ -49,18 +59,25 @@ tf.app.flags.DEFINE_float('max_gradient_norm', 1.0, 'Clip gradients to this norm
 tf.app.flags.DEFINE_integer('batch_size', 5, 'Batch size')
 tf.app.flags.DEFINE_integer('max_epochs', 10000, 'Maximum # of training epochs')
 tf.app.flags.DEFINE_integer('max_load_batches', 20, 'Maximum # of batches to load at one time')
+tf.app.flags.DEFINE_integer('prefetch_batches', 8, 'Maximum # of batches prepared in background, 0 to disable')
+tf.app.flags.DEFINE_string('input_pipeline', 'feed_dict', 'Input pipeline: (feed_dict, dataset)')
+tf.app.flags.DEFINE_integer('dataset_parallel_calls', 4, 'Parallel calls of dataset map and shard reading')
 tf.app.flags.DEFINE_integer('encoder_max_time_steps', 30, 'Maximum sequence length')
 tf.app.flags.DEFINE_integer('decoder_max_time_steps', 30, 'Maximum sequence length')
 tf.app.flags.DEFINE_float('coverage_loss_weight', 1.0, 'Coverage loss weight')
+tf.app.flags.DEFINE_integer('num_sampled', 0, 'Number of sampled ids of sampled softmax in training, 0 for full softmax')
 tf.app.flags.DEFINE_integer('display_freq', 5, 'Display training status every this iteration')
 tf.app.flags.DEFINE_integer('save_freq', 1000, 'Save model checkpoint every this iteration')
 tf.app.flags.DEFINE_integer('valid_freq', 1000, 'Evaluate model every this iteration: valid_data needed')
 tf.app.flags.DEFINE_string('optimizer_type', 'adam', 'Optimizer for training: (adadelta, adam, rmsprop)')
 tf.app.flags.DEFINE_string('model_dir', 'checkpoints/couplet', 'Path to save model checkpoints')
 tf.app.flags.DEFINE_string('model_name', 'model.ckpt', 'File name used for model checkpoints')
-tf.app.flags.DEFINE_boolean('use_fp16', False, 'Use half precision float16 instead of float32 as dtype')
+tf.app.flags.DEFINE_boolean('use_fp16', False, 'Compute in float16 with float32 variables and dynamic loss scaling')
 tf.app.flags.DEFINE_boolean('shuffle_each_epoch', False, 'Shuffle training dataset for each epoch')
 tf.app.flags.DEFINE_boolean('sort_by_length', False, 'Sort pre-fetched mini batches by their target sequence lengths')
+tf.app.flags.DEFINE_string('bucket_boundaries', '', 'Source length boundaries of buckets, eg: 20,40,60')
+tf.app.flags.DEFINE_integer('max_tokens', 0, 'Max padded tokens of a batch instead of batch_size, 0 to disable')
+tf.app.flags.DEFINE_boolean('streaming', False, 'Stream dataset, only max_load_batches batches are loaded at one time')
 tf.app.flags.DEFINE_boolean('extend_vocabs', False, 'Whether to extend oov vocabs')
 tf.app.flags.DEFINE_boolean('split_vocabs', False, 'Whether to split oov vocabs')
 tf.app.flags.DEFINE_boolean('pre_train', False, 'Whether to continue with pre-trained model')
@@ -83,15 +100,18 @@ logger = logging.getLogger(FLAGS.logger_name)
 print(FLAGS.flag_values_dict())
 
 
-def create_model(session, config):
+def create_model(session, config, inputs=None):
     """
     create model with session and config
     :param session: session object
     :param config: config dict
+    :param inputs: input tensors by placeholder name, None to feed placeholders
     :return:
     """
     model_class = get_model_class(config['model_class'])
-    model = model_class(config, 'train', logger)
+    # debug models take no inputs argument
+    model = model_class(config, 'train', logger) if inputs is None else \
+        model_class(config, 'train', logger, inputs=inputs)
     
     ckpt = tf.train.get_checkpoint_state(FLAGS.model_dir)
     if ckpt and tf.train.checkpoint_exists(ckpt.model_checkpoint_path):
@@ -138,6 +158,112 @@ def create_model(session, config):
     return model
 
 
+def build_batch_preparer(num_buffers=0, pad_longest=False):
+    """
+    build function transfer raw batch of iterator to padded model inputs
+    :param num_buffers: reusable output buffers, must exceed batches alive at the same time
+    :param pad_longest: pad to longest sentence of batch instead of max time steps, see model pad_to_longest
+    :return: prepare function, outputs inputs dict of model.train and model.eval
+    """
+    source_collator = BatchCollator(FLAGS.encoder_max_time_steps, num_buffers, pad_longest)
+    target_collator = BatchCollator(FLAGS.decoder_max_time_steps, num_buffers, pad_longest)
+    target_extend_collator = BatchCollator(FLAGS.decoder_max_time_steps, num_buffers, pad_longest)
+    
+    def prepare(batch):
+        if FLAGS.extend_vocabs:
+            source_batch, target_batch, source_extend_batch, target_extend_batch, oovs_max_size, _ = batch
+            
+            # source and source extend share lengths, pad them together
+            source, source_extend, source_len = source_collator.collate(
+                *flatten_batch(source_batch, source_extend_batch))
+            target, target_len = target_collator.collate(*flatten_batch(target_batch))
+            target_extend, _ = target_extend_collator.collate(*flatten_batch(target_extend_batch))
+            
+            return {
+                'encoder_inputs': source,
+                'encoder_inputs_extend': source_extend,
+                'encoder_inputs_length': source_len,
+                'decoder_inputs': target,
+                'decoder_inputs_extend': target_extend,
+                'decoder_inputs_length': target_len,
+                'oovs_max_size': oovs_max_size
+            }
+        
+        source_batch, target_batch = batch
+        
+        source, source_len = source_collator.collate(*flatten_batch(source_batch))
+        target, target_len = target_collator.collate(*flatten_batch(target_batch))
+        return {
+            'encoder_inputs': source,
+            'encoder_inputs_length': source_len,
+            'decoder_inputs': target,
+            'decoder_inputs_length': target_len
+        }
+    
+    return prepare
+
+
+def build_dataset(data_set, tfrecord, bucket_boundaries=None, max_tokens=0, pad_longest=False):
+    """
+    build dataset of padded model inputs, batched by buckets and token budget like the iterators
+    :param data_set: bi text iterator, used if tfrecord not set
+    :param tfrecord: file pattern of tfrecord shards
+    :param bucket_boundaries: source length boundaries of buckets
+    :param max_tokens: max padded tokens of batch instead of batch size, 0 to disable
+    :param pad_longest: pad to longest of batch instead of max time steps
+    :return: dataset
+    """
+    if tfrecord:
+        dataset = tfrecord_dataset(tfrecord, extend=FLAGS.extend_vocabs, num_parallel_calls=FLAGS.dataset_parallel_calls,
+                                   shuffle=FLAGS.shuffle_each_epoch)
+    else:
+        dataset = generator_dataset(data_set, extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs)
+    return batch_dataset(dataset, FLAGS.batch_size, FLAGS.encoder_max_time_steps, FLAGS.decoder_max_time_steps,
+                         num_parallel_calls=FLAGS.dataset_parallel_calls,
+                         prefetch_size=max(FLAGS.prefetch_batches, 1),
+                         bucket_boundaries=bucket_boundaries,
+                         max_tokens=max_tokens,
+                         pad_longest=pad_longest)
+
+
+def feed_steps(sess, step, batches, name):
+    """
+    run step on padded batches fed by feed_dict
+    :param sess: session object
+    :param step: model.train or model.eval
+    :param batches: BatchPrefetcher
+    :param name: Training or Validating
+    :return: generator of step outputs, encoder inputs length, decoder inputs length
+    """
+    for inputs in batches:
+        if FLAGS.extend_vocabs:
+            logger.info('%s batch data shape %s, %s, %s, %s', name, inputs['encoder_inputs'].shape,
+                        inputs['decoder_inputs'].shape, inputs['encoder_inputs_extend'].shape,
+                        inputs['decoder_inputs_extend'].shape)
+        else:
+            logger.info('%s batch data shape %s, %s', name, inputs['encoder_inputs'].shape,
+                        inputs['decoder_inputs'].shape)
+        yield step(sess, **inputs), inputs['encoder_inputs_length'], inputs['decoder_inputs_length']
+
+
+def dataset_steps(sess, model, dataset_inputs, name):
+    """
+    run step on batches read by dataset iterator in graph
+    :param sess: session object
+    :param model: model object
+    :param dataset_inputs: DatasetInputs
+    :param name: train or valid
+    :return: generator of step outputs, encoder inputs length, decoder inputs length
+    """
+    if name == 'train':
+        fetches = [[model.train_loss, model.train_op], model.encoder_inputs_length, model.decoder_inputs_length]
+        feed_dict = {model.keep_prob.name: 1 - model.dropout_rate}
+    else:
+        fetches = [model.loss, model.encoder_inputs_length, model.decoder_inputs_length]
+        feed_dict = {model.keep_prob.name: 1}
+    return dataset_inputs.steps(sess, name, fetches, feed_dict)
+
+
 def train():
     """
     train process
@@ -147,21 +273,59 @@ def train():
         os.environ['CUDA_VISIBLE_DEVICES'] = FLAGS.gpu
     logger.info('Using GPU %s', os.environ.get('CUDA_VISIBLE_DEVICES'))
     
+    # source length boundaries of buckets
+    bucket_boundaries = [int(b) for b in FLAGS.bucket_boundaries.split(',') if b]
+    # batches are padded to longest of batch if model allows, else to max time steps, token budget counts either,
+    # unmasked attention would see fewer pads than inference, which pads to max time steps, so masking is required
+    pad_longest = getattr(get_model_class(FLAGS.model_class), 'pad_to_longest', False) and FLAGS.mask_attention
+    
     # Load parallel data to train
     logger.info('Loading training data...')
-    train_set = BiTextIterator(source=FLAGS.source_train_data,
-                               target=FLAGS.target_train_data,
-                               source_dict=FLAGS.source_vocabulary,
-                               target_dict=FLAGS.target_vocabulary,
-                               batch_size=FLAGS.batch_size,
-                               n_words_source=FLAGS.encoder_vocab_size,
-                               n_words_target=FLAGS.decoder_vocab_size,
-                               sort_by_length=FLAGS.sort_by_length,
-                               split_sign=FLAGS.split_sign,
-                               max_length=None,
-                               )
+    if FLAGS.train_binary:
+        train_set = BinaryBiTextIterator(prefix=FLAGS.train_binary,
+                                         batch_size=FLAGS.batch_size,
+                                         n_words_source=FLAGS.encoder_vocab_size,
+                                         n_words_target=FLAGS.decoder_vocab_size,
+                                         sort_by_length=FLAGS.sort_by_length,
+                                         shuffle=FLAGS.shuffle_each_epoch,
+                                         bucket_boundaries=bucket_boundaries,
+                                         max_tokens=FLAGS.max_tokens,
+                                         source_max_length=FLAGS.encoder_max_time_steps,
+                                         target_max_length=FLAGS.decoder_max_time_steps,
+                                         pad_to_max=not pad_longest,
+                                         max_length=None,
+                                         )
+    else:
+        train_set = BiTextIterator(source=FLAGS.source_train_data,
+                                   target=FLAGS.target_train_data,
+                                   source_dict=FLAGS.source_vocabulary,
+                                   target_dict=FLAGS.target_vocabulary,
+                                   batch_size=FLAGS.batch_size,
+                                   n_words_source=FLAGS.encoder_vocab_size,
+                                   n_words_target=FLAGS.decoder_vocab_size,
+                                   sort_by_length=FLAGS.sort_by_length,
+                                   shuffle=FLAGS.shuffle_each_epoch,
+                                   streaming=FLAGS.streaming,
+                                   max_load_batches=FLAGS.max_load_batches,
+                                   bucket_boundaries=bucket_boundaries,
+                                   max_tokens=FLAGS.max_tokens,
+                                   source_max_length=FLAGS.encoder_max_time_steps,
+                                   target_max_length=FLAGS.decoder_max_time_steps,
+                                   pad_to_max=not pad_longest,
+                                   split_sign=FLAGS.split_sign,
+                                   max_length=None,
+                                   )
     
-    if FLAGS.source_valid_data and FLAGS.target_valid_data:
+    if FLAGS.valid_binary:
+        logger.info('Loading validation data...')
+        valid_set = BinaryBiTextIterator(prefix=FLAGS.valid_binary,
+                                         batch_size=FLAGS.batch_size,
+                                         n_words_source=FLAGS.encoder_vocab_size,
+                                         n_words_target=FLAGS.decoder_vocab_size,
+                                         sort_by_length=FLAGS.sort_by_length,
+                                         max_length=None
+                                         )
+    elif FLAGS.source_valid_data and FLAGS.target_valid_data:
         logger.info('Loading validation data...')
         valid_set = BiTextIterator(source=FLAGS.source_valid_data,
                                    target=FLAGS.target_valid_data,
@@ -171,12 +335,23 @@ def train():
                                    n_words_source=FLAGS.encoder_vocab_size,
                                    n_words_target=FLAGS.decoder_vocab_size,
                                    sort_by_length=FLAGS.sort_by_length,
+                                   streaming=FLAGS.streaming,
+                                   max_load_batches=FLAGS.max_load_batches,
                                    split_sign=FLAGS.split_sign,
                                    max_length=None
                                    )
     else:
         valid_set = None
     
+    # read inputs by dataset iterator in graph instead of feed_dict
+    dataset_inputs = None
+    if FLAGS.input_pipeline == 'dataset':
+        datasets = {'train': build_dataset(train_set, FLAGS.train_tfrecord, bucket_boundaries, FLAGS.max_tokens,
+                                           pad_longest)}
+        if valid_set or FLAGS.valid_tfrecord:
+            datasets['valid'] = build_dataset(valid_set, FLAGS.valid_tfrecord, pad_longest=pad_longest)
+        dataset_inputs = DatasetInputs(datasets)
+    
     # Initiate TF session
     with tf.Session(config=tf.ConfigProto(allow_soft_placement=FLAGS.allow_soft_placement,
                                           log_device_placement=FLAGS.log_device_placement,
@@ -185,7 +360,7 @@ def train():
         config = FLAGS.flag_values_dict()
         
         # Create a new model or reload existing checkpoint
-        model = create_model(sess, config)
+        model = create_model(sess, config, dataset_inputs.inputs if dataset_inputs else None)
         
         # Create a log writer object
         train_summary_writer = tf.summary.FileWriter(join(FLAGS.model_dir, 'train'), graph=sess.graph)
@@ -195,6 +370,12 @@ def train():
         words_seen, sents_seen, processed_number = 0, 0, 0
         start_time = time.time()
         
+        has_valid = bool(valid_set or dataset_inputs and 'valid' in dataset_inputs.iterators)
+        
+        # padded batches alive: queued ones, one being prepared and one being trained
+        prepare_train_batch = build_batch_preparer(FLAGS.prefetch_batches + 2, pad_longest)
+        prepare_valid_batch = build_batch_preparer(FLAGS.prefetch_batches + 2, pad_longest)
+        
         # Training loop
         logger.info('Training...')
         
@@ -204,64 +385,29 @@ def train():
                             model.global_epoch_step.eval(), FLAGS.max_epochs)
                 break
             
-            train_set.reset()
-            
             with tqdm(total=train_set.length()) as pbar:
                 
-                for batch in train_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs):
+                if dataset_inputs:
+                    train_batches = None
+                    train_steps = dataset_steps(sess, model, dataset_inputs, 'train')
+                else:
+                    train_set.reset()
+                    # prepare padded batches in background while training step is running
+                    train_batches = BatchPrefetcher(
+                        train_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs),
+                        prepare_train_batch,
+                        queue_size=FLAGS.prefetch_batches)
+                    train_steps = feed_steps(sess, model.train, train_batches, 'Training')
+                
+                # Execute a single training step
+                for (step_loss, _), source_len, target_len in train_steps:
                     
-                    if FLAGS.extend_vocabs:
-                        source_batch, target_batch, source_extend_batch, target_extend_batch, oovs_max_size, _ = batch
-                        
-                        # Get a batch from training parallel data
-                        source, source_len, target, target_len = prepare_pair_batch(
-                            source_batch, target_batch,
-                            FLAGS.encoder_max_time_steps,
-                            FLAGS.decoder_max_time_steps)
-                        
-                        # Get a batch from training parallel data
-                        source_extend, _, target_extend, _ = prepare_pair_batch(
-                            source_extend_batch, target_extend_batch,
-                            FLAGS.encoder_max_time_steps,
-                            FLAGS.decoder_max_time_steps)
-                        
-                        logger.info('Training batch data shape %s, %s, %s, %s', source.shape, target.shape,
-                                    source_extend.shape, target_extend.shape)
-                        processed_number += len(source_batch)
-                        
-                        # Execute a single training step
-                        step_loss, _ = model.train(sess,
-                                                   encoder_inputs=source,
-                                                   encoder_inputs_extend=source_extend,
-                                                   encoder_inputs_length=source_len,
-                                                   decoder_inputs=target,
-                                                   decoder_inputs_extend=target_extend,
-                                                   decoder_inputs_length=target_len,
-                                                   oovs_max_size=oovs_max_size
-                                                   )
-                    
-                    else:
-                        source_batch, target_batch = batch
-                        
-                        # Get a batch from training parallel data
-                        source, source_len, target, target_len = prepare_pair_batch(source_batch, target_batch,
-                                                                                    FLAGS.encoder_max_time_steps,
-                                                                                    FLAGS.decoder_max_time_steps)
-                        logger.info('Training batch data shape %s, %s', source.shape, target.shape)
-                        
-                        processed_number += len(source_batch)
-                        
-                        # Execute a single training step
-                        step_loss, _ = model.train(sess,
-                                                   encoder_inputs=source,
-                                                   encoder_inputs_length=source_len,
-                                                   decoder_inputs=target,
-                                                   decoder_inputs_length=target_len)
+                    processed_number += len(source_len)
                     
                     loss += float(step_loss) / FLAGS.display_freq
                     
                     words_seen += float(np.sum(source_len + target_len))
-                    sents_seen += float(source.shape[0])  # batch_size
+                    sents_seen += float(len(source_len))  # batch_size
                     
                     if model.global_step.eval() % FLAGS.display_freq == 0:
                         avg_perplexity = math.exp(float(loss)) if loss < 300 else float('inf')
@@ -272,13 +418,18 @@ def train():
                         words_per_sec = words_seen / time_elapsed
                         sents_per_sec = sents_seen / time_elapsed
                         
+                        # time training loop waited on data, included in step time of dataset pipeline
+                        data_wait_time = train_batches.pop_wait_time() if train_batches else 0.0
+                        
                         logger.info(
-                            'Epoch: %s Step: %s Perplexity: %.2f Loss: %s Step-time: %s %.2f sents/s %.2f words/s',
+                            'Epoch: %s Step: %s Perplexity: %.2f Loss: %s Step-time: %s Data-wait: %.2fs '
+                            '%.2f sents/s %.2f words/s',
                             model.global_epoch_step.eval(),
                             model.global_step.eval(),
                             avg_perplexity,
                             loss,
                             step_time,
+                            data_wait_time,
                             sents_per_sec,
                             words_per_sec
                         )
@@ -286,6 +437,8 @@ def train():
                         # Record training summary for the current batch
                         summary = get_summary('train_loss', loss)
                         train_summary_writer.add_summary(summary, model.global_step.eval())
+                        summary = get_summary('data_wait_time', data_wait_time)
+                        train_summary_writer.add_summary(summary, model.global_step.eval())
                         logger.info('Recording training summary step: %s', model.global_step.eval())
                         train_summary_writer.flush()
                         
@@ -299,68 +452,34 @@ def train():
                         start_time = time.time()
                     
                     # Execute a validation step
-                    if valid_set and model.global_step.eval() % FLAGS.valid_freq == 0:
+                    if has_valid and model.global_step.eval() % FLAGS.valid_freq == 0:
                         logger.info('Validating...')
                         valid_loss = 0.0
                         valid_sents_seen = 0
                         
-                        valid_set.reset()
+                        if dataset_inputs:
+                            valid_batches = None
+                            valid_steps = dataset_steps(sess, model, dataset_inputs, 'valid')
+                        else:
+                            valid_set.reset()
+                            valid_batches = BatchPrefetcher(
+                                valid_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs),
+                                prepare_valid_batch,
+                                queue_size=FLAGS.prefetch_batches)
+                            valid_steps = feed_steps(sess, model.eval, valid_batches, 'Validating')
                         
-                        for batch in valid_set.next(extend=FLAGS.extend_vocabs, split=FLAGS.split_vocabs):
-                            
-                            if FLAGS.extend_vocabs:
-                                source_batch, target_batch, source_extend_batch, target_extend_batch, oovs_max_size, _ = batch
-                                
-                                # Get a batch from training parallel data
-                                source, source_len, target, target_len = prepare_pair_batch(
-                                    source_batch, target_batch,
-                                    FLAGS.encoder_max_time_steps,
-                                    FLAGS.decoder_max_time_steps)
-                                
-                                # Get a batch from training parallel data
-                                source_extend, _, target_extend, _ = prepare_pair_batch(
-                                    source_extend_batch, target_extend_batch,
-                                    FLAGS.encoder_max_time_steps,
-                                    FLAGS.decoder_max_time_steps)
-                                logger.info('Training batch data shape %s, %s, %s, %s', source.shape, target.shape,
-                                            source_extend.shape, target_extend.shape)
-                                processed_number += len(source_batch)
-                                
-                                # Execute a single training step
-                                step_loss = model.eval(sess,
-                                                       encoder_inputs=source,
-                                                       encoder_inputs_extend=source_extend,
-                                                       encoder_inputs_length=source_len,
-                                                       decoder_inputs=target,
-                                                       decoder_inputs_extend=target_extend,
-                                                       decoder_inputs_length=target_len,
-                                                       oovs_max_size=oovs_max_size
-                                                       )
-                            
-                            else:
-                                source_batch, target_batch = batch
-                                
-                                # Get a batch from training parallel data
-                                source, source_len, target, target_len = prepare_pair_batch(source_batch, target_batch,
-                                                                                            FLAGS.encoder_max_time_steps,
-                                                                                            FLAGS.decoder_max_time_steps)
-                                logger.info('Training batch data shape %s, %s', source.shape, target.shape)
-                                
-                                processed_number += len(source_batch)
-                                
-                                # Execute a single training step
-                                step_loss = model.eval(sess, encoder_inputs=source,
-                                                       encoder_inputs_length=source_len,
-                                                       decoder_inputs=target, decoder_inputs_length=target_len)
+                        # Execute a single validation step
+                        for step_loss, source_len, _ in valid_steps:
                             
-                            batch_size = source.shape[0]
+                            batch_size = len(source_len)
                             
                             valid_loss += step_loss * batch_size
                             valid_sents_seen += batch_size
                             logger.info('%s samples seen', valid_sents_seen)
                         
                         valid_loss = valid_loss / valid_sents_seen
-                        logger.info('Valid perplexity: %.2f Loss: %s', math.exp(valid_loss), valid_loss)
+                        logger.info('Valid perplexity: %.2f Loss: %s Data-wait: %.2fs', math.exp(valid_loss), valid_loss,
+                                    valid_batches.pop_wait_time() if valid_batches else 0.0)
                         
                         # Record training summary for the current batch
                         summary = get_summary('valid_loss', valid_loss)
@@ -0,0 +1,52 @@
+import tensorflow as tf
+
+
+def attention_keys(encoder_outputs, attention_u):
+    """
+    project encoder outputs to attention keys, once per source instead of once per decoder step
+    :param encoder_outputs: [batch_size, encoder_time_steps, hidden_units]
+    :param attention_u: [hidden_units, attention_units]
+    :return: [batch_size, encoder_time_steps, attention_units]
+    """
+    return tf.tensordot(encoder_outputs, attention_u, axes=[[2], [0]], name='attention_keys')
+
+
+def attention_mask(encoder_inputs_length, encoder_time_steps):
+    """
+    mask of real encoder positions
+    :param encoder_inputs_length: [batch_size]
+    :param encoder_time_steps: padded encoder length
+    :return: [batch_size, encoder_time_steps] bool
+    """
+    return tf.sequence_mask(encoder_inputs_length, maxlen=encoder_time_steps, name='attention_mask')
+
+
+def additive_attention(prev_state, encoder_outputs, keys, attention_w, attention_v, mask=None, features=None):
+    """
+    bahdanau attention of one decoder step over all encoder positions in batched ops,
+    v^T tanh(W s + U h_j [+ features_j]) for every j, softmax over j, then weighted sum of h_j
+    :param prev_state: [batch_size, hidden_units]
+    :param encoder_outputs: [batch_size, encoder_time_steps, hidden_units]
+    :param keys: [batch_size, encoder_time_steps, attention_units], see attention_keys
+    :param attention_w: [hidden_units, attention_units]
+    :param attention_v: [attention_units, 1]
+    :param mask: [batch_size, encoder_time_steps] bool, padded positions get no attention, None to attend all
+    :param features: [batch_size, attention_units] extra query term of this step, eg: coverage, None to skip
+    :return: context [batch_size, hidden_units], alpha [batch_size, encoder_time_steps],
+             scores before mask [batch_size, encoder_time_steps]
+    """
+    # query: [batch_size, 1, attention_units]
+    query = tf.matmul(prev_state, attention_w)
+    if features is not None:
+        query += features
+    query = tf.expand_dims(query, axis=1)
+    # e_i: [batch_size, encoder_time_steps]
+    e_i = tf.squeeze(tf.tensordot(tf.tanh(keys + query), attention_v, axes=[[2], [0]]), axis=2)
+    scores = e_i
+    if mask is not None:
+        e_i = tf.where(mask, e_i, tf.fill(tf.shape(e_i), tf.constant(e_i.dtype.min, dtype=e_i.dtype)))
+    # alpha_i: [batch_size, encoder_time_steps], softmax in float32 for float16 models
+    alpha_i = tf.cast(tf.nn.softmax(tf.cast(e_i, tf.float32), axis=-1), e_i.dtype)
+    # c_i: [batch_size, hidden_units]
+    c_i = tf.squeeze(tf.matmul(tf.expand_dims(alpha_i, axis=1), encoder_outputs), axis=1)
+    return c_i, alpha_i, scores
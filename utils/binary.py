@@ -0,0 +1,382 @@
+import os
+import json
+import numpy as np
+from array import array
+from itertools import zip_longest
+from utils.vocab import load_vocab
+from utils.iterator import unk_token, bucket_batches, extend_source, extend_target
+from utils.shards import open_data
+
+# suffixes of files belong to a compiled dataset
+IDS_SUFFIX = 'ids'
+OFFSETS_SUFFIX = 'offsets'
+EXTEND_IDS_SUFFIX = 'extend_ids'
+EXTEND_OFFSETS_SUFFIX = 'extend_offsets'
+OOVS_SUFFIX = 'oovs'
+META_SUFFIX = 'meta.json'
+
+# flush ids to disk every this number of tokens
+FLUSH_TOKENS = 1 << 20
+
+
+def binary_path(prefix, side, suffix):
+    """
+    get path of binary file
+    :param prefix: dataset prefix, eg: dataset/lcsts/split/train
+    :param side: source or target
+    :param suffix: ids or offsets
+    :return: path
+    """
+    return '%s.%s.%s' % (prefix, side, suffix)
+
+
+def meta_path(prefix):
+    """
+    get path of meta file
+    :param prefix: dataset prefix
+    :return: path
+    """
+    return '%s.%s' % (prefix, META_SUFFIX)
+
+
+def choose_dtype(vocab_size):
+    """
+    choose smallest unsigned dtype that holds all ids
+    :param vocab_size: vocab size
+    :return: np.uint16 or np.uint32
+    """
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+class IdsWriter():
+    """Append ids of lines to flat ids file and offsets index."""
+    
+    def __init__(self, ids_path, offsets_path, dtype):
+        self.typecode = 'H' if dtype == np.uint16 else 'I'
+        self.ids_file = open(ids_path, 'wb')
+        self.offsets_path = offsets_path
+        # offsets: [lines + 1], ids of line i are ids[offsets[i]:offsets[i + 1]]
+        self.offsets = array('q', [0])
+        self.ids = array(self.typecode)
+    
+    def write(self, ids):
+        """
+        append ids of one line
+        :param ids: list of ids
+        :return: None
+        """
+        self.ids.extend(ids)
+        self.offsets.append(self.offsets[-1] + len(ids))
+        # flush to keep memory bounded
+        if len(self.ids) >= FLUSH_TOKENS:
+            self.ids.tofile(self.ids_file)
+            self.ids = array(self.typecode)
+    
+    def close(self):
+        """
+        flush ids and write offsets
+        :return: number of lines
+        """
+        self.ids.tofile(self.ids_file)
+        self.ids_file.close()
+        np.asarray(self.offsets, dtype=np.int64).tofile(self.offsets_path)
+        return len(self.offsets) - 1
+
+
+def compile_dataset(source, target, source_dict, target_dict, output_prefix,
+                    n_words_source=-1, n_words_target=-1, extend=False, split=False,
+                    encoding='utf-8', split_sign=' '):
+    """
+    compile source/target/vocab triple to binary dataset
+    :param source: source text file
+    :param target: target text file
+    :param source_dict: source vocab file or Vocabulary
+    :param target_dict: target vocab file or Vocabulary
+    :param output_prefix: dataset prefix
+    :param n_words_source: source vocab size used by extended ids
+    :param n_words_target: target vocab size used by extended ids
+    :param extend: also cache extended ids and article oovs count
+    :param split: split out-of-article target oovs to chars
+    :param encoding: encoding of text files
+    :param split_sign: separator of words
+    :return: meta dict
+    """
+    vocabs = {'source': load_vocab(source_dict), 'target': load_vocab(target_dict)}
+    meta, writers = {}, {}
+    for side, vocab in vocabs.items():
+        dtype = choose_dtype(vocab.full_size)
+        meta[side] = {
+            'dtype': np.dtype(dtype).name,
+            'vocab_size': len(vocab),
+        }
+        writers[side] = IdsWriter(binary_path(output_prefix, side, IDS_SUFFIX),
+                                  binary_path(output_prefix, side, OFFSETS_SUFFIX), dtype)
+        if extend:
+            # extended ids exceed vocab size by article oovs
+            writers[side + '_extend'] = IdsWriter(binary_path(output_prefix, side, EXTEND_IDS_SUFFIX),
+                                                  binary_path(output_prefix, side, EXTEND_OFFSETS_SUFFIX), np.uint32)
+    
+    if extend:
+        source_extend_dict = vocabs['source'].truncate(n_words_source)
+        target_extend_dict = vocabs['target'].truncate(n_words_target)
+        meta['extend'] = {
+            'n_words_source': n_words_source,
+            'n_words_target': n_words_target,
+            'split': split,
+        }
+        # oovs: [lines], number of article oovs
+        oovs = array('i')
+    
+    with open_data(source, encoding) as fsource, open_data(target, encoding) as ftarget:
+        for ss, tt in zip_longest(fsource, ftarget):
+            if ss is None or tt is None:
+                raise ValueError('Lines mismatch! %s and %s have different number of lines' % (source, target))
+            source_item = ss.strip().split(split_sign)
+            target_item = tt.strip().split(split_sign)
+            writers['source'].write(vocabs['source'].ids(source_item, unk_token))
+            writers['target'].write(vocabs['target'].ids(target_item, unk_token))
+            if extend:
+                source_ids_extend, oovs_vocab = extend_source(source_item, source_extend_dict,
+                                                              len(source_extend_dict))
+                target_ids_extend = extend_target(target_item, target_extend_dict, len(target_extend_dict),
+                                                  oovs_vocab, len(source_extend_dict), split)
+                writers['source_extend'].write(source_ids_extend)
+                writers['target_extend'].write(target_ids_extend)
+                oovs.append(len(oovs_vocab))
+    
+    for name, writer in writers.items():
+        lines = writer.close()
+        if name in meta:
+            meta[name]['lines'] = lines
+    if extend:
+        np.asarray(oovs, dtype=np.int32).tofile(binary_path(output_prefix, 'source', OOVS_SUFFIX))
+    
+    with open(meta_path(output_prefix), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_meta(prefix):
+    """
+    load meta of compiled dataset
+    :param prefix: dataset prefix
+    :return: meta dict
+    """
+    with open(meta_path(prefix), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_array(path, dtype):
+    """
+    memmap flat array, empty file can not be mapped
+    :param path: file path
+    :param dtype: dtype
+    :return: array
+    """
+    if os.path.getsize(path):
+        return np.memmap(path, dtype=dtype, mode='r')
+    return np.zeros([0], dtype=dtype)
+
+
+def load_binary(prefix, side, extend=False):
+    """
+    load compiled ids and offsets with memmap
+    :param prefix: dataset prefix
+    :param side: source or target
+    :param extend: load extended ids instead
+    :return: ids, offsets
+    """
+    if extend:
+        return (load_array(binary_path(prefix, side, EXTEND_IDS_SUFFIX), np.uint32),
+                load_array(binary_path(prefix, side, EXTEND_OFFSETS_SUFFIX), np.int64))
+    meta = load_meta(prefix)
+    return (load_array(binary_path(prefix, side, IDS_SUFFIX), meta[side]['dtype']),
+            load_array(binary_path(prefix, side, OFFSETS_SUFFIX), np.int64))
+
+
+class BinaryBiTextIterator():
+    """Bi text iterator serving batches from compiled binary dataset."""
+    
+    def __init__(self, prefix,
+                 batch_size=128,
+                 max_length=None,
+                 n_words_source=-1,
+                 n_words_target=-1,
+                 skip_empty=False,
+                 sort_by_length=False,
+                 shuffle=False,
+                 bucket_boundaries=None,
+                 max_tokens=None,
+                 source_max_length=None,
+                 target_max_length=None,
+                 pad_to_max=False):
+        
+        self.meta = load_meta(prefix)
+        
+        # ids: [total_tokens], offsets: [lines + 1], shared through page cache
+        self.source_ids, self.source_offsets = load_binary(prefix, 'source')
+        self.target_ids, self.target_offsets = load_binary(prefix, 'target')
+        
+        assert len(self.source_offsets) == len(self.target_offsets), 'Lines mismatch!'
+        
+        # extended ids and article oovs count, cached at compile time
+        if 'extend' in self.meta:
+            self.source_extend_ids, self.source_extend_offsets = load_binary(prefix, 'source', extend=True)
+            self.target_extend_ids, self.target_extend_offsets = load_binary(prefix, 'target', extend=True)
+            self.oovs = load_array(binary_path(prefix, 'source', OOVS_SUFFIX), np.int32)
+        
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.skip_empty = skip_empty
+        
+        self.n_words_source = n_words_source
+        self.n_words_target = n_words_target
+        
+        self.sort_by_length = sort_by_length
+        self.shuffle = shuffle
+        
+        # bucketing: batches are planned by length buckets and token budget
+        self.bucketing = bool(bucket_boundaries or max_tokens)
+        self.bucket_boundaries = bucket_boundaries
+        self.max_tokens = max_tokens
+        self.source_max_length = source_max_length
+        self.target_max_length = target_max_length
+        # batches are padded to max lengths, token budget counts padded tokens
+        self.pad_to_max = pad_to_max
+        
+        # source_lengths, target_lengths: [lines]
+        self.source_lengths = np.diff(self.source_offsets)
+        self.target_lengths = np.diff(self.target_offsets)
+        
+        self.order = None
+        self.batches = None
+        self.end_of_data = False
+    
+    def reset(self):
+        """
+        reset data, update order
+        :return:
+        """
+        self.end_of_data = False
+        if self.bucketing:
+            # indices: [pairs], pairs kept after max_length and skip_empty filters, planned batches are final
+            indices = np.arange(len(self.target_lengths))
+            if self.max_length:
+                indices = indices[(self.source_lengths[indices] <= self.max_length) |
+                                  (self.target_lengths[indices] <= self.max_length)]
+            if self.skip_empty:
+                indices = indices[(self.source_lengths[indices] > 0) & (self.target_lengths[indices] > 0)]
+            self.batches = [indices[batch] for batch in bucket_batches(self.source_lengths[indices],
+                                                                       self.target_lengths[indices],
+                                                                       bucket_boundaries=self.bucket_boundaries,
+                                                                       batch_size=self.batch_size,
+                                                                       max_tokens=self.max_tokens,
+                                                                       source_max_length=self.source_max_length,
+                                                                       target_max_length=self.target_max_length,
+                                                                       pad_to_max=self.pad_to_max)]
+            self.order = np.concatenate(self.batches) if self.batches else indices
+        elif self.sort_by_length:
+            # same order as BiTextIterator, longest target first
+            self.order = self.target_lengths.argsort()[::-1]
+        elif self.shuffle:
+            self.order = np.random.permutation(len(self.target_lengths))
+        else:
+            self.order = np.arange(len(self.target_lengths))
+    
+    def length(self):
+        """
+        get length of data
+        :return:
+        """
+        return len(self.target_lengths)
+    
+    def truncate(self, ids, n_words):
+        """
+        map ids out of n_words to unk
+        :param ids: ids array
+        :param n_words: vocab size
+        :return: ids array
+        """
+        if n_words > 0:
+            return np.where(ids >= n_words, unk_token, ids)
+        return ids
+    
+    def pair(self, idx):
+        """
+        get source and target ids of pair
+        :param idx: index of pair
+        :return: source ids, target ids
+        """
+        source_ids = self.source_ids[self.source_offsets[idx]:self.source_offsets[idx + 1]]
+        target_ids = self.target_ids[self.target_offsets[idx]:self.target_offsets[idx + 1]]
+        return self.truncate(source_ids, self.n_words_source), self.truncate(target_ids, self.n_words_target)
+    
+    def pair_extend(self, idx):
+        """
+        get cached source and target extended ids of pair
+        :param idx: index of pair
+        :return: source ids extend, target ids extend
+        """
+        source_ids_extend = self.source_extend_ids[self.source_extend_offsets[idx]:self.source_extend_offsets[idx + 1]]
+        target_ids_extend = self.target_extend_ids[self.target_extend_offsets[idx]:self.target_extend_offsets[idx + 1]]
+        return source_ids_extend, target_ids_extend
+    
+    def check_extend(self, split):
+        """
+        check extended ids are compiled with same vocab sizes
+        :param split: split out-of-article oovs
+        :return: None
+        """
+        extend = self.meta.get('extend')
+        if not extend:
+            raise ValueError('Extended ids are not compiled, run compile.py with --extend_vocabs')
+        if (extend['n_words_source'], extend['n_words_target'], extend['split']) != \
+            (self.n_words_source, self.n_words_target, split):
+            raise ValueError('Extended ids are compiled with different vocab sizes or split %s' % extend)
+    
+    def batch_indices(self):
+        """
+        get pair indices of each batch
+        :return: generator of indices
+        """
+        if self.bucketing:
+            for batch in self.batches:
+                yield batch
+            return
+        
+        batch = []
+        for idx in self.order:
+            source_length, target_length = self.source_lengths[idx], self.target_lengths[idx]
+            if self.max_length:
+                if source_length > self.max_length and target_length > self.max_length:
+                    continue
+            if self.skip_empty and (not source_length or not target_length):
+                continue
+            batch.append(idx)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def next(self, extend=False, split=False):
+        """
+        get next batch
+        :return:
+        """
+        if extend:
+            self.check_extend(split)
+        if self.order is None:
+            self.reset()
+        
+        for batch in self.batch_indices():
+            source, target = map(list, zip(*[self.pair(idx) for idx in batch]))
+            if extend:
+                source_extend, target_extend = map(list, zip(*[self.pair_extend(idx) for idx in batch]))
+                oovs_max_size = int(np.max(self.oovs[batch]))
+                # article oovs words are not compiled, decode with BiTextIterator if needed
+                yield source, target, source_extend, target_extend, oovs_max_size, None
+            else:
+                yield source, target
+        
+        self.end_of_data = True
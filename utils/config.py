@@ -1,3 +1,6 @@
 GO = 0
 EOS = 1
 UNK = 2
+
+# word of unk id, same as preprocess.config.UNK
+UNK_WORD = '<UNK>'
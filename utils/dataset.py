@@ -0,0 +1,241 @@
+import tensorflow as tf
+from utils.iterator import end_token
+
+# keys of one example, same as placeholder names of models
+SEQUENCE_KEYS = ['encoder_inputs', 'decoder_inputs']
+EXTEND_SEQUENCE_KEYS = ['encoder_inputs_extend', 'decoder_inputs_extend']
+# number of article oovs of one example, reduced to oovs_max_size of batch
+OOVS_SIZE_KEY = 'oovs_size'
+
+TFRECORD_PATTERN = '%s-%05d-of-%05d.tfrecord'
+
+
+def input_placeholder(inputs, dtype, shape, name):
+    """
+    placeholder reading dataset tensor by default, still can be fed
+    :param inputs: input tensors by placeholder name, None to use plain placeholder
+    :param dtype: dtype
+    :param shape: shape
+    :param name: placeholder name
+    :return: tensor
+    """
+    if inputs is not None and name in inputs:
+        return tf.placeholder_with_default(tf.cast(inputs[name], dtype), shape=shape, name=name)
+    return tf.placeholder(dtype=dtype, shape=shape, name=name)
+
+
+def example_keys(extend=False):
+    """
+    get sequence keys of example
+    :param extend: with extended ids
+    :return: list of keys
+    """
+    return SEQUENCE_KEYS + EXTEND_SEQUENCE_KEYS if extend else SEQUENCE_KEYS
+
+
+def iterator_examples(iterator, extend=False, split=False):
+    """
+    unbatch BiTextIterator or BinaryBiTextIterator to examples, iterator is reset first
+    :param iterator: bi text iterator
+    :param extend: with extended ids
+    :param split: split out-of-article oovs
+    :return: generator of example dict
+    """
+    iterator.reset()
+    for batch in iterator.next(extend=extend, split=split):
+        if not extend:
+            for source, target in zip(*batch):
+                yield {'encoder_inputs': source, 'decoder_inputs': target}
+            continue
+        source_batch, target_batch, source_extend_batch, target_extend_batch, oovs_max_size, oovs_vocabs = batch
+        for idx in range(len(source_batch)):
+            yield {
+                'encoder_inputs': source_batch[idx],
+                'decoder_inputs': target_batch[idx],
+                'encoder_inputs_extend': source_extend_batch[idx],
+                'decoder_inputs_extend': target_extend_batch[idx],
+                # article oovs are not kept by binary iterator, bound by batch max
+                OOVS_SIZE_KEY: len(oovs_vocabs[idx]) if oovs_vocabs else oovs_max_size,
+            }
+
+
+def generator_dataset(iterator, extend=False, split=False):
+    """
+    build dataset of examples from bi text iterator
+    :param iterator: BiTextIterator or BinaryBiTextIterator
+    :param extend: with extended ids
+    :param split: split out-of-article oovs
+    :return: dataset of example dict
+    """
+    keys = example_keys(extend)
+    output_types = {key: tf.int32 for key in keys}
+    output_shapes = {key: tf.TensorShape([None]) for key in keys}
+    if extend:
+        output_types[OOVS_SIZE_KEY] = tf.int32
+        output_shapes[OOVS_SIZE_KEY] = tf.TensorShape([])
+    return tf.data.Dataset.from_generator(lambda: iterator_examples(iterator, extend, split),
+                                          output_types=output_types, output_shapes=output_shapes)
+
+
+def write_tfrecords(iterator, output_prefix, num_shards=1, extend=False, split=False):
+    """
+    write examples of bi text iterator to tfrecord shards, round robin
+    :param iterator: BiTextIterator or BinaryBiTextIterator
+    :param output_prefix: prefix of shards
+    :param num_shards: number of shards
+    :param extend: with extended ids
+    :param split: split out-of-article oovs
+    :return: list of shard paths
+    """
+    paths = [TFRECORD_PATTERN % (output_prefix, shard, num_shards) for shard in range(num_shards)]
+    writers = [tf.python_io.TFRecordWriter(path) for path in paths]
+    for idx, example in enumerate(iterator_examples(iterator, extend, split)):
+        feature = {key: tf.train.Feature(int64_list=tf.train.Int64List(value=list(map(int, example[key]))))
+                   for key in example_keys(extend)}
+        if extend:
+            feature[OOVS_SIZE_KEY] = tf.train.Feature(int64_list=tf.train.Int64List(value=[example[OOVS_SIZE_KEY]]))
+        record = tf.train.Example(features=tf.train.Features(feature=feature))
+        writers[idx % num_shards].write(record.SerializeToString())
+    for writer in writers:
+        writer.close()
+    return paths
+
+
+def tfrecord_dataset(pattern, extend=False, num_parallel_calls=4, shuffle=False):
+    """
+    build dataset of examples from tfrecord shards
+    :param pattern: file pattern of shards, eg: dataset/lcsts/split/train-*.tfrecord
+    :param extend: with extended ids
+    :param num_parallel_calls: shards read and records parsed in parallel
+    :param shuffle: shuffle shards
+    :return: dataset of example dict
+    """
+    features = {key: tf.VarLenFeature(tf.int64) for key in example_keys(extend)}
+    if extend:
+        features[OOVS_SIZE_KEY] = tf.FixedLenFeature([], tf.int64)
+    
+    def parse(record):
+        example = tf.parse_single_example(record, features)
+        return {key: tf.cast(tf.sparse_tensor_to_dense(value) if isinstance(value, tf.SparseTensor) else value,
+                             tf.int32) for key, value in example.items()}
+    
+    files = tf.data.Dataset.list_files(pattern, shuffle=shuffle)
+    dataset = files.interleave(tf.data.TFRecordDataset, cycle_length=num_parallel_calls)
+    return dataset.map(parse, num_parallel_calls=num_parallel_calls)
+
+
+def bucket_batch_sizes(bucket_boundaries, batch_size, max_tokens, encoder_max_time_steps, decoder_max_time_steps,
+                       pad_longest=False):
+    """
+    get batch size of each source length bucket, token budget counts longest possible padded lengths of bucket
+    :param bucket_boundaries: source length boundaries of buckets, eg: [20, 40, 60]
+    :param batch_size: batch size, used if max_tokens not set
+    :param max_tokens: max padded source + target tokens of batch, 0 to disable
+    :param encoder_max_time_steps: max source length
+    :param decoder_max_time_steps: max target length
+    :param pad_longest: batches are padded to longest of batch instead of max time steps
+    :return: list of batch sizes, one more than boundaries
+    """
+    if not max_tokens:
+        return [batch_size] * (len(bucket_boundaries) + 1)
+    batch_sizes = []
+    for upper in list(bucket_boundaries) + [encoder_max_time_steps + 1]:
+        source_length = min(upper - 1, encoder_max_time_steps) if pad_longest else encoder_max_time_steps
+        batch_sizes.append(max(max_tokens // (source_length + decoder_max_time_steps), 1))
+    return batch_sizes
+
+
+def batch_dataset(dataset, batch_size, encoder_max_time_steps, decoder_max_time_steps, num_parallel_calls=4,
+                  prefetch_size=8, bucket_boundaries=None, max_tokens=0, pad_longest=False):
+    """
+    truncate, pad and batch examples to model inputs
+    :param dataset: dataset of example dict
+    :param batch_size: batch size
+    :param encoder_max_time_steps: padded source length
+    :param decoder_max_time_steps: padded target length
+    :param num_parallel_calls: examples truncated in parallel
+    :param prefetch_size: batches prepared ahead
+    :param bucket_boundaries: source length boundaries of buckets, eg: [20, 40, 60], None for one bucket
+    :param max_tokens: max padded source + target tokens of batch instead of batch_size, 0 to disable
+    :param pad_longest: pad to longest of batch instead of max time steps
+    :return: dataset of model inputs dict
+    """
+    max_time_steps = {'encoder': encoder_max_time_steps, 'decoder': decoder_max_time_steps}
+    
+    def truncate(example):
+        inputs = {}
+        for key, value in example.items():
+            if key == OOVS_SIZE_KEY:
+                inputs[key] = value
+                continue
+            side = key.split('_')[0]
+            inputs[key] = value[:max_time_steps[side]]
+            # lengths after truncation, source and source extend share lengths
+            if key in SEQUENCE_KEYS:
+                inputs[key + '_length'] = tf.size(inputs[key])
+        return inputs
+    
+    def reduce_oovs(inputs):
+        if OOVS_SIZE_KEY in inputs:
+            inputs['oovs_max_size'] = tf.reduce_max(inputs.pop(OOVS_SIZE_KEY))
+        return inputs
+    
+    dataset = dataset.map(truncate, num_parallel_calls=num_parallel_calls)
+    padded_shapes, padding_values = {}, {}
+    for key in dataset.output_shapes:
+        if key.endswith('_length') or key == OOVS_SIZE_KEY:
+            padded_shapes[key], padding_values[key] = [], 0
+        else:
+            # pad with end token like prepare_batch
+            padded_shapes[key] = [None] if pad_longest else [max_time_steps[key.split('_')[0]]]
+            padding_values[key] = end_token
+    padding_values = {key: tf.constant(value, tf.int32) for key, value in padding_values.items()}
+    if bucket_boundaries or max_tokens:
+        # group examples by source length like bucket_batches of iterators
+        batch_sizes = bucket_batch_sizes(bucket_boundaries or [], batch_size, max_tokens, encoder_max_time_steps,
+                                         decoder_max_time_steps, pad_longest)
+        dataset = dataset.apply(tf.data.experimental.bucket_by_sequence_length(
+            lambda inputs: inputs['encoder_inputs_length'], bucket_boundaries or [], batch_sizes,
+            padded_shapes=padded_shapes, padding_values=padding_values))
+    else:
+        dataset = dataset.padded_batch(batch_size, padded_shapes=padded_shapes, padding_values=padding_values)
+    return dataset.map(reduce_oovs, num_parallel_calls=num_parallel_calls).prefetch(prefetch_size)
+
+
+class DatasetInputs():
+    """Model inputs read from one of several datasets, switched by iterator handle."""
+    
+    def __init__(self, datasets):
+        """
+        init inputs
+        :param datasets: name to dataset dict, datasets share structure, eg: train and valid
+        """
+        template = list(datasets.values())[0]
+        self.handle = tf.placeholder(tf.string, shape=[], name='dataset_handle')
+        self.iterator = tf.data.Iterator.from_string_handle(self.handle, template.output_types,
+                                                            template.output_shapes)
+        # inputs: input tensors by placeholder name, pass to model
+        self.inputs = self.iterator.get_next()
+        self.iterators = {name: dataset.make_initializable_iterator() for name, dataset in datasets.items()}
+        self.handle_ops = {name: iterator.string_handle() for name, iterator in self.iterators.items()}
+        self.handles = {}
+    
+    def steps(self, sess, name, fetches, feed_dict=None):
+        """
+        run fetches on each batch of dataset for one epoch
+        :param sess: session object
+        :param name: dataset name
+        :param fetches: fetches of sess.run
+        :param feed_dict: extra feed, eg: keep_prob
+        :return: generator of fetched outputs
+        """
+        if name not in self.handles:
+            self.handles[name] = sess.run(self.handle_ops[name])
+        sess.run(self.iterators[name].initializer)
+        input_feed = dict(feed_dict or {})
+        input_feed[self.handle] = self.handles[name]
+        while True:
+            try:
+                yield sess.run(fetches, feed_dict=input_feed)
+            except tf.errors.OutOfRangeError:
+                return
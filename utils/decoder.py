@@ -0,0 +1,66 @@
+import tensorflow as tf
+
+
+def time_major(tensor):
+    """
+    swap batch and time axes
+    :param tensor: [batch_size, time_steps, ...] or [time_steps, batch_size, ...]
+    :return: tensor with first two axes swapped
+    """
+    if tensor.shape.ndims is not None:
+        perm = [1, 0] + list(range(2, tensor.shape.ndims))
+    else:
+        # rank of stacked tensor array is unknown after while loop
+        perm = tf.concat([[1, 0], tf.range(2, tf.rank(tensor))], axis=0)
+    return tf.transpose(tensor, perm)
+
+
+def input_array(tensor):
+    """
+    tensor array of time steps to read inside decoder loop
+    :param tensor: [batch_size, time_steps, ...]
+    :return: TensorArray of time_steps * [batch_size, ...]
+    """
+    tensor = time_major(tensor)
+    return tf.TensorArray(dtype=tensor.dtype, size=tf.shape(tensor)[0]).unstack(tensor)
+
+
+def dynamic_decode(step_fn, loop_state, max_steps, output_dtypes, finished=None, name='dynamic_decode'):
+    """
+    run decoder step by tf.while_loop, the step graph is built once however many steps are run
+    :param step_fn: fn(time, loop_state) returns (outputs tuple, next loop_state, finished [batch_size] bool or None)
+    :param loop_state: nested structure of tensors passed to next step, eg: rnn state, next inputs, coverage
+    :param max_steps: scalar int tensor or int, upper bound of steps
+    :param output_dtypes: dtypes of outputs returned by step_fn
+    :param finished: [batch_size] bool, loop stops once all finished, None to always run max_steps
+    :return: outputs tuple each [batch_size, steps, ...], final loop_state
+    """
+    with tf.name_scope(name):
+        outputs_arrays = tuple(tf.TensorArray(dtype=dtype, size=0, dynamic_size=True) for dtype in output_dtypes)
+        # static shapes of step outputs, recorded when body is built
+        outputs_shapes = []
+        stop_early = finished is not None
+        if not stop_early:
+            finished = tf.constant(False)
+
+        def cond(time, finished, loop_state, outputs_arrays):
+            return tf.logical_and(time < max_steps, tf.logical_not(tf.reduce_all(finished)))
+
+        def body(time, finished, loop_state, outputs_arrays):
+            outputs, loop_state, step_finished = step_fn(time, loop_state)
+            outputs_shapes[:] = [output.shape for output in outputs]
+            outputs_arrays = tuple(array.write(time, output) for array, output in zip(outputs_arrays, outputs))
+            if stop_early and step_finished is not None:
+                finished = tf.logical_or(finished, step_finished)
+            return time + 1, finished, loop_state, outputs_arrays
+
+        _, _, loop_state, outputs_arrays = tf.while_loop(cond, body,
+                                                         loop_vars=(tf.constant(0), finished, loop_state,
+                                                                    outputs_arrays))
+        outputs = []
+        for array, shape in zip(outputs_arrays, outputs_shapes):
+            stacked = array.stack()
+            stacked.set_shape(tf.TensorShape([None]).concatenate(shape))
+            outputs.append(time_major(stacked))
+        outputs = tuple(outputs)
+    return outputs, loop_state
@@ -1,24 +1,14 @@
-import json
 import tensorflow as tf
-from utils.config import UNK
 from utils.iterator import end_token
+from utils.vocab import load_dict
 import numpy as np
-import pickle
+from itertools import chain
 
 
 def get_summary(name, value):
     return tf.Summary(value=[tf.Summary.Value(tag=name, simple_value=value)])
 
 
-def load_dict(filename):
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        with open(filename, 'r') as f:
-            return pickle.load(f)
-
-
 def inverse_dict(map):
     return {v: k for k, v in map.items()}
 
@@ -35,93 +25,125 @@ def load_inverse_dict(dict_path):
     return idict
 
 
-def seq2words(seq, inverse_target_dictionary, oovs_vocab=None):
+def seq2words(seq, target_vocab, oovs_vocab=None):
+    """
+    transfer ids to words, vocab is not modified so it can be shared
+    :param seq: ids of sentence
+    :param target_vocab: target Vocabulary
+    :param oovs_vocab: extended id to article oov word
+    :return: words joined by space
+    """
     words = []
-    if oovs_vocab:
-        inverse_target_dictionary.update(oovs_vocab)
     for w in seq:
         if w == end_token:
             break
-        if w in inverse_target_dictionary:
-            words.append(inverse_target_dictionary[w])
+        if oovs_vocab and w in oovs_vocab:
+            words.append(oovs_vocab[w])
         else:
-            words.append(UNK)
+            words.append(target_vocab.word(w))
     return ' '.join(words)
 
 
-# batch preparation of a given sequence
-def prepare_batch(seqs_x, x_max_length=None):
-    # seqs_x: a list of sentences
-    lengths_x = [len(s) for s in seqs_x]
-    
-    if x_max_length is not None:
-        new_seqs_x = []
-        new_lengths_x = []
-        for s_x in seqs_x:
-            s_x = s_x[:x_max_length]
-            new_seqs_x.append(s_x)
-            new_lengths_x.append(len(s_x))
-        lengths_x = new_lengths_x
-        seqs_x = new_seqs_x
-        
-        if len(lengths_x) < 1:
-            return None, None
+def flatten_batch(*seqs_list):
+    """
+    flatten ragged batches sharing same lengths to flat ids and offsets
+    :param seqs_list: lists of sentences, eg: source batch and source extend batch
+    :return: offsets, ids of each batch
+    """
+    seqs = seqs_list[0]
+    # offsets: [batch_size + 1], ids of sentence i are ids[offsets[i]:offsets[i + 1]]
+    offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in seqs], out=offsets[1:])
+    ids_list = []
+    for seqs in seqs_list:
+        if len(seqs) and isinstance(seqs[0], np.ndarray):
+            ids = np.concatenate(seqs).astype(np.int32)
+        else:
+            ids = np.fromiter(chain.from_iterable(seqs), dtype=np.int32, count=offsets[-1])
+        ids_list.append(ids)
+    return (offsets,) + tuple(ids_list)
+
+
+class BatchCollator():
+    """Pad flat ids with offsets to [batch_size, max_time] arrays."""
     
-    batch_size = len(seqs_x)
+    def __init__(self, max_length=None, num_buffers=0, pad_longest=False):
+        """
+        init collator
+        :param max_length: truncate and pad to this length, None to pad to longest
+        :param pad_longest: still truncate to max_length, but pad to longest of batch
+        :param num_buffers: ring size of reusable output buffers, 0 to allocate every time,
+                            must exceed the number of batches alive at the same time
+        """
+        self.max_length = max_length
+        self.pad_longest = pad_longest
+        self.buffers = [None] * num_buffers
+        self.index = 0
     
-    x_lengths = np.array(lengths_x)
-    max_x = x_max_length if x_max_length else np.max(x_lengths)
+    def buffer(self, count, batch_size, max_time):
+        """
+        get output buffers from ring
+        :param count: number of buffers
+        :param batch_size: batch size
+        :param max_time: max time steps
+        :return: count * [batch_size, max_time]
+        """
+        if not self.buffers:
+            return [np.empty((batch_size, max_time), dtype=np.int32) for _ in range(count)]
+        buffers = self.buffers[self.index]
+        if buffers is None or len(buffers) < count or \
+            buffers[0].shape[0] < batch_size or buffers[0].shape[1] < max_time:
+            shape = (batch_size, max_time) if buffers is None else \
+                (max(batch_size, buffers[0].shape[0]), max(max_time, buffers[0].shape[1]))
+            buffers = [np.empty(shape, dtype=np.int32) for _ in range(count)]
+            self.buffers[self.index] = buffers
+        self.index = (self.index + 1) % len(self.buffers)
+        return [b[:batch_size, :max_time] for b in buffers[:count]]
     
-    x = np.ones((batch_size, max_x)).astype('int32') * end_token
+    def collate(self, offsets, *ids_list):
+        """
+        pad flat ids sharing same offsets
+        :param offsets: [batch_size + 1]
+        :param ids_list: flat ids, eg: ids and extended ids
+        :return: padded arrays of each ids, lengths
+        """
+        # lengths: [batch_size]
+        lengths = np.diff(offsets)
+        if self.max_length:
+            lengths = np.minimum(lengths, self.max_length)
+        batch_size = len(lengths)
+        max_time = self.max_length if self.max_length and not self.pad_longest else int(np.max(lengths))
+        
+        # mask: [batch_size, max_time], positions to fill with ids
+        steps = np.arange(max_time)
+        mask = steps < lengths[:, None]
+        # positions: [tokens], positions of kept tokens in flat ids
+        positions = (offsets[:-1, None] + steps)[mask]
+        
+        outputs = self.buffer(len(ids_list), batch_size, max_time)
+        for x, ids in zip(outputs, ids_list):
+            x.fill(end_token)
+            x[mask] = ids[positions]
+        return tuple(outputs) + (lengths,)
+
+
+# batch preparation of a given sequence
+def prepare_batch(seqs_x, x_max_length=None):
+    # seqs_x: a list of sentences
+    if x_max_length is not None and len(seqs_x) < 1:
+        return None, None
     
-    for idx, s_x in enumerate(seqs_x):
-        x[idx, :lengths_x[idx]] = s_x
-    return x, x_lengths
+    return BatchCollator(x_max_length).collate(*flatten_batch(seqs_x))
 
 
 # batch preparation of a given sequence pair for training
 def prepare_pair_batch(seqs_x, seqs_y, x_max_length=None, y_max_length=None):
     # seqs_x, seqs_y: a list of sentences
-    lengths_x = [len(s) for s in seqs_x]
-    lengths_y = [len(s) for s in seqs_y]
-    
-    if x_max_length is not None:
-        new_seqs_x = []
-        new_lengths_x = []
-        for s_x in seqs_x:
-            s_x = s_x[:x_max_length]
-            new_seqs_x.append(s_x)
-            new_lengths_x.append(len(s_x))
-        lengths_x = new_lengths_x
-        seqs_x = new_seqs_x
-    
-    if y_max_length is not None:
-        new_seqs_y = []
-        new_lengths_y = []
-        for s_y in seqs_y:
-            s_y = s_y[:y_max_length]
-            new_seqs_y.append(s_y)
-            new_lengths_y.append(len(s_y))
-        lengths_y = new_lengths_y
-        seqs_y = new_seqs_y
-        
-        if len(lengths_x) < 1 or len(lengths_y) < 1:
-            return None, None, None, None
-    
-    batch_size = len(seqs_x)
-    
-    x_lengths = np.array(lengths_x)
-    y_lengths = np.array(lengths_y)
-    
-    max_x = x_max_length if x_max_length else np.max(x_lengths)
-    max_y = y_max_length if y_max_length else np.max(y_lengths)
-    
-    x = np.ones((batch_size, max_x)).astype('int32') * end_token
-    y = np.ones((batch_size, max_y)).astype('int32') * end_token
+    if y_max_length is not None and (len(seqs_x) < 1 or len(seqs_y) < 1):
+        return None, None, None, None
     
-    for idx, [s_x, s_y] in enumerate(zip(seqs_x, seqs_y)):
-        x[idx, :lengths_x[idx]] = s_x
-        y[idx, :lengths_y[idx]] = s_y
+    x, x_lengths = BatchCollator(x_max_length).collate(*flatten_batch(seqs_x))
+    y, y_lengths = BatchCollator(y_max_length).collate(*flatten_batch(seqs_y))
     return x, x_lengths, y, y_lengths
 
 
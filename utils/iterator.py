@@ -1,7 +1,9 @@
 import numpy as np
-import json
-import pickle
+import random
+from itertools import islice
 import utils.config as config
+from utils.vocab import load_dict, load_vocab
+from utils.shards import open_data, count_data_lines
 
 extra_tokens = [config.GO, config.EOS, config.UNK]
 start_token = extra_tokens.index(config.GO)  # start_token = 0
@@ -9,13 +11,112 @@ end_token = extra_tokens.index(config.EOS)  # end_token = 1
 unk_token = extra_tokens.index(config.UNK)
 
 
-def load_dict(filename):
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return pickle.load(f)
+def count_lines(filename, encoding='utf-8'):
+    """
+    count lines of file without splitting them
+    :param filename: file path, may be compressed or sharded
+    :param encoding: encoding of file
+    :return: number of lines
+    """
+    return count_data_lines(filename, encoding)
+
+
+def bucket_batches(source_lengths, target_lengths, bucket_boundaries=None, batch_size=128, max_tokens=None,
+                   source_max_length=None, target_max_length=None, pad_to_max=False):
+    """
+    group pairs into length buckets, form batches by token budget, shuffle within and across buckets
+    :param source_lengths: lengths of source sentences
+    :param target_lengths: lengths of target sentences
+    :param bucket_boundaries: source length boundaries of buckets, eg: [20, 40, 60]
+    :param batch_size: max sentences of batch, used if max_tokens not set
+    :param max_tokens: max padded source + target tokens of batch
+    :param source_max_length: source length after truncation
+    :param target_max_length: target length after truncation
+    :param pad_to_max: batches are padded to source_max_length and target_max_length instead of longest of batch,
+                       token budget counts these padded lengths
+    :return: list of index arrays
+    """
+    assert not pad_to_max or source_max_length and target_max_length, 'Max lengths needed to pad to max'
+    source_lengths = np.asarray(source_lengths)
+    target_lengths = np.asarray(target_lengths)
+    if source_max_length:
+        source_lengths = np.minimum(source_lengths, source_max_length)
+    if target_max_length:
+        target_lengths = np.minimum(target_lengths, target_max_length)
+    
+    # buckets: [pairs], bucket index of each pair
+    buckets = np.digitize(source_lengths, bucket_boundaries or [])
+    batches = []
+    for bucket in np.unique(buckets):
+        batch = []
+        source_max, target_max = 0, 0
+        for idx in np.random.permutation(np.where(buckets == bucket)[0]):
+            source_max_next = max(source_max, source_lengths[idx])
+            target_max_next = max(target_max, target_lengths[idx])
+            if max_tokens and pad_to_max:
+                full = (len(batch) + 1) * (source_max_length + target_max_length) > max_tokens
+            elif max_tokens:
+                full = (len(batch) + 1) * (source_max_next + target_max_next) > max_tokens
+            else:
+                full = len(batch) >= batch_size
+            if batch and full:
+                batches.append(batch)
+                batch = []
+                source_max_next, target_max_next = source_lengths[idx], target_lengths[idx]
+            batch.append(idx)
+            source_max, target_max = source_max_next, target_max_next
+        if batch:
+            batches.append(batch)
+    random.shuffle(batches)
+    return batches
+
+
+def extend_source(source, source_dict, source_size):
+    """
+    extend source vocab with article oovs
+    :param source: source words
+    :param source_dict: Vocabulary
+    :param source_size: size of source_dict, first oov gets this id
+    :return: source ids extend, oovs vocab
+    """
+    # oovs_vocab: word to extended id, in order of first occurrence
+    oovs_vocab = {}
+    source_ids_extend = []
+    for w in source:
+        idx = source_dict.get(w)
+        if idx is None:
+            # This is e.g. 50000 for the first article OOV, 50001 for the second...
+            idx = oovs_vocab.get(w)
+            if idx is None:
+                idx = oovs_vocab[w] = source_size + len(oovs_vocab)
+        source_ids_extend.append(idx)
+    return source_ids_extend, oovs_vocab
+
+
+def extend_target(target, target_dict, target_size, oovs_vocab, source_size, split=False):
+    """
+    map target words to extended ids with article oovs
+    :param target: target words
+    :param target_dict: Vocabulary
+    :param target_size: size of target_dict
+    :param oovs_vocab: article oovs from extend_source
+    :param source_size: size of source dict
+    :param split: split out-of-article oov to chars
+    :return: target ids extend
+    """
+    target_ids_extend = []
+    for w in target:
+        idx = target_dict.get(w)
+        if idx is not None:
+            target_ids_extend.append(idx)
+        elif w in oovs_vocab:  # If w is an in-article OOV
+            target_ids_extend.append(target_size + oovs_vocab[w] - source_size)
+        elif split:  # If w is an out-of-article OOV
+            for w_split in w:
+                target_ids_extend.append(target_dict.get(w_split, unk_token))
+        else:
+            target_ids_extend.append(unk_token)  # Map to the UNK token id
+    return target_ids_extend
 
 
 class UniTextIterator():
@@ -26,30 +127,43 @@ class UniTextIterator():
                  n_words_source=-1,
                  skip_empty=False,
                  sort_by_length=False,
+                 shuffle=False,
+                 streaming=False,
+                 max_load_batches=20,
                  encoding='utf-8',
                  split_sign=' '):
         
-        self.source = open(source, 'r', encoding=encoding)
-        self.source_dict = load_dict(source_dict)
+        self.source = open_data(source, encoding)
+        self.encoding = encoding
+        # source_dict: vocab path or shared Vocabulary, truncated as a view
+        self.source_dict = load_vocab(source_dict, n_words_source)
         self.batch_size = batch_size
         self.max_length = max_length
         self.skip_empty = skip_empty
         self.n_words_source = n_words_source
         self.split_sign = split_sign
         
-        if self.n_words_source > 0:
-            for key, idx in self.source_dict.items():
-                if idx >= self.n_words_source:
-                    del self.source_dict[key]
+        # first oov id of extended vocab
+        self.source_size = len(self.source_dict)
         
         self.sort_by_length = sort_by_length
+        self.shuffle = shuffle
+        # streaming: only keep max_load_batches batches of lines in buffer
+        self.streaming = streaming
+        self.window_size = batch_size * max_load_batches if streaming else None
         self.source_buffer = []
+        self.lines = None
         self.end_of_data = False
         self.reset()
     
     def length(self):
-        self.reset()
-        return len(self.source_buffer)
+        """
+        get length of data, cached after first count
+        :return:
+        """
+        if self.lines is None:
+            self.lines = count_lines(self.source.name, self.encoding)
+        return self.lines
     
     def extend(self, source):
         """
@@ -57,37 +171,35 @@ class UniTextIterator():
         :param source:
         :return:
         """
-        oovs = []
-        oovs_vocab = {}
-        source_ids_extend = []
-        for w in source:
-            if not w in self.source_dict:
-                if w not in oovs:  # Add to list of OOVs
-                    oovs.append(w)
-                oov_num = oovs.index(w)  # This is 0 for the first article OOV, 1 for the second article OOV...
-                source_ids_extend.append(len(
-                    self.source_dict) + oov_num)  # This is e.g. 50000 for the first article OOV, 50001 for the second...
-                oovs_vocab[w] = len(self.source_dict) + oov_num
-            else:
-                source_ids_extend.append(self.source_dict[w])
-        return source_ids_extend, oovs_vocab
+        return extend_source(source, self.source_dict, self.source_size)
+    
+    def fill(self, size=None):
+        """
+        fill buffer with next lines
+        :param size: max lines to read, None for all
+        :return: number of lines read
+        """
+        for ss in islice(self.source, size):
+            self.source_buffer.append(ss.strip().split(self.split_sign))
+        # sort by buffer
+        if self.sort_by_length:
+            slen = np.array([len(s) for s in self.source_buffer])
+            sidx = slen.argsort()
+            sbuf = [self.source_buffer[i] for i in sidx]
+            self.source_buffer = sbuf
+        elif self.shuffle:
+            random.shuffle(self.source_buffer)
+        else:
+            self.source_buffer.reverse()
+        return len(self.source_buffer)
     
     def reset(self):
         self.source.seek(0)
         self.source_buffer = []
         self.end_of_data = False
-        # fill buffer, if it's empty
-        if len(self.source_buffer) == 0:
-            for ss in self.source.readlines():
-                self.source_buffer.append(ss.strip().split(self.split_sign))
-            # sort by buffer
-            if self.sort_by_length:
-                slen = np.array([len(s) for s in self.source_buffer])
-                sidx = slen.argsort()
-                sbuf = [self.source_buffer[i] for i in sidx]
-                self.source_buffer = sbuf
-            else:
-                self.source_buffer.reverse()
+        # fill buffer, if it's empty, streaming mode fills it lazily
+        if len(self.source_buffer) == 0 and not self.streaming:
+            self.lines = self.fill()
     
     def next(self, extend=False):
         """
@@ -104,10 +216,10 @@ class UniTextIterator():
             try:
                 source_item = self.source_buffer.pop()
             except IndexError:
-                self.end_of_data = True
+                if not self.streaming or not self.fill(self.window_size):
+                    self.end_of_data = True
             if source_item:
-                source_ids = [self.source_dict[w] if w in self.source_dict
-                              else unk_token for w in source_item]
+                source_ids = self.source_dict.ids(source_item, unk_token)
                 if extend:
                     source_ids_extend, oovs_vocab = self.extend(source_item)
                     if len(oovs_vocab) > oovs_max_size:
@@ -143,16 +255,26 @@ class BiTextIterator():
                  n_words_target=-1,
                  skip_empty=False,
                  sort_by_length=False,
+                 shuffle=False,
+                 streaming=False,
+                 max_load_batches=20,
+                 bucket_boundaries=None,
+                 max_tokens=None,
+                 source_max_length=None,
+                 target_max_length=None,
+                 pad_to_max=False,
                  encoding='utf-8',
                  split_sign=' '):
         
         # assert source_dict == target_dict
         
-        self.source = open(source, 'r', encoding=encoding)
-        self.target = open(target, 'r', encoding=encoding)
+        self.source = open_data(source, encoding)
+        self.target = open_data(target, encoding)
+        self.encoding = encoding
         
-        self.source_dict = load_dict(source_dict)
-        self.target_dict = load_dict(target_dict)
+        # vocab path or shared Vocabulary, truncated as a view
+        self.source_dict = load_vocab(source_dict, n_words_source)
+        self.target_dict = load_vocab(target_dict, n_words_target)
         
         self.batch_size = batch_size
         self.max_length = max_length
@@ -163,23 +285,104 @@ class BiTextIterator():
         
         self.split_sign = split_sign
         
-        if self.n_words_source > 0:
-            for key, idx in self.source_dict.items():
-                if idx >= self.n_words_source:
-                    del self.source_dict[key]
-        
-        if self.n_words_target > 0:
-            for key, idx in self.target_dict.items():
-                if idx >= self.n_words_target:
-                    del self.target_dict[key]
+        # first oov id of extended vocab
+        self.source_size = len(self.source_dict)
+        self.target_size = len(self.target_dict)
         
         self.sort_by_length = sort_by_length
+        self.shuffle = shuffle
+        
+        # streaming: only keep max_load_batches batches of lines in buffer
+        self.streaming = streaming
+        self.window_size = batch_size * max_load_batches if streaming else None
+        
+        # bucketing: batch sizes are planned by length buckets and token budget
+        self.bucketing = bool(bucket_boundaries or max_tokens)
+        self.bucket_boundaries = bucket_boundaries
+        self.max_tokens = max_tokens
+        self.source_max_length = source_max_length
+        self.target_max_length = target_max_length
+        # batches are padded to max lengths, token budget counts padded tokens
+        self.pad_to_max = pad_to_max
         
         self.source_buffer = []
         self.target_buffer = []
+        self.batch_plan = []
         
+        self.lines = None
         self.end_of_data = False
     
+    def fill(self, size=None):
+        """
+        fill buffer with next lines
+        :param size: max lines to read, None for all
+        :return: number of lines read
+        """
+        for ss in islice(self.source, size):
+            self.source_buffer.append(ss.strip().split(self.split_sign))
+        for tt in islice(self.target, size):
+            self.target_buffer.append(tt.strip().split(self.split_sign))
+        
+        assert len(self.source_buffer) == len(self.target_buffer), 'Buffer size mismatch!'
+        lines = len(self.source_buffer)
+        
+        if self.bucketing:
+            self.plan()
+        # sort by target buffer
+        elif self.sort_by_length:
+            tlen = np.array([len(t) for t in self.target_buffer])
+            tidx = tlen.argsort()
+            sbuf = [self.source_buffer[i] for i in tidx]
+            tbuf = [self.target_buffer[i] for i in tidx]
+            self.source_buffer = sbuf
+            self.target_buffer = tbuf
+        elif self.shuffle:
+            pairs = list(zip(self.source_buffer, self.target_buffer))
+            random.shuffle(pairs)
+            self.source_buffer = [pair[0] for pair in pairs]
+            self.target_buffer = [pair[1] for pair in pairs]
+        else:
+            self.source_buffer.reverse()
+            self.target_buffer.reverse()
+        return lines
+    
+    def plan(self):
+        """
+        reorder buffer by bucketed batches and plan batch sizes
+        :return: None
+        """
+        pairs = list(zip(self.source_buffer, self.target_buffer))
+        # drop pairs next would skip, so planned batch sizes match yielded batches
+        if self.max_length:
+            pairs = [(s, t) for s, t in pairs if len(s) <= self.max_length or len(t) <= self.max_length]
+        if self.skip_empty:
+            pairs = [(s, t) for s, t in pairs if s and t]
+        self.source_buffer, self.target_buffer = map(list, zip(*pairs)) if pairs else ([], [])
+        
+        batches = bucket_batches([len(s) for s in self.source_buffer],
+                                 [len(t) for t in self.target_buffer],
+                                 bucket_boundaries=self.bucket_boundaries,
+                                 batch_size=self.batch_size,
+                                 max_tokens=self.max_tokens,
+                                 source_max_length=self.source_max_length,
+                                 target_max_length=self.target_max_length,
+                                 pad_to_max=self.pad_to_max)
+        # buffer is consumed from end
+        order = [i for batch in reversed(batches) for i in reversed(batch)]
+        self.source_buffer = [self.source_buffer[i] for i in order]
+        self.target_buffer = [self.target_buffer[i] for i in order]
+        self.batch_plan = [len(batch) for batch in reversed(batches)]
+    
+    def is_full(self, size):
+        """
+        whether batch is full, planned batch size is used in bucketing mode
+        :param size: size of current batch
+        :return: bool
+        """
+        if self.batch_plan:
+            return size >= self.batch_plan[-1]
+        return size >= self.batch_size
+    
     def reset(self):
         """
         reset data, update buffer
@@ -193,33 +396,18 @@ class BiTextIterator():
         
         self.end_of_data = False
         
-        assert len(self.source_buffer) == len(self.target_buffer), 'Buffer size mismatch!'
-        
-        if len(self.source_buffer) == 0:
-            for ss in self.source.readlines():
-                self.source_buffer.append(ss.strip().split(self.split_sign))
-            for tt in self.target.readlines():
-                self.target_buffer.append(tt.strip().split(self.split_sign))
-            
-            # sort by target buffer
-            if self.sort_by_length:
-                tlen = np.array([len(t) for t in self.target_buffer])
-                tidx = tlen.argsort()
-                sbuf = [self.source_buffer[i] for i in tidx]
-                tbuf = [self.target_buffer[i] for i in tidx]
-                self.source_buffer = sbuf
-                self.target_buffer = tbuf
-            else:
-                self.source_buffer.reverse()
-                self.target_buffer.reverse()
+        # fill buffer, if it's empty, streaming mode fills it lazily
+        if len(self.source_buffer) == 0 and not self.streaming:
+            self.lines = self.fill()
     
     def length(self):
         """
-        get length of data
+        get length of data, cached after first count
         :return:
         """
-        self.reset()
-        return len(self.source_buffer)
+        if self.lines is None:
+            self.lines = count_lines(self.source.name, self.encoding)
+        return self.lines
     
     def extend(self, source, target, split=False):
         """
@@ -228,37 +416,9 @@ class BiTextIterator():
         :param target:
         :return:
         """
-        oovs = []
-        oovs_vocab = {}
-        source_ids_extend, target_ids_extend = [], []
-        for w in source:
-            if not w in self.source_dict:
-                if w not in oovs:  # Add to list of OOVs
-                    oovs.append(w)
-                    # oovs_vocab[w] =
-                oov_num = oovs.index(w)  # This is 0 for the first article OOV, 1 for the second article OOV...
-                source_ids_extend.append(len(
-                    self.source_dict) + oov_num)  # This is e.g. 50000 for the first article OOV, 50001 for the second...
-                oovs_vocab[w] = len(self.source_dict) + oov_num
-            else:
-                source_ids_extend.append(self.source_dict[w])
-        for w in target:
-            if not w in self.target_dict:  # If w is an OOV word
-                if w in oovs:  # If w is an in-article OOV
-                    target_ids_extend.append(len(self.target_dict) + oovs.index(w))
-                else:  # If w is an out-of-article OOV
-                    if split:
-                        w_splits = list(w)
-                        for w_split in w_splits:
-                            if w_split in self.target_dict:
-                                target_ids_extend.append(self.target_dict[w_split])
-                            else:
-                                print(w_split)
-                                target_ids_extend.append(unk_token)
-                    else:
-                        target_ids_extend.append(unk_token)  # Map to the UNK token id
-            else:
-                target_ids_extend.append(self.target_dict[w])
+        source_ids_extend, oovs_vocab = extend_source(source, self.source_dict, self.source_size)
+        target_ids_extend = extend_target(target, self.target_dict, self.target_size, oovs_vocab, self.source_size,
+                                          split)
         return source_ids_extend, target_ids_extend, oovs_vocab
     
     def next(self, extend=False, split=False):
@@ -278,13 +438,12 @@ class BiTextIterator():
                 source_item = self.source_buffer.pop()
                 target_item = self.target_buffer.pop()
             except IndexError:
-                self.end_of_data = True
+                if not self.streaming or not self.fill(self.window_size):
+                    self.end_of_data = True
             if source_item and target_item:
                 # transfer to dict index
-                source_ids = [self.source_dict[w] if w in self.source_dict
-                              else unk_token for w in source_item]
-                target_ids = [self.target_dict[w] if w in self.target_dict
-                              else unk_token for w in target_item]
+                source_ids = self.source_dict.ids(source_item, unk_token)
+                target_ids = self.target_dict.ids(target_item, unk_token)
                 if extend:
                     source_ids_extend, target_ids_extend, oovs_vocab = self.extend(source_item, target_item, split)
                     if len(oovs_vocab) > oovs_max_size:
@@ -302,8 +461,9 @@ class BiTextIterator():
                     target_extend.append(target_ids_extend)
                     oovs_vocabs.append(oovs_vocab)
             
-            if self.end_of_data and len(source) and len(target) or \
-                len(source) >= self.batch_size and len(target) >= self.batch_size:
+            if self.end_of_data and len(source) and len(target) or self.is_full(len(source)):
+                if self.batch_plan:
+                    self.batch_plan.pop()
                 if extend:
                     yield source, target, source_extend, target_extend, oovs_max_size, oovs_vocabs
                     source, target, source_extend, target_extend, oovs_vocabs = [], [], [], [], []
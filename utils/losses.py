@@ -0,0 +1,89 @@
+import tensorflow as tf
+
+
+def in_vocab_targets(targets, vocab_size):
+    """
+    replace extended target ids out of vocab by 0, their vocab probability must be dropped by caller
+    :param targets: [...] extended target ids
+    :param vocab_size: vocab size
+    :return: [...] target ids in vocab
+    """
+    return tf.where(tf.less(targets, vocab_size), targets, tf.zeros_like(targets))
+
+
+def vocab_log_probs(logits, targets):
+    """
+    log softmax at targets, fused with its gradient, computed in float32 for float16 models
+    :param logits: [..., vocab_size]
+    :param targets: [...] extended target ids
+    :return: [...] float32 log probabilities
+    """
+    logits = tf.cast(logits, tf.float32)
+    targets = in_vocab_targets(targets, tf.shape(logits)[-1])
+    return -tf.nn.sparse_softmax_cross_entropy_with_logits(labels=targets, logits=logits)
+
+
+def sampled_vocab_log_probs(weights, biases, inputs, targets, num_sampled, vocab_size):
+    """
+    log softmax at targets estimated over targets and num_sampled log-uniform sampled ids,
+    vocab ids are sorted by frequency so log-uniform sampling is close to unigram, for training only
+    :param weights: [vocab_size, hidden_units] output projection
+    :param biases: [vocab_size] output projection biases
+    :param inputs: [..., hidden_units] decoder outputs
+    :param targets: [...] extended target ids
+    :param num_sampled: number of sampled ids per batch
+    :param vocab_size: vocab size
+    :return: [...] float32 log probabilities
+    """
+    weights, biases, inputs = [tf.cast(tensor, tf.float32) for tensor in (weights, biases, inputs)]
+    shape = tf.shape(targets)
+    # labels: [n, 1]
+    labels = tf.reshape(tf.cast(in_vocab_targets(targets, vocab_size), tf.int64), [-1, 1])
+    # inputs: [n, hidden_units]
+    inputs = tf.reshape(inputs, [-1, inputs.shape[-1].value])
+    losses = tf.nn.sampled_softmax_loss(weights=weights, biases=biases, labels=labels, inputs=inputs,
+                                        num_sampled=num_sampled, num_classes=vocab_size)
+    return -tf.reshape(losses, shape)
+
+
+def pointer_log_probs(targets, vocab_log_probs, p_gen_logits, attention_distribution, encoder_inputs_extend,
+                      vocab_size):
+    """
+    log probability of extended target ids under pointer generator final distribution,
+    log(p_gen * p_vocab(target) + (1 - p_gen) * sum of attention on source positions of target),
+    got from target columns only without building [batch_size, vocab_size + oovs_max_size] distribution
+    :param targets: [...] extended target ids
+    :param vocab_log_probs: [...] log probabilities of targets in vocab distribution, full or sampled
+    :param p_gen_logits: [..., 1] logits of p_gen
+    :param attention_distribution: [..., encoder_time_steps]
+    :param encoder_inputs_extend: extended source ids, broadcast to attention_distribution
+    :param vocab_size: vocab size, oov targets can only be copied
+    :return: [...] float32 log probabilities
+    """
+    dtype = tf.float32
+    vocab_log_probs = tf.cast(vocab_log_probs, dtype)
+    p_gen_logits = tf.cast(p_gen_logits, dtype)
+    attention_distribution = tf.cast(attention_distribution, dtype)
+    # copy_probs: [...], attention on source positions equal to target
+    copy_probs = tf.reduce_sum(attention_distribution * tf.cast(
+        tf.equal(encoder_inputs_extend, tf.expand_dims(targets, axis=-1)), dtype), axis=-1)
+    has_copy = tf.greater(copy_probs, 0)
+    # log of zero probability, kept finite so gradients of not taken branches are zero
+    log_zero = tf.fill(tf.shape(targets), tf.constant(dtype.min, dtype=dtype))
+    copy_log_probs = tf.where(has_copy, tf.log(tf.where(has_copy, copy_probs, tf.ones_like(copy_probs))), log_zero)
+    # p_gen_logits: [...], log(p_gen) and log(1 - p_gen) by log sigmoid
+    p_gen_logits = tf.squeeze(p_gen_logits, axis=-1)
+    generate = tf.where(tf.less(targets, vocab_size), tf.log_sigmoid(p_gen_logits) + vocab_log_probs, log_zero)
+    copy = tf.log_sigmoid(-p_gen_logits) + copy_log_probs
+    return tf.reduce_logsumexp(tf.stack([generate, copy], axis=-1), axis=-1)
+
+
+def sequence_mean(losses, masks):
+    """
+    average of losses over real steps of each sequence, then over batch
+    :param losses: [batch_size, time_steps]
+    :param masks: [batch_size, time_steps]
+    :return: []
+    """
+    masks = tf.cast(masks, losses.dtype)
+    return tf.reduce_mean(tf.reduce_sum(losses * masks, axis=1) / tf.reduce_sum(masks, axis=1))
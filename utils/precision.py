@@ -0,0 +1,27 @@
+import tensorflow as tf
+
+
+def float32_variable_getter(getter, *args, **kwargs):
+    """
+    custom getter of variable scope, trainable float16 variables are stored in float32 and cast on read,
+    so optimizer updates and slots stay in float32 while model computes in float16
+    :param getter: default getter
+    :return: variable, or its float16 cast
+    """
+    if kwargs.get('dtype') == tf.float16 and kwargs.get('trainable') is not False:
+        kwargs['dtype'] = tf.float32
+        return tf.cast(getter(*args, **kwargs), tf.float16)
+    return getter(*args, **kwargs)
+
+
+def loss_scale_optimizer(optimizer):
+    """
+    wrap optimizer with dynamic loss scaling for float16 models, loss is scaled up before backprop so small
+    gradients do not flush to zero, steps with inf or nan gradients are skipped and scale is halved
+    :param optimizer: optimizer
+    :return: LossScaleOptimizer
+    """
+    manager = tf.contrib.mixed_precision.ExponentialUpdateLossScaleManager(init_loss_scale=2 ** 15,
+                                                                           incr_every_n_steps=2000,
+                                                                           decr_every_n_nan_or_inf=1)
+    return tf.contrib.mixed_precision.LossScaleOptimizer(optimizer, manager)
@@ -0,0 +1,104 @@
+import time
+import queue
+import threading
+
+# end of data flag put into queue by producer
+END_OF_DATA = object()
+
+
+class BatchPrefetcher():
+    """Prepare batches in background thread while training step is running."""
+    
+    def __init__(self, batches, prepare, queue_size=8):
+        """
+        init prefetcher
+        :param batches: iterable of raw batches, eg: BiTextIterator.next()
+        :param prepare: function transfer raw batch to padded numpy batch
+        :param queue_size: max batches prepared ahead, 0 to prepare in main thread
+        """
+        self.batches = batches
+        self.prepare = prepare
+        self.queue_size = queue_size
+        # seconds main thread waited on data
+        self.wait_time = 0.0
+        self.queue = None
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def put(self, item):
+        """
+        put item into queue until stopped
+        :param item: prepared batch
+        :return: False if stopped
+        """
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce(self):
+        """
+        producer, run in background thread
+        :return: None
+        """
+        try:
+            for batch in self.batches:
+                if not self.put(self.prepare(batch)):
+                    return
+        except Exception as e:
+            # re-raise in main thread
+            self.put(e)
+            return
+        self.put(END_OF_DATA)
+    
+    def close(self):
+        """
+        stop producer
+        :return: None
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+    
+    def pop_wait_time(self):
+        """
+        get and clear wait time
+        :return: seconds
+        """
+        wait_time, self.wait_time = self.wait_time, 0.0
+        return wait_time
+    
+    def __iter__(self):
+        if self.queue_size <= 0:
+            # synchronous mode, preparing counts as waiting
+            batches = iter(self.batches)
+            while True:
+                start_time = time.time()
+                try:
+                    item = self.prepare(next(batches))
+                except StopIteration:
+                    return
+                finally:
+                    self.wait_time += time.time() - start_time
+                yield item
+        
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+        try:
+            while True:
+                start_time = time.time()
+                item = self.queue.get()
+                self.wait_time += time.time() - start_time
+                if item is END_OF_DATA:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
@@ -0,0 +1,190 @@
+import math
+import numpy as np
+from utils.iterator import bucket_batches
+from preprocess.reader import read_parallel
+
+# percentiles shown in report
+PERCENTILES = [50, 90, 95, 98, 99, 100]
+
+
+def percentile(sorted_values, q):
+    """
+    get nearest rank percentile, always a value present in data
+    :param sorted_values: sorted array
+    :param q: percentile in [0, 100]
+    :return: value
+    """
+    if not len(sorted_values):
+        return 0
+    rank = max(int(math.ceil(q / 100.0 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+def round_up(value, base=5):
+    return int(math.ceil(value / float(base)) * base)
+
+
+def collect_stats(source, target, source_dict, target_dict, source_vocab_sizes, target_vocab_sizes, split_sign=' '):
+    """
+    read pairs once, collect lengths and oov counts of each candidate vocab size
+    :param source: source file, plain, compressed or sharded
+    :param target: target file aligned with source
+    :param source_dict: source Vocabulary, full size
+    :param target_dict: target Vocabulary, full size
+    :param source_vocab_sizes: candidate encoder vocab sizes
+    :param target_vocab_sizes: candidate decoder vocab sizes
+    :param split_sign: separator of words
+    :return: dict of arrays
+    """
+    source_sizes = np.asarray(source_vocab_sizes, dtype=np.int64)
+    target_sizes = np.asarray(target_vocab_sizes, dtype=np.int64)
+    # words missing in vocab get rank beyond every size
+    missing = np.iinfo(np.int64).max
+    source_lengths, target_lengths, article_oovs = [], [], []
+    source_oov_tokens = np.zeros([len(source_sizes)], dtype=np.int64)
+    target_oov_tokens = np.zeros([len(target_sizes)], dtype=np.int64)
+    # target oov tokens found in article, pointer can copy them
+    target_oov_copyable = np.zeros([len(target_sizes)], dtype=np.int64)
+    source_get, target_get = source_dict.word2id.get, target_dict.word2id.get
+    # pairs are stripped, files of different lines raise ValueError
+    for source_line, target_line in read_parallel(source, target):
+        source_words = source_line.split(split_sign)
+        target_words = target_line.split(split_sign)
+        source_lengths.append(len(source_words))
+        target_lengths.append(len(target_words))
+        
+        # ranks: [words], id of word in vocab, oov for sizes <= id
+        ranks = np.array([source_get(w, missing) for w in source_words], dtype=np.int64)
+        source_oov_tokens += (ranks[:, None] >= source_sizes).sum(axis=0)
+        # article oovs are distinct words, as extend_source counts them
+        unique_words = {}
+        for w, rank in zip(source_words, ranks):
+            unique_words[w] = rank
+        unique_ranks = np.fromiter(unique_words.values(), dtype=np.int64, count=len(unique_words))
+        article_oovs.append((unique_ranks[:, None] >= source_sizes).sum(axis=0))
+        
+        ranks = np.array([target_get(w, missing) for w in target_words], dtype=np.int64)
+        oov = ranks[:, None] >= target_sizes
+        target_oov_tokens += oov.sum(axis=0)
+        in_source = np.array([w in unique_words for w in target_words], dtype=bool)
+        target_oov_copyable += (oov & in_source[:, None]).sum(axis=0)
+    return {
+        'source_lengths': np.array(source_lengths, dtype=np.int64),
+        'target_lengths': np.array(target_lengths, dtype=np.int64),
+        # article_oovs: [pairs, source sizes]
+        'article_oovs': np.array(article_oovs, dtype=np.int64).reshape([-1, len(source_sizes)]),
+        'source_oov_tokens': source_oov_tokens,
+        'target_oov_tokens': target_oov_tokens,
+        'target_oov_copyable': target_oov_copyable,
+    }
+
+
+def length_summary(lengths):
+    """
+    summarize lengths
+    :param lengths: array of lengths
+    :return: dict of mean and percentiles
+    """
+    sorted_lengths = np.sort(lengths)
+    summary = {'mean': float(np.mean(lengths)) if len(lengths) else 0.0}
+    for q in PERCENTILES:
+        summary['p%d' % q] = int(percentile(sorted_lengths, q))
+    return summary
+
+
+def candidate_lengths(lengths, quantiles=(90, 95, 98, 99, 100), base=5):
+    """
+    suggest candidate max lengths from length percentiles
+    :param lengths: array of lengths
+    :param quantiles: percentiles used
+    :param base: lengths are rounded up to multiple of base
+    :return: sorted list of lengths
+    """
+    sorted_lengths = np.sort(lengths)
+    return sorted(set(round_up(percentile(sorted_lengths, q), base) for q in quantiles))
+
+
+def truncation(lengths, max_length):
+    """
+    measure truncation and padding of fully unrolled steps
+    :param lengths: array of lengths
+    :param max_length: max time steps
+    :return: dict of truncated sentence rate, lost token rate, padded step rate
+    """
+    kept = np.minimum(lengths, max_length)
+    total = max(int(np.sum(lengths)), 1)
+    return {
+        'max_length': int(max_length),
+        'truncated': float(np.mean(lengths > max_length)) if len(lengths) else 0.0,
+        'lost_tokens': float(np.sum(lengths - kept)) / total,
+        'padding': 1.0 - float(np.sum(kept)) / max(len(lengths) * max_length, 1),
+    }
+
+
+def suggest_buckets(lengths, num_buckets, max_length):
+    """
+    suggest bucket boundaries holding about same number of pairs
+    :param lengths: array of source lengths
+    :param num_buckets: number of buckets
+    :param max_length: source length after truncation
+    :return: list of boundaries, eg: [20, 40, 60]
+    """
+    sorted_lengths = np.sort(np.minimum(lengths, max_length))
+    boundaries = set()
+    for i in range(1, num_buckets):
+        # np.digitize puts length == boundary into next bucket, so boundary is one past quantile
+        boundary = int(percentile(sorted_lengths, 100.0 * i / num_buckets)) + 1
+        if boundary <= max_length:
+            boundaries.add(boundary)
+    return sorted(boundaries)
+
+
+def padding_waste(source_lengths, target_lengths, source_max_length, target_max_length, batch_size,
+                  bucket_boundaries=None):
+    """
+    estimate padded token rate of batches padded to longest pair in batch
+    :param source_lengths: array of source lengths
+    :param target_lengths: array of target lengths
+    :param source_max_length: source length after truncation
+    :param target_max_length: target length after truncation
+    :param batch_size: number of pairs per batch
+    :param bucket_boundaries: source length boundaries, None for random batches
+    :return: rate of padded tokens in source + target
+    """
+    source_lengths = np.minimum(source_lengths, source_max_length)
+    target_lengths = np.minimum(target_lengths, target_max_length)
+    if bucket_boundaries:
+        batches = bucket_batches(source_lengths, target_lengths, bucket_boundaries, batch_size)
+    else:
+        indices = np.random.permutation(len(source_lengths))
+        batches = [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+    padded = 0
+    for batch in batches:
+        padded += len(batch) * (int(np.max(source_lengths[batch])) + int(np.max(target_lengths[batch])))
+    return 1.0 - float(np.sum(source_lengths) + np.sum(target_lengths)) / max(padded, 1)
+
+
+def batch_oovs_max_size(article_oovs, batch_size):
+    """
+    estimate oovs_max_size of batches, the max article oov count in each batch
+    :param article_oovs: array of article oov counts
+    :param batch_size: number of pairs per batch
+    :return: mean and max over random batches
+    """
+    if not len(article_oovs):
+        return 0.0, 0
+    shuffled = np.random.permutation(article_oovs)
+    maxes = [int(np.max(shuffled[i:i + batch_size])) for i in range(0, len(shuffled), batch_size)]
+    return float(np.mean(maxes)), int(np.max(maxes))
+
+
+def softmax_cost(target_max_length, hidden_units, vocab_size, oovs_size=0):
+    """
+    estimate multiply-adds of output projection per pair, extended vocab only adds scatter of copy probabilities
+    :param target_max_length: decoder time steps
+    :param hidden_units: size of decoder output
+    :param vocab_size: decoder vocab size
+    :param oovs_size: size of article oovs extension
+    :return: multiply-adds
+    """
+    return target_max_length * (hidden_units * vocab_size + vocab_size + oovs_size)
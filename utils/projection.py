@@ -0,0 +1,60 @@
+import tensorflow as tf
+
+
+class TiedOutputProjection(tf.layers.Layer):
+    """Vocab logits tied to embeddings, adapter maps hidden_units to embedding_size before embeddings^T."""
+    
+    def __init__(self, embeddings, **kwargs):
+        """
+        init layer
+        :param embeddings: [vocab_size, embedding_size] embeddings to tie
+        """
+        super(TiedOutputProjection, self).__init__(**kwargs)
+        self.embeddings = embeddings
+        self.adapter = tf.layers.Dense(units=embeddings.shape[1].value, use_bias=False, name='adapter')
+    
+    def build(self, input_shape):
+        """
+        create bias
+        :param input_shape: [..., hidden_units]
+        :return: None
+        """
+        # bias: [vocab_size]
+        self.bias = self.add_weight(name='bias', shape=[self.embeddings.shape[0].value],
+                                    initializer=tf.zeros_initializer(), dtype=self.dtype)
+        super(TiedOutputProjection, self).build(input_shape)
+    
+    def call(self, inputs):
+        """
+        project decoder outputs to vocab logits
+        :param inputs: [..., hidden_units]
+        :return: [..., vocab_size]
+        """
+        # adapted: [..., embedding_size]
+        adapted = self.adapter(inputs)
+        return tf.tensordot(adapted, tf.transpose(self.embeddings), axes=1) + self.bias
+
+
+def output_projection(vocab_size, name, embeddings=None):
+    """
+    build layer projecting decoder outputs to vocab logits, variables are created on first call
+    :param vocab_size: vocab size
+    :param name: layer name
+    :param embeddings: [vocab_size, embedding_size] embeddings to tie projection to, None for own kernel
+    :return: Dense or TiedOutputProjection
+    """
+    if embeddings is None:
+        return tf.layers.Dense(units=vocab_size, name=name)
+    return TiedOutputProjection(embeddings, name=name)
+
+
+def sampled_projection(projection, inputs):
+    """
+    weights and inputs of projection for sampled softmax, logits = inputs * weights^T + biases
+    :param projection: layer built by output_projection, already called
+    :param inputs: [..., hidden_units] decoder outputs
+    :return: weights [vocab_size, dim], biases [vocab_size], inputs [..., dim]
+    """
+    if isinstance(projection, TiedOutputProjection):
+        return projection.embeddings, projection.bias, projection.adapter(inputs)
+    return tf.transpose(projection.kernel), projection.bias, inputs
@@ -0,0 +1,271 @@
+import os
+import bz2
+import gzip
+import json
+import lzma
+from itertools import islice
+
+# compression name to file suffix and open function
+COMPRESSORS = {
+    'gzip': ('.gz', gzip.open),
+    'bz2': ('.bz2', bz2.open),
+    'xz': ('.xz', lzma.open),
+}
+MANIFEST_SUFFIX = '.manifest.json'
+# bytes buffered by file, lines joined before each write
+BUFFER_SIZE = 1 << 20
+BUFFER_LINES = 1024
+
+
+def compression(path):
+    """
+    get compression of file by suffix
+    :param path: file path
+    :return: compression name, None for plain text
+    """
+    for name, (suffix, _) in COMPRESSORS.items():
+        if path.endswith(suffix):
+            return name
+    return None
+
+
+def open_text(path, mode='r', encoding='utf-8', buffer_size=BUFFER_SIZE):
+    """
+    open plain or compressed text file
+    :param path: file path, compression by suffix
+    :param mode: 'r' or 'w'
+    :param encoding: encoding of text
+    :param buffer_size: buffer size of plain file
+    :return: file object
+    """
+    name = compression(path)
+    if name is None:
+        return open(path, mode, encoding=encoding, buffering=buffer_size)
+    return COMPRESSORS[name][1](path, mode + 't', encoding=encoding)
+
+
+def shard_path(path, shard, compress=None):
+    """
+    get path of shard, eg: sources.train.txt -> sources.train-00001.txt.gz
+    :param path: path of whole file
+    :param shard: shard index
+    :param compress: compression name, None for plain text
+    :return: shard path
+    """
+    root, ext = os.path.splitext(path)
+    suffix = COMPRESSORS[compress][0] if compress else ''
+    return '%s-%05d%s%s' % (root, shard, ext, suffix)
+
+
+def manifest_path(path):
+    return path + MANIFEST_SUFFIX
+
+
+def load_manifest(path):
+    """
+    load manifest of sharded file
+    :param path: path of whole file
+    :return: manifest dict, None if file is not sharded
+    """
+    if not os.path.exists(manifest_path(path)):
+        return None
+    with open(manifest_path(path), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def data_files(path):
+    """
+    get files holding data of path in order
+    :param path: path of whole file, or of its manifest
+    :return: list of file paths
+    """
+    if path.endswith(MANIFEST_SUFFIX):
+        path = path[:-len(MANIFEST_SUFFIX)]
+    manifest = load_manifest(path)
+    if manifest is None:
+        return [path]
+    folder = os.path.dirname(path)
+    return [os.path.join(folder, shard) for shard in manifest['shards']]
+
+
+def count_data_lines(path, encoding='utf-8'):
+    """
+    count lines of plain, compressed or sharded file, sharded file is counted by manifest
+    :param path: path of whole file
+    :param encoding: encoding of text
+    :return: number of lines
+    """
+    manifest = load_manifest(path)
+    if manifest is not None:
+        return sum(manifest['lines'])
+    with open_text(path, 'r', encoding) as f:
+        return sum(1 for _ in f)
+
+
+class TextFile():
+    """Lines of compressed or sharded file, read as one file."""
+    
+    def __init__(self, path, encoding='utf-8'):
+        """
+        open file
+        :param path: path of whole file
+        :param encoding: encoding of text
+        """
+        self.name = path
+        self.paths = data_files(path)
+        self.encoding = encoding
+        self.file = None
+        self.lines = self.read()
+    
+    def read(self):
+        """
+        read lines of files one by one
+        :return: generator of line
+        """
+        for path in self.paths:
+            self.file = open_text(path, 'r', self.encoding)
+            with self.file:
+                for line in self.file:
+                    yield line
+        self.file = None
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        return next(self.lines)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def seek(self, offset):
+        """
+        restart from first line
+        :param offset: only 0 is supported
+        :return: None
+        """
+        assert offset == 0, 'Only seek to start is supported'
+        self.close()
+        self.lines = self.read()
+    
+    def close(self):
+        self.lines.close()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def open_data(path, encoding='utf-8'):
+    """
+    open data file for reading lines
+    :param path: plain, compressed or sharded file
+    :param encoding: encoding of text
+    :return: file object or TextFile
+    """
+    if compression(path) is None and not os.path.exists(manifest_path(path)):
+        return open(path, 'r', encoding=encoding)
+    return TextFile(path, encoding)
+
+
+class ShardedWriter():
+    """Write lines to file with large buffer, optionally roll them into compressed shards with manifest."""
+    
+    def __init__(self, path, shard_lines=0, compress=None, encoding='utf-8', buffer_size=BUFFER_SIZE):
+        """
+        init writer
+        :param path: path of whole file, shards and manifest are written next to it
+        :param shard_lines: max lines of each shard, 0 to write one file
+        :param compress: compression name of COMPRESSORS, None for plain text
+        :param encoding: encoding of text
+        :param buffer_size: buffer size of plain file
+        """
+        assert compress is None or compress in COMPRESSORS, 'Unknown compression %s' % compress
+        self.path = path
+        self.shard_lines = shard_lines
+        self.compress = compress
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        # shards: file names of written shards, lines: lines of each shard
+        self.shards = []
+        self.lines = []
+        self.buffer = []
+        self.file = None
+        self.count = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def open_next(self):
+        """
+        close current file and open next shard
+        :return: None
+        """
+        if self.file is not None:
+            self.file.close()
+        if self.shard_lines:
+            path = shard_path(self.path, len(self.shards), self.compress)
+        else:
+            path = self.path + (COMPRESSORS[self.compress][0] if self.compress else '')
+        self.file = open_text(path, 'w', self.encoding, self.buffer_size)
+        self.shards.append(os.path.basename(path))
+        self.lines.append(0)
+    
+    def flush(self):
+        """
+        write buffered lines, one call per shard
+        :return: None
+        """
+        while self.buffer:
+            if self.file is None or self.shard_lines and self.lines[-1] >= self.shard_lines:
+                self.open_next()
+            room = self.shard_lines - self.lines[-1] if self.shard_lines else len(self.buffer)
+            lines, self.buffer = self.buffer[:room], self.buffer[room:]
+            self.file.write('\n'.join(lines) + '\n')
+            self.lines[-1] += len(lines)
+            self.count += len(lines)
+    
+    def write(self, line):
+        """
+        write one line
+        :param line: text without newline
+        :return: None
+        """
+        self.buffer.append(line)
+        if len(self.buffer) >= BUFFER_LINES:
+            self.flush()
+    
+    def write_lines(self, lines):
+        """
+        write lines batch by batch
+        :param lines: iterable of text without newline, consumed lazily
+        :return: None
+        """
+        lines = iter(lines)
+        while True:
+            self.buffer.extend(islice(lines, BUFFER_LINES))
+            if len(self.buffer) < BUFFER_LINES:
+                return
+            self.flush()
+    
+    def close(self):
+        """
+        flush and close file, write manifest of shards
+        :return: number of lines written
+        """
+        if self.file is None and not self.shards:
+            self.open_next()
+        self.flush()
+        self.file.close()
+        if self.shard_lines or self.compress:
+            with open(manifest_path(self.path), 'w', encoding='utf-8') as f:
+                json.dump({'shards': self.shards, 'lines': self.lines, 'compress': self.compress}, f, indent=2)
+        elif os.path.exists(manifest_path(self.path)):
+            # manifest of earlier sharded output would shadow plain file
+            os.remove(manifest_path(self.path))
+        return self.count
@@ -0,0 +1,134 @@
+import json
+import pickle
+import numpy as np
+from utils.config import UNK_WORD
+
+
+def load_dict(filename):
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except:
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+
+class Vocabulary():
+    """Vocabulary with id to word in one contiguous buffer and word to id in a hash map."""
+    
+    def __init__(self, offsets, present, data, word2id, size=None):
+        """
+        init vocabulary, use Vocabulary.load or Vocabulary.from_dict instead
+        :param offsets: [full_size + 1], word i is data[offsets[i]:offsets[i + 1] - 1], followed by newline
+        :param present: [full_size], 0 for ids missing in vocab
+        :param data: utf-8 bytes of words
+        :param word2id: word to id dict
+        :param size: visible size, ids >= size are treated as unk
+        """
+        self.offsets = offsets
+        self.present = present
+        self.data = data
+        self.word2id = word2id
+        self.full_size = len(offsets) - 1
+        self.size = self.full_size if size is None else min(size, self.full_size)
+    
+    @classmethod
+    def from_dict(cls, word2id):
+        """
+        build vocabulary from word to id dict
+        :param word2id: word to id dict
+        :return: Vocabulary
+        """
+        full_size = max(word2id.values()) + 1 if word2id else 0
+        # words never contain newline, use it as terminator
+        words = [b'\n'] * full_size
+        present = np.zeros([full_size], dtype=np.uint8)
+        for word, idx in word2id.items():
+            words[idx] = word.encode('utf-8') + b'\n'
+            present[idx] = 1
+        offsets = np.zeros([full_size + 1], dtype=np.int64)
+        np.cumsum([len(word) for word in words], out=offsets[1:])
+        data = np.frombuffer(b''.join(words), dtype=np.uint8)
+        return cls(offsets, present, data, dict(word2id))
+    
+    @classmethod
+    def load(cls, filename, n_words=-1):
+        """
+        load vocabulary
+        :param filename: vocab json or pickle file
+        :param n_words: visible size, -1 for all
+        :return: Vocabulary
+        """
+        return cls.from_dict(load_dict(filename)).truncate(n_words)
+    
+    def truncate(self, n_words):
+        """
+        view of vocabulary keeping ids less than n_words
+        :param n_words: visible size, -1 for all
+        :return: Vocabulary sharing buffers
+        """
+        if n_words is None or n_words < 0 or n_words >= self.full_size:
+            if self.size == self.full_size:
+                return self
+            n_words = self.full_size
+        return Vocabulary(self.offsets, self.present, self.data, self.word2id, n_words)
+    
+    def __len__(self):
+        return int(np.count_nonzero(self.present[:self.size]))
+    
+    def __contains__(self, word):
+        return self.get(word) is not None
+    
+    def __getitem__(self, word):
+        idx = self.get(word)
+        if idx is None:
+            raise KeyError(word)
+        return idx
+    
+    def get(self, word, default=None):
+        """
+        get id of word
+        :param word: word
+        :param default: returned if word is not in visible vocab
+        :return: id
+        """
+        idx = self.word2id.get(word)
+        if idx is None or idx >= self.size:
+            return default
+        return idx
+    
+    def ids(self, words, default=None):
+        """
+        get ids of words
+        :param words: list of words
+        :param default: id of words not in visible vocab
+        :return: list of ids
+        """
+        get = self.word2id.get
+        if self.size == self.full_size:
+            return [get(w, default) for w in words]
+        size = self.size
+        return [idx if idx is not None and idx < size else default for idx in map(get, words)]
+    
+    def word(self, idx, default=UNK_WORD):
+        """
+        get word of id
+        :param idx: id
+        :param default: returned if id is not in visible vocab
+        :return: word
+        """
+        if 0 <= idx < self.size and self.present[idx]:
+            return bytes(self.data[self.offsets[idx]:self.offsets[idx + 1] - 1]).decode('utf-8')
+        return default
+
+
+def load_vocab(vocab, n_words=-1):
+    """
+    load vocabulary from path, or share loaded one
+    :param vocab: vocab file path or Vocabulary
+    :param n_words: visible size, -1 for all
+    :return: Vocabulary
+    """
+    if isinstance(vocab, Vocabulary):
+        return vocab.truncate(n_words)
+    return Vocabulary.load(vocab, n_words)